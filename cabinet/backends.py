@@ -0,0 +1,353 @@
+# This file provides the storage backends that cabinet_api uses to read and write cabinet files
+# All the backends work on full cabinet urls (as built by cabinet_api) and behave the same way - the http backend goes
+# through the cabinet nginx server, while the filesystem backend works directly on the cabinet directory when the
+# cabinet lives on the same machine
+import errno
+import os
+import random
+import threading
+import time
+import uuid
+from urlparse import urlparse
+
+from datadog import statsd
+from django.utils.http import parse_http_date_safe
+from requests import RequestException
+
+from cabinet.cabinet_client import get_session
+from cabinet.circuit_breaker import CircuitBreaker
+from cabinet.exceptions import CabinetConnectionError, Cabinet404Error, CabinetSubmissionExistsError, \
+    CabinetSubmissionMissingError
+from core.utils.constants import HttpMethod
+from openshiksha import settings
+
+
+class CabinetBackendType(object):
+    HTTP = 'http'
+    FILESYSTEM = 'filesystem'
+
+
+class CabinetWriteMode(object):
+    OVERWRITE = 'overwrite'  # create or replace
+    CREATE = 'create'  # only create - fails if the file already exists
+    UPDATE = 'update'  # only replace - fails if the file does not exist
+
+
+def raise_exists_error(url):
+    raise CabinetSubmissionExistsError("file exists for resource at: %s" % url)
+
+
+def raise_missing_error(url):
+    raise CabinetSubmissionMissingError("file missing for resource at: %s" % url)
+
+
+class CabinetFileStream(object):
+    """
+    Iterable over the chunks of a cabinet file, along with the last modified time (epoch seconds, None if unknown)
+    """
+
+    def __init__(self, chunks, last_modified, release=None):
+        self.chunks = chunks
+        self.last_modified = last_modified
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        # the chunks only release the file once they are read to the end - a stream that is never read is closed here
+        if self.release is not None:
+            self.release()
+
+
+class CabinetBackendBase(object):
+    def read(self, url):
+        """
+        Returns the contents of the cabinet file at the given url
+        @throws: Cabinet404Error if the file does not exist, CabinetConnectionError if the cabinet could not be reached
+        """
+        raise NotImplementedError("subclass of CabinetBackendBase must implement method read")
+
+    def stream(self, url, chunk_size):
+        """
+        Returns a CabinetFileStream over the contents of the cabinet file at the given url in chunks of (at most)
+        chunk_size bytes. The existence of the file is checked before returning
+        @throws: Cabinet404Error if the file does not exist, CabinetConnectionError if the cabinet could not be reached
+        """
+        raise NotImplementedError("subclass of CabinetBackendBase must implement method stream")
+
+    def exists(self, url):
+        """
+        Checks whether the cabinet file at the given url exists, without reading its contents
+        @throws: CabinetConnectionError if the cabinet could not be reached
+        """
+        raise NotImplementedError("subclass of CabinetBackendBase must implement method exists")
+
+    def write(self, url, data, headers=None, mode=CabinetWriteMode.OVERWRITE):
+        """
+        Writes the given data to the cabinet file at the given url. Whether the existence check for the CREATE and
+        UPDATE modes is part of the write itself (with no window for another writer between the check and the write)
+        depends on the backend
+        @throws: CabinetSubmissionExistsError for CREATE if the file exists, CabinetSubmissionMissingError for UPDATE if
+        the file does not exist
+        """
+        raise NotImplementedError("subclass of CabinetBackendBase must implement method write")
+
+    def delete(self, url):
+        raise NotImplementedError("subclass of CabinetBackendBase must implement method delete")
+
+
+class HttpCabinetBackend(CabinetBackendBase):
+    """
+    All the requests have connect and read timeouts and go through the circuit breaker, which fails them straight away
+    while the cabinet server is unhealthy. GETs and HEADs (being idempotent) are also retried after a random backoff
+    """
+    RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+    def __init__(self):
+        self.conditional_writes = settings.CABINET_CONDITIONAL_WRITES
+        self.breaker = CircuitBreaker('cabinet', settings.CABINET_BREAKER_FAILURE_THRESHOLD,
+                                      settings.CABINET_BREAKER_RESET_TIMEOUT)
+        self.timeout = (settings.CABINET_CONNECT_TIMEOUT, settings.CABINET_READ_TIMEOUT)
+        self.backoff_random = random.Random()  # never the global random - it is seeded for dealing assignments
+
+    def get_backoff(self, attempt):
+        # full jitter - spreads out the retries of all the workers that saw the same failure
+        return self.backoff_random.uniform(0, min(settings.CABINET_RETRY_BACKOFF_MAX,
+                                                  settings.CABINET_RETRY_BACKOFF_BASE * (2 ** attempt)))
+
+    def send(self, method, url, **kwargs):
+        session = get_session()
+        if method == HttpMethod.MOVE:
+            return session.request(method, url, timeout=self.timeout, **kwargs)  # requests has no webdav shortcuts
+        return getattr(session, method.lower())(url, timeout=self.timeout, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """
+        Throws CabinetConnectionError if no response (other than a server error) was received
+        """
+        retries = settings.CABINET_GET_RETRIES if method in [HttpMethod.GET, HttpMethod.HEAD] else 0
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CabinetConnectionError(url, method)
+
+            try:
+                response = self.send(method, url, **kwargs)
+            except RequestException:
+                response = None
+            except:
+                # anything else (a bug, an interrupted worker) still counts as a failure - the breaker must hear back
+                # about every call it allows, or a trial call would leave it half open (rejecting all calls) for good
+                self.breaker.record_failure()
+                raise
+
+            if (response is not None) and (response.status_code not in HttpCabinetBackend.RETRY_STATUS_CODES):
+                self.breaker.record_success()
+                return response
+
+            self.breaker.record_failure()
+            if response is not None:
+                response.close()
+            if attempt >= retries:
+                raise CabinetConnectionError(url, method)
+
+            attempt += 1
+            statsd.increment('cabinet.request.retry', tags=['method:%s' % method])
+            time.sleep(self.get_backoff(attempt))
+
+    def read(self, url):
+        response = self.request(HttpMethod.GET, url)
+        if response.status_code == 404:
+            raise Cabinet404Error(url)
+        return response.content
+
+    def stream(self, url, chunk_size):
+        response = self.request(HttpMethod.GET, url, stream=True)
+        if response.status_code == 404:
+            response.close()
+            raise Cabinet404Error(url)
+        return CabinetFileStream(self.iter_response(response, chunk_size),
+                                 parse_http_date_safe(response.headers.get('Last-Modified')), response.close)
+
+    def iter_response(self, response, chunk_size):
+        # the connection only goes back to the pool once the response is closed
+        try:
+            for chunk in response.iter_content(chunk_size):
+                yield chunk
+        finally:
+            response.close()
+
+    def exists(self, url):
+        response = self.request(HttpMethod.HEAD, url)
+        if response.status_code == 404:
+            return False
+        if response.status_code >= 400:
+            raise CabinetConnectionError(url, HttpMethod.HEAD)
+        return True
+
+    def write(self, url, data, headers=None, mode=CabinetWriteMode.OVERWRITE):
+        """
+        With CABINET_CONDITIONAL_WRITES (a cabinet server that enforces the preconditions of PUTs), CREATE and UPDATE are
+        sent as conditional PUTs (If-None-Match: * and If-Match: *), refused with 412 if the condition fails.
+        Otherwise CREATE puts the data to a temporary file next to the file and moves it into place with Overwrite: F
+        (refused with 412 if the file exists), so an existing file is never replaced, and UPDATE checks the existence of
+        the file with a HEAD before the PUT (see devops/cabinet-nginx.conf)
+        """
+        headers = dict(headers) if headers is not None else {}
+        if self.conditional_writes:
+            if mode == CabinetWriteMode.CREATE:
+                headers['If-None-Match'] = '*'
+            elif mode == CabinetWriteMode.UPDATE:
+                headers['If-Match'] = '*'
+        elif mode == CabinetWriteMode.CREATE:
+            self.create(url, data, headers)
+            return
+        elif mode == CabinetWriteMode.UPDATE:
+            if not self.exists(url):
+                raise_missing_error(url)
+
+        response = self.request(HttpMethod.PUT, url, data=data, headers=headers)
+
+        if response.status_code == 412:
+            if mode == CabinetWriteMode.CREATE:
+                raise_exists_error(url)
+            raise_missing_error(url)
+        if response.status_code >= 400:
+            raise CabinetConnectionError(url, HttpMethod.PUT)
+
+        if (mode == CabinetWriteMode.UPDATE) and (response.status_code == 201):
+            # the file was removed between the check and the write - it is left as written, as it may just as well have
+            # been created again by another writer meanwhile
+            statsd.increment('cabinet.put.write_race', tags=['mode:%s' % mode])
+            raise_missing_error(url)
+
+    def create(self, url, data, headers):
+        tmp_url = '%s.%s.tmp' % (url, uuid.uuid4().hex)
+        response = self.request(HttpMethod.PUT, tmp_url, data=data, headers=headers)
+        if response.status_code >= 400:
+            raise CabinetConnectionError(tmp_url, HttpMethod.PUT)
+
+        try:
+            response = self.request(HttpMethod.MOVE, tmp_url,
+                                    headers={'Destination': urlparse(url).path, 'Overwrite': 'F'})
+        except CabinetConnectionError:
+            self.delete_tmp(tmp_url)
+            raise
+
+        if response.status_code == 412:
+            self.delete_tmp(tmp_url)
+            raise_exists_error(url)
+        if response.status_code >= 400:
+            self.delete_tmp(tmp_url)
+            raise CabinetConnectionError(url, HttpMethod.MOVE)
+
+    def delete_tmp(self, tmp_url):
+        try:
+            self.delete(tmp_url)
+        except CabinetConnectionError:
+            statsd.increment('cabinet.put.tmp_left')  # the temporary file is left behind - never read by anything
+
+    def delete(self, url):
+        self.request(HttpMethod.DELETE, url)
+
+
+class FileSystemCabinetBackend(CabinetBackendBase):
+    """
+    Works directly on the cabinet directory
+    """
+
+    def __init__(self, endpoint, root):
+        self.endpoint = endpoint
+        self.root = os.path.realpath(root)
+
+    def build_path(self, url):
+        if not url.startswith(self.endpoint):
+            raise Cabinet404Error(url)
+
+        path = os.path.realpath(os.path.join(self.root, url[len(self.endpoint):]))
+        # never allow urls to escape the cabinet directory
+        if not path.startswith(self.root + os.sep):
+            raise Cabinet404Error(url)
+        return path
+
+    def read(self, url):
+        path = self.build_path(url)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError:
+            if os.path.isfile(path):
+                raise CabinetConnectionError(url, HttpMethod.GET)
+            raise Cabinet404Error(url)
+
+    def stream(self, url, chunk_size):
+        path = self.build_path(url)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            if os.path.isfile(path):
+                raise CabinetConnectionError(url, HttpMethod.GET)
+            raise Cabinet404Error(url)
+        return CabinetFileStream(self.iter_file(f, chunk_size), os.fstat(f.fileno()).st_mtime, f.close)
+
+    def exists(self, url):
+        try:
+            return os.path.isfile(self.build_path(url))
+        except Cabinet404Error:
+            return False
+
+    def iter_file(self, f, chunk_size):
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def write(self, url, data, headers=None, mode=CabinetWriteMode.OVERWRITE):
+        path = self.build_path(url)
+        try:
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass  # the dir already exists
+
+            # write to a temporary file first so that readers never see a partially written file
+            tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.current_thread().ident)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+            if mode == CabinetWriteMode.CREATE:
+                # linking fails if the file already exists, which makes create-only atomic
+                try:
+                    os.link(tmp_path, path)
+                except OSError, e:
+                    if e.errno == errno.EEXIST:
+                        raise_exists_error(url)
+                    raise
+                finally:
+                    os.remove(tmp_path)
+                return
+
+            if (mode == CabinetWriteMode.UPDATE) and (not os.path.isfile(path)):
+                os.remove(tmp_path)
+                raise_missing_error(url)
+
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            raise CabinetConnectionError(url, HttpMethod.PUT)
+
+    def delete(self, url):
+        try:
+            os.remove(self.build_path(url))
+        except OSError:
+            pass  # same as the http backend - deleting a missing file is not an error
+
+
+def build_cabinet_backend(backend_type, endpoint, root):
+    if backend_type == CabinetBackendType.HTTP:
+        return HttpCabinetBackend()
+    if backend_type == CabinetBackendType.FILESYSTEM:
+        return FileSystemCabinetBackend(endpoint, root)
+    raise ValueError("Unsupported cabinet backend: %s" % backend_type)
@@ -1,21 +1,36 @@
 # This file provides the utility methods to access files from the openshiksha-cabinet repository
 # The access urls are built differently depending on the openshiksha settings DEBUG flag
+import hashlib
+import json
+import mimetypes
 import os
+import re
+import time
+from collections import Counter
 
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datadog import statsd
-from django.core.signing import Signer
+from django.core.signing import Signer, BadSignature
 from django.core.urlresolvers import reverse
-from django.utils.http import urlsafe_base64_encode
-
-from cabinet.exceptions import CabinetSubmissionExistsError, CabinetSubmissionMissingError, CabinetConnectionError, \
-    Cabinet404Error, SubpartOutOfOrderException
+from django.db.models import F
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+from cabinet.cabinet_cache import CABINET_CACHE
+from cabinet.backends import build_cabinet_backend, CabinetWriteMode
+from cabinet.exceptions import Cabinet404Error, SubpartOutOfOrderException, CabinetSubmissionExistsError, \
+    CabinetSubmissionMissingError, CabinetConnectionError, CabinetError
+from cabinet.image_variants import ImageVariant, build_image_variant, build_image_variant_url, is_variant_supported
+from cabinet.metrics import cabinet_call, CabinetOperation, bind_cabinet_call_counter
+from cabinet.models import QuestionBlob
+from cabinet.question_blobs import build_question_blob, is_question_blob_reference, assemble_questions_data
+from cabinet.submission_format import encode_submission, decode_submission
 from core.data_models.aql import AQLMetaDM
 from core.data_models.question import QuestionContainer, build_question_subpart_from_data
 from core.data_models.submission import SubmissionDM
-from core.routing.urlnames import UrlNames
-from core.utils.constants import OpenShikshaQuestionDataType, HttpMethod, OpenShikshaEnv
-from core.utils.json import dump_json_string
+from core.routing.urlnames import UrlNames, prettify_for_url_matcher
+from core.utils.constants import OpenShikshaQuestionDataType, OpenShikshaEnv, OpenShikshaRegex
+from core.utils.json import dump_json_string, dump_json_string_compact, dump_json_string_canonical
+from croupier.artifacts import get_subpart_artifact, load_subpart_artifact_templates
 from croupier.constraints import SubpartVariableConstraints
 from croupier.data_models import UndealtQuestionDM
 from openshiksha import settings
@@ -36,8 +51,15 @@ else:
 CABINET_ENDPOINT = 'http://' + CABINET_HOST + ':' + CABINET_PORT + '/'
 CONFIG_FILE_EXTENSION = '.json'
 ENCODING_SEPERATOR = ':'
+AQL_BUNDLE_VERSION = 1
 
 SIGNER = Signer()
+SECURE_STATIC_SIGNER = Signer(salt='cabinet.secure_static')
+# secure static urls as found in the text of saved questions (the url matcher without its anchors)
+SECURE_STATIC_URL_PREFIX = '/%s/' % prettify_for_url_matcher(UrlNames.SECURE_STATIC.name)
+SECURE_STATIC_URL_REGEX = re.compile(re.escape(SECURE_STATIC_URL_PREFIX) + r'(%s)/' % OpenShikshaRegex.BASE64)
+
+CABINET_BACKEND = build_cabinet_backend(settings.CABINET_BACKEND, CABINET_ENDPOINT, settings.CABINET_ROOT)
 
 def build_config_filename(id_num):
     return str(id_num) + CONFIG_FILE_EXTENSION
@@ -56,6 +78,23 @@ def build_aql_meta_data_url(assignment_questions_list):
                         build_config_filename(assignment_questions_list.pk))
 
 
+def build_aql_bundle_url_stub(assignment_questions_list):
+    return os.path.join(CABINET_ENDPOINT, 'aql_bundle',
+                        str(assignment_questions_list.school.board.pk),
+                        str(assignment_questions_list.school.pk),
+                        str(assignment_questions_list.standard.number),
+                        str(assignment_questions_list.subject.pk))
+
+
+def build_aql_bundle_data_url(assignment_questions_list):
+    """
+    Bundles are addressed by the hash of their content, so a rebuilt bundle never replaces the file readers are using
+    """
+    return os.path.join(build_aql_bundle_url_stub(assignment_questions_list),
+                        str(assignment_questions_list.pk),
+                        build_config_filename(assignment_questions_list.bundle_hash))
+
+
 def build_question_url_stub(question, question_data_type):
     return os.path.join(CABINET_ENDPOINT, 'questions', question_data_type,
                         str(question.school.board.pk),
@@ -74,16 +113,13 @@ def build_cabinet_images_url_stub():
     return os.path.join(CABINET_ENDPOINT, 'images')
 
 def get_resource(url):
-    try:
-        response = requests.get(url)
-    except Exception:
-        raise CabinetConnectionError(url, HttpMethod.GET)
-    if response.status_code == 404:
-        raise Cabinet404Error(url)
-    return response
+    with cabinet_call(CabinetOperation.READ, url) as call:
+        raw = CABINET_BACKEND.read(url)
+        call.size = len(raw)
+    return raw
 
 def get_resource_content(url):
-    return (get_resource(url)).json()
+    return json.loads(get_resource(url))
 
 
 @statsd.timed('cabinet.get.static')
@@ -91,27 +127,55 @@ def get_static_content(url):
     return get_resource(url)
 
 
+def stream_static_content(url):
+    """
+    Returns an iterator over the chunks of the static file, so that the file is never held in memory in full
+    Throws Cabinet404Error if the file does not exist
+    """
+    statsd.increment('cabinet.get.static_stream')
+    with cabinet_call(CabinetOperation.STREAM, url):
+        return CABINET_BACKEND.stream(url, settings.SECURE_STATIC_CHUNK_SIZE)
+
+
+def get_static_content_type(url):
+    return mimetypes.guess_type(url)[0] or 'application/octet-stream'
+
+
+def build_static_accel_path(url):
+    """
+    Path of the static file under the internal nginx location that proxies to the cabinet (for X-Accel-Redirect)
+    """
+    assert url.startswith(CABINET_ENDPOINT)
+    return settings.SECURE_STATIC_ACCEL_LOCATION + url[len(CABINET_ENDPOINT):]
+
+
 def get_resource_exists(url):
-    try:
-        get_resource(url)
-        return True
-    except Cabinet404Error:
-        return False
+    # only the existence is checked with the backend (a HEAD for the http backend), the file is never read
+    with cabinet_call(CabinetOperation.EXISTS, url):
+        return CABINET_BACKEND.exists(url)
 
-def get_question(question):
-    # NOTE: cannot just use the Question's from_data method as we dont have all the data available in one dictionary.
-    # it must first be aggregated by looking at the container in cabinet
-    container_url = build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk)
-    container = QuestionContainer(get_resource_content(container_url))
+def build_undealt_question(question, container_data, subparts_data):
+    """
+    Builds the undealt question data model from the already fetched container and subpart data of the question
+    """
+    container = QuestionContainer(container_data)
 
     subparts = []
     variable_constraints_list = []
-    for i, subpart in enumerate(container.subparts):
-        subpart_url = build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart)
-        subpart_data = get_resource_content(subpart_url)
-
+    for i, subpart_data in enumerate(subparts_data):
         question_part = build_question_subpart_from_data(subpart_data)
-        subpart_variable_constraints = SubpartVariableConstraints(subpart_data.get('variable_constraints'))
+
+        # subparts ingested with their compiled artifact are not validated or compiled again
+        plans_data = None
+        artifact = get_subpart_artifact(subpart_data)
+        if artifact is not None:
+            plans_data = artifact['variable_constraints']
+            load_subpart_artifact_templates(artifact)
+        subpart_url = build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART,
+                                              container_data['subparts'][i])
+        subpart_variable_constraints = SubpartVariableConstraints.build_cached(subpart_url,
+                                                                               subpart_data.get('variable_constraints'),
+                                                                               plans_data)
 
         if i != question_part.subpart_index:
             raise SubpartOutOfOrderException(question_part.subpart_index, i, question.pk)
@@ -121,19 +185,119 @@ def get_question(question):
     return UndealtQuestionDM(question.pk, container, subparts, variable_constraints_list)
 
 
-def get_question_with_img_urls(user, question):
+def get_cached_resource_content(url):
+    """
+    Question containers and subparts are never overwritten once written to the cabinet (and aql bundles are checked
+    against the db before use), so they are served from the cabinet cache whenever possible. The returned data is shared
+    with other callers and must not be modified
+    """
+    data = CABINET_CACHE.get(url)
+    if data is None:
+        raw = get_resource(url)
+        data = json.loads(raw)
+        CABINET_CACHE.set(url, data, raw)
+    return data
+
+
+def get_cached_resources_content(urls):
+    """
+    Fetches the content of all the given urls using a bounded pool of threads. The order of the returned content
+    matches the order of the urls. Falls back to sequential fetches if concurrency is disabled in settings
+    """
+    if (settings.CABINET_FETCH_WORKERS <= 1) or (len(urls) <= 1):
+        return [get_cached_resource_content(url) for url in urls]
+
+    with ThreadPoolExecutor(max_workers=min(settings.CABINET_FETCH_WORKERS, len(urls))) as executor:
+        return list(executor.map(bind_cabinet_call_counter(get_cached_resource_content), urls))
+
+
+def invalidate_question_cache(questions=None):
+    """
+    Drops cached cabinet files for the given questions (container and its subparts). Drops the cached files of all
+    questions if no questions are given. To be used whenever question files are rewritten in the cabinet
+    """
+    if questions is None:
+        CABINET_CACHE.clear()
+        return
+
+    urls = []
+    for question in questions:
+        container_url = build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk)
+        urls.append(container_url)
+        container_data = CABINET_CACHE.get(container_url)
+        if container_data is not None:
+            urls.extend(build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart) for subpart in
+                        container_data['subparts'])
+    CABINET_CACHE.invalidate(urls)
+
+
+def get_question(question):
+    # NOTE: cannot just use the Question's from_data method as we dont have all the data available in one dictionary.
+    # it must first be aggregated by looking at the container in cabinet
+    container_url = build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk)
+    container_data = get_cached_resource_content(container_url)
+
+    subpart_urls = [build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart) for subpart in
+                    container_data['subparts']]
+
+    return build_undealt_question(question, container_data, get_cached_resources_content(subpart_urls))
+
+
+def get_questions(questions):
+    """
+    Concurrent version of get_question for a list of questions - all the containers are fetched together first, and
+    then all the subparts of all the questions are fetched together. Order of the given questions is preserved
+    """
+    container_urls = [build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk) for
+                      question in questions]
+    containers_data = get_cached_resources_content(container_urls)
+
+    subpart_urls = []
+    for question, container_data in zip(questions, containers_data):
+        subpart_urls.extend(build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart) for
+                            subpart in container_data['subparts'])
+    subparts_data = get_cached_resources_content(subpart_urls)
+
+    undealt_question_dms = []
+    subparts_offset = 0
+    for question, container_data in zip(questions, containers_data):
+        subparts_end = subparts_offset + len(container_data['subparts'])
+        undealt_question_dms.append(
+            build_undealt_question(question, container_data, subparts_data[subparts_offset:subparts_end]))
+        subparts_offset = subparts_end
+
+    return undealt_question_dms
+
+
+def get_question_with_img_urls(question):
     undealt_question_dm = get_question(question)
-    undealt_question_dm.question_data.build_img_urls(user)
+    undealt_question_dm.question_data.build_img_urls()
     return undealt_question_dm
 
-def build_submission_data_url(submission):
+def build_submission_url_stub(submission):
     return os.path.join(CABINET_ENDPOINT, 'submissions',
                         str((submission.assignment.get_classroom()).school.pk),
                         str((submission.assignment.get_classroom()).standard.number),
                         (submission.assignment.get_classroom()).division,
                         str(submission.assignment.assignmentQuestionsList.subject.pk),
-                        str(submission.assignment.pk),
-                        build_config_filename(submission.pk))
+                        str(submission.assignment.pk))
+
+
+def build_submission_data_url(submission):
+    # legacy layout - questions and answers of the submission in a single file
+    return os.path.join(build_submission_url_stub(submission), build_config_filename(submission.pk))
+
+
+def build_submission_questions_data_url(submission):
+    return os.path.join(build_submission_url_stub(submission), 'questions', build_config_filename(submission.pk))
+
+
+def build_submission_answers_data_url(submission):
+    return os.path.join(build_submission_url_stub(submission), 'answers', build_config_filename(submission.pk))
+
+
+def build_question_blob_data_url(blob_hash):
+    return os.path.join(CABINET_ENDPOINT, 'question_blobs', blob_hash[:2], build_config_filename(blob_hash))
 
 
 def build_container_or_subpart_data_url(data_url):
@@ -145,9 +309,42 @@ def build_image_data_url(image_url):
 
 @statsd.timed('cabinet.get.submission')
 def get_submission(submission):
-    submission_url = build_submission_data_url(submission)
-
-    return SubmissionDM.build_from_data(get_resource_content(submission_url))
+    try:
+        answers_data = decode_submission(get_resource(build_submission_answers_data_url(submission)))['answers']
+    except Cabinet404Error:
+        # submission has not been split yet - read it from the legacy single file
+        statsd.increment('cabinet.get.submission.legacy')
+        submission_data = decode_submission(get_resource(build_submission_data_url(submission)))
+        submission_data['questions'] = refresh_img_urls_secure_data(submission_data['questions'])
+        return SubmissionDM.build_from_data(submission_data)
+
+    questions = get_submission_questions(submission)
+    return SubmissionDM(questions, SubmissionDM.build_answers_from_data(questions, answers_data))
+
+
+def get_submission_questions(submission):
+    questions_file_data = decode_submission(get_resource(build_submission_questions_data_url(submission)))
+    if is_question_blob_reference(questions_file_data):
+        blob_data = get_question_blob_content(questions_file_data['blob'])
+        questions_data = assemble_questions_data(blob_data, questions_file_data)
+        # the blob has the cabinet urls of its images in place of secure urls (blobs written before, the secure urls)
+        img_urls_regex = build_img_urls_regex(blob_data.get('img_urls', []))
+    else:
+        # split before question blobs existed - the questions file has the full questions
+        questions_data = questions_file_data['questions']
+        img_urls_regex = None
+    # the secure image urls saved with the questions have expired by the time the submission is seen again
+    return SubmissionDM.build_questions_from_data(refresh_img_urls_secure_data(questions_data, img_urls_regex))
+
+
+def get_question_blob_content(blob_hash):
+    # blobs never change once written and are shared by many submissions, so they go through the cabinet cache
+    blob_url = build_question_blob_data_url(blob_hash)
+    blob_data = CABINET_CACHE.get(blob_url)
+    if blob_data is None:
+        blob_data = decode_submission(get_resource(blob_url))
+        CABINET_CACHE.set(blob_url, blob_data, dump_json_string_compact(blob_data))
+    return blob_data
 
 
 @statsd.timed('cabinet.get.aql_meta')
@@ -157,6 +354,102 @@ def get_aql_meta(assignment_questions_list):
     return AQLMetaDM(assignment_questions_list.pk, get_resource_content(aql_meta_url))
 
 
+def build_aql_bundle_question_data(question_id, container_data, subparts_data):
+    return {
+        'pk': question_id,
+        'container': container_data,
+        'subparts': subparts_data
+    }
+
+
+def build_aql_bundle_data(bundle_questions_data):
+    """
+    An aql bundle holds the container and subparts (along with their variable constraints) of every question in an aql,
+    so that the whole assignment can be loaded from the cabinet with a single read
+    """
+    return {
+        'version': AQL_BUNDLE_VERSION,
+        'questions': bundle_questions_data
+    }
+
+
+def build_aql_bundle_content(bundle_questions_data):
+    """
+    Returns the raw aql bundle file along with its content hash (the bundle_hash to be set on the aql)
+    """
+    aql_bundle_raw = dump_json_string_canonical(build_aql_bundle_data(bundle_questions_data))
+    return aql_bundle_raw, hashlib.sha1(aql_bundle_raw).hexdigest()
+
+
+def get_aql_bundle(assignment_questions_list):
+    """
+    Returns the bundled question data of the aql keyed on question id, or None if the aql has no (usable) bundle
+    """
+    if not assignment_questions_list.bundle_hash:
+        return None
+
+    try:
+        aql_bundle_data = get_cached_resource_content(build_aql_bundle_data_url(assignment_questions_list))
+    except Cabinet404Error:
+        return None
+
+    if aql_bundle_data.get('version') != AQL_BUNDLE_VERSION:
+        return None
+
+    return dict((bundle_question_data['pk'], bundle_question_data) for bundle_question_data in
+                aql_bundle_data['questions'])
+
+
+@statsd.timed('cabinet.put.aql_bundle')
+def build_aql_bundle(assignment_questions_list):
+    """
+    (Re)builds the bundle of the aql in the cabinet from the individual question files
+    """
+    questions = list(assignment_questions_list.questions.all())
+    container_urls = [build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk) for
+                      question in questions]
+    containers_data = get_cached_resources_content(container_urls)
+
+    bundle_questions_data = []
+    for question, container_data in zip(questions, containers_data):
+        subpart_urls = [build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart) for subpart in
+                        container_data['subparts']]
+        bundle_questions_data.append(
+            build_aql_bundle_question_data(question.pk, container_data, get_cached_resources_content(subpart_urls)))
+
+    aql_bundle_raw, bundle_hash = build_aql_bundle_content(bundle_questions_data)
+    assignment_questions_list.bundle_hash = bundle_hash
+    # the new bundle is in place before the aql points to it, nothing is cached under its url yet
+    cabinet_put(build_aql_bundle_data_url(assignment_questions_list), aql_bundle_raw)
+    assignment_questions_list.save(update_fields=['bundle_hash'])
+
+
+def build_dealt_assignment_cache_url(seed, assignment_questions_list, question_pks, dealing_version):
+    """
+    Dealt assignments only ever live in the cabinet cache, under this url. The question bank revision is the generation
+    of the cache (cleared by the question bank reloader), and the questions of the aql and the dealing version are part
+    of the url so that a change to either is never served the assignment dealt before it
+    """
+    question_pks_hash = hashlib.sha1(','.join(str(question_pk) for question_pk in question_pks)).hexdigest()
+    return 'dealt_assignments/%s/%s/%s/%s' % (dealing_version, assignment_questions_list.pk, question_pks_hash, seed)
+
+
+def get_cached_dealt_assignment(url):
+    """
+    Returns the dealt questions cached under the url (fresh data models for every call), or None
+    """
+    questions_data = CABINET_CACHE.get(url)
+    if questions_data is None:
+        return None
+    # the secure image urls dealt into the questions may have expired since
+    return SubmissionDM.build_questions_from_data(refresh_img_urls_secure_data(questions_data))
+
+
+def cache_dealt_assignment(url, questions):
+    raw = dump_json_string_compact(questions)
+    CABINET_CACHE.set(url, json.loads(raw), raw)
+
+
 @statsd.timed('cabinet.put.submission')
 def build_submission(submission, shell_submission_dm):
     """
@@ -167,14 +460,92 @@ def build_submission(submission, shell_submission_dm):
     # submission is indirectly used to save the order of the questions and the order of the options
     # (basically the containers with their subparts fully dealt and shuffled)
 
-    submission_url = build_submission_data_url(submission)
+    # the questions are written once here and never change after, all the updates only touch the (small) answers file
+    build_submission_questions(submission, shell_submission_dm.questions)
+    cabinet_put(build_submission_answers_data_url(submission),
+                encode_submission({'answers': shell_submission_dm.answers}), CabinetWriteMode.CREATE)
 
-    if submission_exists(submission):
-        raise CabinetSubmissionExistsError("file exists for resource at: %s" % submission_url)
 
-    # TODO: possible race condition here
+def build_submission_questions(submission, questions):
+    """
+    Writes the questions file of the submission as a reference to the question blob with the same questions. The blob
+    itself is only written by the first submission with these questions
+    Throws CabinetSubmissionExistsError if the submission already has a questions file
+    """
+    blob_hash, blob_data, reference_data = build_unsigned_question_blob(questions)
+
+    # the reference is counted before the blob is written so that the blob is never without references once it exists
+    reference_question_blob(blob_hash)
+    build_question_blob_file(blob_hash, blob_data)
 
-    nginx_cabinet_put(submission_url, dump_json_string(shell_submission_dm))
+    try:
+        cabinet_put(build_submission_questions_data_url(submission), encode_submission(reference_data),
+                    CabinetWriteMode.CREATE)
+    except CabinetSubmissionExistsError:
+        dereference_question_blob(blob_hash)
+        raise
+
+
+@statsd.timed('cabinet.put.submissions')
+def build_submissions(submissions, shell_submission_dms):
+    """
+    Batch version of build_submission for many submissions at once (the shells of a subjectroom). Each distinct question
+    blob is written once, and then the questions and answers files of all the submissions are written concurrently.
+    Either all the submissions are built or none of them
+    Throws CabinetSubmissionExistsError if any of the submissions already exists
+    """
+    blob_references = Counter()  # blob hash -> number of the submissions referring to the blob
+    blobs_data = {}
+    cabinet_files = []
+    for submission, shell_submission_dm in zip(submissions, shell_submission_dms):
+        blob_hash, blob_data, reference_data = build_unsigned_question_blob(shell_submission_dm.questions)
+        blob_references[blob_hash] += 1
+        blobs_data[blob_hash] = blob_data
+        cabinet_files.append(CabinetFile(build_submission_questions_data_url(submission),
+                                         encode_submission(reference_data)))
+        cabinet_files.append(CabinetFile(build_submission_answers_data_url(submission),
+                                         encode_submission({'answers': shell_submission_dm.answers})))
+
+    # the references are counted before the blobs are written, as in build_submission_questions
+    for blob_hash, references in blob_references.iteritems():
+        reference_question_blob(blob_hash, references)
+    try:
+        for blob_hash, blob_data in blobs_data.iteritems():
+            build_question_blob_file(blob_hash, blob_data)
+        build_files(cabinet_files)
+    except CabinetError:
+        for blob_hash, references in blob_references.iteritems():
+            dereference_question_blob(blob_hash, references)
+        raise
+
+
+def build_unsigned_question_blob(questions):
+    """
+    Builds the question blob of the dealt questions (see question_blobs.build_question_blob) with their secure image
+    urls replaced by the cabinet urls they are signed for, so that the blob does not change with the time bucket
+    """
+    img_urls = set()
+    questions_data = unsign_img_urls_secure_data(json.loads(dump_json_string_compact(questions)), img_urls)
+    return build_question_blob(questions_data, img_urls)
+
+
+def build_question_blob_file(blob_hash, blob_data):
+    try:
+        cabinet_put(build_question_blob_data_url(blob_hash), encode_submission(blob_data), CabinetWriteMode.CREATE)
+        statsd.increment('cabinet.put.question_blob.new')
+    except CabinetSubmissionExistsError:
+        statsd.increment('cabinet.put.question_blob.shared')
+
+
+def reference_question_blob(blob_hash, references=1):
+    QuestionBlob.objects.get_or_create(hash=blob_hash)
+    QuestionBlob.objects.filter(hash=blob_hash).update(references=F('references') + references)
+
+
+def dereference_question_blob(blob_hash, references=1):
+    # blobs left without references are removed by the cabinet cleanup, never here as a new reference could be on its way
+    QuestionBlob.objects.filter(hash=blob_hash, references__gte=references).update(
+        references=F('references') - references)
 
 @statsd.timed('cabinet.put.subpart-or-container')
 def build_subpart_or_container(data_url, data):
@@ -183,14 +554,7 @@ def build_subpart_or_container(data_url, data):
     Throws CabinetSubmissionExistsError if trying to create subpart or container which already exists
     """
 
-    cabinet_data_url = build_container_or_subpart_data_url(data_url)
-
-    if file_exists(cabinet_data_url):
-        raise CabinetSubmissionExistsError("file exists for resource at: %s" % cabinet_data_url)
-
-    # TODO: possible race condition here
-
-    nginx_cabinet_put(cabinet_data_url, dump_json_string(data))
+    cabinet_put(build_container_or_subpart_data_url(data_url), dump_json_string(data), CabinetWriteMode.CREATE)
 
 
 @statsd.timed('cabinet.put.image')
@@ -200,45 +564,210 @@ def build_image(image_url, image_data, image_name):
     Throws CabinetSubmissionExistsError if trying to create subpart or container which already exists
     """
 
-    cabinet_image_url = build_image_data_url(image_url)
+    build_files(build_image_files(image_url, image_data, image_name))
+
+
+class CabinetFile(object):
+    """
+    A file to be created in the cabinet as part of a batch (see build_files)
+    """
+
+    def __init__(self, url, data, headers=None):
+        self.url = url
+        self.data = data
+        self.headers = headers
+
+
+def build_subpart_or_container_file(data_url, data):
+    return CabinetFile(build_container_or_subpart_data_url(data_url), dump_json_string(data))
 
-    if file_exists(cabinet_image_url):
-        raise CabinetSubmissionExistsError(
-            "file exists for resource at: %s" % cabinet_image_url)
 
-    # TODO: possible race condition here
+def build_image_files(image_url, image_data, image_name):
+    """
+    The cabinet files for the image along with its variants
+    """
+    url = build_image_data_url(image_url)
+    image_files = [CabinetFile(url, image_data, build_img_headers(image_name))]
+
+    if is_variant_supported(url):
+        for variant in settings.CABINET_IMAGE_VARIANT_WIDTHS:
+            variant_data = build_image_variant_data(image_data, variant)
+            if variant_data is not None:
+                variant_url = build_image_variant_url(url, variant)
+                image_files.append(CabinetFile(variant_url, variant_data,
+                                               build_img_headers(os.path.basename(variant_url))))
 
+    return image_files
 
-    nginx_cabinet_put_img(cabinet_image_url, image_data, image_name)
 
-def nginx_cabinet_put(url, json_str):
+@statsd.timed('cabinet.put.files')
+def build_files(cabinet_files):
+    """
+    Creates all the given files in the cabinet concurrently. Either all of the files are created or none of them - if
+    any of the writes fails, the files already written by the others are deleted again
+    Throws the error of the first failed write (CabinetSubmissionExistsError if the file already exists)
+    """
+    def build_file(cabinet_file):
+        cabinet_write(cabinet_file.url, cabinet_file.data, cabinet_file.headers, CabinetWriteMode.CREATE)
+
+    if (settings.CABINET_WRITE_WORKERS <= 1) or (len(cabinet_files) <= 1):
+        results = []
+        for cabinet_file in cabinet_files:
+            try:
+                build_file(cabinet_file)
+                results.append(None)
+            except Exception, e:
+                results.append(e)
+                break  # no point writing the rest as everything is rolled back anyway
+    else:
+        with ThreadPoolExecutor(max_workers=min(settings.CABINET_WRITE_WORKERS, len(cabinet_files))) as executor:
+            futures = [executor.submit(bind_cabinet_call_counter(build_file), cabinet_file)
+                       for cabinet_file in cabinet_files]
+        results = [future.exception() for future in futures]
+
+    errors = [error for error in results if error is not None]
+    if not errors:
+        return
+
+    # only delete what was written here - a file that already existed belongs to someone else
+    statsd.increment('cabinet.put.files.rollback')
+    for cabinet_file, error in zip(cabinet_files, results):
+        if error is None:
+            try:
+                delete_resource(cabinet_file.url)
+            except CabinetConnectionError:
+                statsd.increment('cabinet.put.files.rollback_error')
+    raise errors[0]
+
+
+def build_image_variant_data(image_data, variant):
+    """
+    Returns the data of the variant of the image, None for images that can not be read (which get no variants)
+    """
     try:
-        print(json_str)
-        requests.put(url, data=json_str)
-    except Exception:
-        raise CabinetConnectionError(url, HttpMethod.PUT)
+        return build_image_variant(image_data, settings.CABINET_IMAGE_VARIANT_WIDTHS[variant])
+    except IOError:
+        statsd.increment('cabinet.image_variant.error')
+        return None
 
 
-def nginx_cabinet_put_img(url, image_data, image_name):
+def build_image_variant_file(url, image_data, variant):
+    """
+    Builds the variant of the image (with the given data) in the cabinet
+    """
+    variant_data = build_image_variant_data(image_data, variant)
+    if variant_data is None:
+        return False
+
+    variant_url = build_image_variant_url(url, variant)
     try:
-        headers = {'Content-type': 'application/octet-stream', 'Slug': image_name}
-        requests.put(url, data=image_data, headers=headers)
-    except Exception:
-        raise CabinetConnectionError(url, HttpMethod.PUT)
+        cabinet_put_img(variant_url, variant_data, os.path.basename(variant_url), CabinetWriteMode.CREATE)
+    except CabinetSubmissionExistsError:
+        pass  # built concurrently - variants of the same image are the same
+    return True
+
+
+def get_image_variant_url(url, variant):
+    """
+    Returns the cabinet url of the variant of the image, building the variant first for images that do not have it yet
+    (images put in the cabinet before variants existed, or by the setup scripts). Falls back to the image itself if no
+    variant can be built
+    Throws Cabinet404Error if the image does not exist
+    """
+    if (variant == ImageVariant.ORIGINAL) or (not is_variant_supported(url)):
+        return url
+
+    variant_url = build_image_variant_url(url, variant)
+    if CABINET_CACHE.get(variant_url) is None:
+        if not get_resource_exists(variant_url):
+            statsd.increment('cabinet.image_variant.lazy')
+            if not build_image_variant_file(url, get_resource(url), variant):
+                return url
+        CABINET_CACHE.set(variant_url, True, 'true')  # variants exist for good once built
+
+    return variant_url
+
+def cabinet_write(url, data, headers, mode):
+    with cabinet_call(CabinetOperation.WRITE, url) as call:
+        call.size = len(data)
+        CABINET_BACKEND.write(url, data, headers, mode)
+
+
+def cabinet_put(url, data, mode=CabinetWriteMode.OVERWRITE):
+    cabinet_write(url, data, None, mode)
+
+
+def build_img_headers(image_name):
+    return {'Content-type': 'application/octet-stream', 'Slug': image_name}
+
+
+def cabinet_put_img(url, image_data, image_name, mode=CabinetWriteMode.OVERWRITE):
+    cabinet_write(url, image_data, build_img_headers(image_name), mode)
 
 @statsd.timed('cabinet.update.submission')
-def update_submission(submission, submission_dm):
+def update_submission_answers(submission, answers):
+    """
+    Only the answers file of the submission is written, the questions of a submission never change
+    Throws CabinetSubmissionMissingError if the submission does not exist in the cabinet
+    """
+    answers_url = build_submission_answers_data_url(submission)
+    try:
+        cabinet_put(answers_url, encode_submission({'answers': answers}), CabinetWriteMode.UPDATE)
+    except CabinetSubmissionMissingError:
+        if not split_legacy_submission(submission):
+            raise
+        cabinet_put(answers_url, encode_submission({'answers': answers}), CabinetWriteMode.UPDATE)
+
+
+@statsd.timed('cabinet.split.submission')
+def split_legacy_submission(submission):
+    """
+    Moves a submission from the legacy single file into separate questions and answers files
+    Returns False if there is no legacy file for the submission (already split or missing altogether)
+    """
     submission_url = build_submission_data_url(submission)
+    try:
+        submission_data = decode_submission(get_resource(submission_url))
+    except Cabinet404Error:
+        return False
 
-    if not submission_exists(submission):
-        raise CabinetSubmissionMissingError("file missing for resource at: %s" % submission_url)
+    # files left behind by an interrupted split (or written by a concurrent split) are fine as they hold the same data
+    try:
+        build_submission_questions(submission, submission_data['questions'])
+    except CabinetSubmissionExistsError:
+        pass
+    try:
+        cabinet_put(build_submission_answers_data_url(submission),
+                    encode_submission({'answers': submission_data['answers']}), CabinetWriteMode.CREATE)
+    except CabinetSubmissionExistsError:
+        pass
 
-    nginx_cabinet_put(submission_url, dump_json_string(submission_dm))
+    delete_resource(submission_url)
+    return True
 
 
 def submission_exists(submission):
-    submission_url = build_submission_data_url(submission)
-    return get_resource_exists(submission_url)
+    return get_resource_exists(build_submission_answers_data_url(submission)) or \
+           get_resource_exists(build_submission_data_url(submission))
+
+
+def delete_submission(submission):
+    questions_url = build_submission_questions_data_url(submission)
+    try:
+        questions_file_data = decode_submission(get_resource(questions_url))
+    except Cabinet404Error:
+        questions_file_data = None
+    if (questions_file_data is not None) and is_question_blob_reference(questions_file_data):
+        dereference_question_blob(questions_file_data['blob'])
+
+    for url in [build_submission_questions_data_url(submission), build_submission_answers_data_url(submission),
+                build_submission_data_url(submission)]:
+        delete_resource(url)
+
+
+def delete_resource(url):
+    with cabinet_call(CabinetOperation.DELETE, url):
+        CABINET_BACKEND.delete(url)
 
 def file_exists(dataURL):
     return get_resource_exists(dataURL)
@@ -246,43 +775,172 @@ def file_exists(dataURL):
 def get_img_url(stub_url, img_filename):
     return os.path.join(stub_url, 'img', img_filename)
 
-def get_img_url_secure(user, unsecure_url):
-    raw_secure_url = user.username + ENCODING_SEPERATOR + unsecure_url
-    signed_secure_url = SIGNER.sign(raw_secure_url)
+def get_secure_static_bucket(timestamp):
+    return int(timestamp) - (int(timestamp) % settings.SECURE_STATIC_TOKEN_BUCKET)
+
+
+def get_img_url_secure(unsecure_url):
+    """
+    The secure url does not depend on the user and only changes once per time bucket, so that browsers and proxies can
+    cache the file across page views and users. The secure static view still requires a logged in user
+    """
+    raw_secure_url = str(get_secure_static_bucket(time.time())) + ENCODING_SEPERATOR + unsecure_url
+    signed_secure_url = SECURE_STATIC_SIGNER.sign(raw_secure_url)
     return reverse(UrlNames.SECURE_STATIC.name, args=[urlsafe_base64_encode(signed_secure_url)])
 
+
+def unsign_img_url_secure(b64_string):
+    """
+    Returns the unsecure url and the expiry timestamp of a secure url token
+    Throws BadSignature if the token has been tampered with
+    """
+    raw_secure_url = SECURE_STATIC_SIGNER.unsign(urlsafe_base64_decode(b64_string))
+    bucket, unsecure_url = raw_secure_url.split(ENCODING_SEPERATOR, 1)
+    return unsecure_url, int(bucket) + settings.SECURE_STATIC_TOKEN_MAX_AGE
+
+
+def unsign_any_img_url_secure(b64_string):
+    # secure urls saved before the time buckets were signed for a user and never expired
+    try:
+        return unsign_img_url_secure(b64_string)[0]
+    except BadSignature:
+        raw_secure_url = SIGNER.unsign(urlsafe_base64_decode(b64_string))
+        return raw_secure_url.split(ENCODING_SEPERATOR, 1)[1]
+
+
+def refresh_img_urls_secure(text, img_urls_regex=None):
+    """
+    Re-signs all the secure urls in the text for the current time bucket. Secure urls are saved along with the dealt
+    questions of submissions and would otherwise expire
+    @param img_urls_regex: matches the (unsigned) cabinet urls in the text to sign as well (see build_img_urls_regex)
+    """
+    def refresh_match(match):
+        try:
+            return get_img_url_secure(unsign_any_img_url_secure(match.group(1)))
+        except (BadSignature, TypeError, ValueError):
+            return match.group(0)  # not a secure url signed by us - leave as it is
+
+    if SECURE_STATIC_URL_PREFIX in text:
+        text = SECURE_STATIC_URL_REGEX.sub(refresh_match, text)
+    if img_urls_regex is not None:
+        text = img_urls_regex.sub(lambda match: get_img_url_secure(match.group(0)), text)
+    return text
+
+
+def refresh_img_urls_secure_data(data, img_urls_regex=None):
+    """
+    Returns a copy of the (json) data with all the secure urls in it re-signed (and the cabinet urls matched by the
+    img_urls_regex signed). The data itself is left untouched as it can be shared through the cabinet cache
+    """
+    if isinstance(data, basestring):
+        return refresh_img_urls_secure(data, img_urls_regex)
+    if isinstance(data, list):
+        return [refresh_img_urls_secure_data(elem, img_urls_regex) for elem in data]
+    if isinstance(data, dict):
+        return dict((key, refresh_img_urls_secure_data(value, img_urls_regex)) for key, value in data.iteritems())
+    return data
+
+
+def unsign_img_urls_secure(text, img_urls):
+    """
+    Replaces all the secure urls in the text with the cabinet urls they are signed for, which are added to img_urls
+    """
+    if SECURE_STATIC_URL_PREFIX not in text:
+        return text
+
+    def unsign_match(match):
+        try:
+            img_url = unsign_any_img_url_secure(match.group(1))
+        except (BadSignature, TypeError, ValueError):
+            return match.group(0)  # not a secure url signed by us - leave as it is
+        img_urls.add(img_url)
+        return img_url
+
+    return SECURE_STATIC_URL_REGEX.sub(unsign_match, text)
+
+
+def unsign_img_urls_secure_data(data, img_urls):
+    """
+    Returns a copy of the (json) data with all the secure urls in it replaced by the cabinet urls they are signed for,
+    which are added to img_urls
+    """
+    if isinstance(data, basestring):
+        return unsign_img_urls_secure(data, img_urls)
+    if isinstance(data, list):
+        return [unsign_img_urls_secure_data(elem, img_urls) for elem in data]
+    if isinstance(data, dict):
+        return dict((key, unsign_img_urls_secure_data(value, img_urls)) for key, value in data.iteritems())
+    return data
+
+
+def build_img_urls_regex(img_urls):
+    """
+    Matches exactly the given cabinet urls - only urls that were unsigned from our own secure urls are ever signed
+    again, never any other cabinet url that happens to be in the data
+    """
+    if not img_urls:
+        return None
+    # longest first so that a url is never matched by another url that is a prefix of it
+    return re.compile('|'.join(re.escape(img_url) for img_url in sorted(img_urls, key=len, reverse=True)))
+
+
+def get_static_etag(url):
+    # files are never replaced in the cabinet (new content gets a new file name) so the url identifies the content
+    return '"%s"' % hashlib.sha1(url).hexdigest()
+
 def get_question_img_url(question, question_data_type, img_filename):
     return get_img_url(build_question_url_stub(question, question_data_type), img_filename)
 
-def get_question_img_url_secure(user, question, question_data_type, img_filename):
+def get_question_img_url_secure(question, question_data_type, img_filename):
     img_url = get_question_img_url(question, question_data_type, img_filename)
-    return get_img_url_secure(user, img_url)
+    return get_img_url_secure(img_url)
 
 def get_aql_meta_img_url(assignment_questions_list, img_filename):
     return get_img_url(build_aql_meta_url_stub(assignment_questions_list), img_filename)
 
-def get_aql_meta_img_url_secure(user, assignment_questions_list, img_filename):
+def get_aql_meta_img_url_secure(assignment_questions_list, img_filename):
     img_url = get_aql_meta_img_url(assignment_questions_list, img_filename)
-    return get_img_url_secure(user, img_url)
+    return get_img_url_secure(img_url)
 
 def get_school_stamp_url(school):
     return os.path.join(build_cabinet_images_url_stub(), 'school', str(school.pk) + '.png')
 
 def get_school_stamp_url_secure(user):
     school_url = get_school_stamp_url(user.userinfo.school)
-    return get_img_url_secure(user, school_url)
+    return get_img_url_secure(school_url)
 
 @statsd.timed('cabinet.get.assignment')
-def build_undealt_assignment(user, assignment_questions_list):
-    undealt_question_dms = []
+def build_undealt_assignment(assignment_questions_list):
     # TODO: verify that the ordering of questions returned by this manytomanyfield lookup is consistent
-    for question_db in assignment_questions_list.questions.all():
-        undealt_question_dms.append(get_question_with_img_urls(user, question_db))
-
-    return undealt_question_dms
-
-
+    fetch_start = time.time()
+    questions = list(assignment_questions_list.questions.all())
+
+    # use the aql bundle for all the questions it has, and fall back to the individual question files for the rest
+    aql_bundle = get_aql_bundle(assignment_questions_list)
+    if aql_bundle is None:
+        statsd.increment('cabinet.get.aql_bundle.miss')
+        aql_bundle = {}
+
+    unbundled_questions = [question for question in questions if question.pk not in aql_bundle]
+    unbundled_undealt_question_dms = dict(
+        (question.pk, undealt_question_dm) for question, undealt_question_dm in
+        zip(unbundled_questions, get_questions(unbundled_questions)))
+    if aql_bundle and unbundled_questions:
+        statsd.increment('cabinet.get.aql_bundle.stale')
 
+    undealt_question_dms = []
+    for question in questions:
+        if question.pk in aql_bundle:
+            bundle_question_data = aql_bundle[question.pk]
+            undealt_question_dms.append(build_undealt_question(question, bundle_question_data['container'],
+                                                               bundle_question_data['subparts']))
+        else:
+            undealt_question_dms.append(unbundled_undealt_question_dms[question.pk])
 
+    statsd.timing('cabinet.get.assignment.fetch', (time.time() - fetch_start) * 1000,
+                  tags=['aql:%s' % assignment_questions_list.pk])
 
+    for undealt_question_dm in undealt_question_dms:
+        undealt_question_dm.question_data.build_img_urls()
 
+    return undealt_question_dms
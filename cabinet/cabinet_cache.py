@@ -0,0 +1,317 @@
+# This file provides the two-tier cache used by cabinet_api for cabinet files that never change once written (question
+# containers and subparts). The first tier is an in-process LRU bounded by bytes, the second tier is shared between
+# processes (redis, or a plain directory as a local stand-in)
+#
+# Clearing the cache works through a generation number kept in the shared tier - every cache key carries the generation
+# and clearing the cache just moves on to the next generation. Processes pick up a new generation within
+# CABINET_CACHE_GENERATION_TTL seconds, which lets the question bank reloader invalidate every worker's local tier.
+# Invalidating a few urls deletes just their keys, from the shared tier and the local tier of the invalidating process -
+# the local tiers of the other processes can not be reached, so local entries expire after CABINET_CACHE_LOCAL_TTL
+# seconds, which bounds how long another process may serve an invalidated url
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from datadog import statsd
+
+from cabinet.metrics import get_cabinet_data_type, count_cabinet_cache_lookup
+from openshiksha import settings
+
+
+class LRUByteCache(object):
+    """
+    In-process least recently used cache whose bound is the total size (in bytes) of the cached values. Entries also
+    expire ttl seconds after they are set, if a ttl is given
+    """
+
+    def __init__(self, max_bytes, metric_prefix='cabinet.cache', ttl=None):
+        self.max_bytes = max_bytes
+        self.metric_prefix = metric_prefix
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, expiry or None), oldest first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            if (entry[2] is not None) and (time.time() >= entry[2]):
+                self.total_bytes -= entry[1]
+                return None
+            self.entries[key] = entry  # re-insert to mark as most recently used
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.total_bytes -= old_entry[1]
+
+            self.entries[key] = (value, size, None if self.ttl is None else time.time() + self.ttl)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                evicted_key, evicted_entry = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_entry[1]
+                statsd.increment('%s.eviction' % self.metric_prefix)
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class SharedCacheBase(object):
+    def get(self, key):
+        raise NotImplementedError("subclass of SharedCacheBase must implement method get")
+
+    def set(self, key, raw):
+        raise NotImplementedError("subclass of SharedCacheBase must implement method set")
+
+    def delete(self, key):
+        raise NotImplementedError("subclass of SharedCacheBase must implement method delete")
+
+    def get_generation(self):
+        raise NotImplementedError("subclass of SharedCacheBase must implement method get_generation")
+
+    def bump_generation(self):
+        raise NotImplementedError("subclass of SharedCacheBase must implement method bump_generation")
+
+
+class RedisSharedCache(SharedCacheBase):
+    KEY_PREFIX = 'cabinet:'
+    GENERATION_KEY = KEY_PREFIX + 'generation'
+
+    def __init__(self, url):
+        self.client = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(RedisSharedCache.KEY_PREFIX + key)
+
+    def set(self, key, raw):
+        self.client.set(RedisSharedCache.KEY_PREFIX + key, raw, ex=settings.CABINET_SHARED_CACHE_TIMEOUT)
+
+    def delete(self, key):
+        self.client.delete(RedisSharedCache.KEY_PREFIX + key)
+
+    def get_generation(self):
+        return int(self.client.get(RedisSharedCache.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        return self.client.incr(RedisSharedCache.GENERATION_KEY)
+
+
+class FileSharedCache(SharedCacheBase):
+    """
+    Stand-in for the redis cache on a single machine (LOCAL env and tests). Entries are files named by key hash. The
+    directory is trimmed down to max_bytes every TRIM_INTERVAL sets, dropping the entries written longest ago
+    """
+    GENERATION_FILENAME = 'generation'
+    TRIM_INTERVAL = 100
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sets = 0
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            pass  # the cache dir already exists
+
+    def build_entry_path(self, key):
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest())
+
+    def write_atomic(self, path, data):
+        tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)  # a partial write on a full disk
+            raise
+
+    def get(self, key):
+        try:
+            with open(self.build_entry_path(key), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def set(self, key, raw):
+        self.write_atomic(self.build_entry_path(key), raw)
+        self.sets += 1
+        if self.sets % FileSharedCache.TRIM_INTERVAL == 0:
+            self.trim()
+
+    def delete(self, key):
+        try:
+            os.remove(self.build_entry_path(key))
+        except OSError:
+            pass  # entry was never cached
+
+    def trim(self):
+        entries = []  # (mtime, size, path)
+        for filename in os.listdir(self.path):
+            if (filename == FileSharedCache.GENERATION_FILENAME) or filename.endswith('.tmp'):
+                continue
+            path = os.path.join(self.path, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by another process meanwhile
+            total_bytes -= size
+            statsd.increment('cabinet.cache.shared_eviction')
+
+    def get_generation(self):
+        try:
+            with open(os.path.join(self.path, FileSharedCache.GENERATION_FILENAME), 'r') as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return 0
+
+    def bump_generation(self):
+        generation = self.get_generation() + 1
+        self.write_atomic(os.path.join(self.path, FileSharedCache.GENERATION_FILENAME), str(generation))
+        return generation
+
+
+def build_shared_cache(url):
+    if not url:
+        return None
+    if url.startswith('redis://'):
+        return RedisSharedCache(url)
+    if url.startswith('file://'):
+        return FileSharedCache(url[len('file://'):], settings.CABINET_FILE_SHARED_CACHE_MAX_BYTES)
+    raise ValueError("Unsupported cabinet shared cache url: %s" % url)
+
+
+# errors of the shared tier that only ever cost a cache miss (redis down, or a full disk for the file stand-in)
+SHARED_CACHE_ERRORS = (redis.RedisError, IOError, OSError)
+
+
+class CabinetCache(object):
+    """
+    Caches parsed json data of cabinet files keyed on their cabinet url. Cached data is shared between all callers and
+    so must be treated as read-only
+    """
+
+    def __init__(self, local_cache, shared_cache):
+        self.local_cache = local_cache
+        self.shared_cache = shared_cache
+        self.generation = 0
+        self.generation_checked = None
+
+    def get_generation(self):
+        if self.shared_cache is None:
+            return self.generation
+
+        now = time.time()
+        if (self.generation_checked is None) or (now - self.generation_checked > settings.CABINET_CACHE_GENERATION_TTL):
+            try:
+                self.generation = self.shared_cache.get_generation()
+            except SHARED_CACHE_ERRORS:
+                statsd.increment('cabinet.cache.error')
+            self.generation_checked = now
+
+        return self.generation
+
+    def build_key(self, url):
+        return '%s:%s' % (self.get_generation(), url)
+
+    def get(self, url):
+        key = self.build_key(url)
+
+        data = self.local_cache.get(key)
+        if data is not None:
+            statsd.increment('cabinet.cache.hit', tags=['tier:local', 'data_type:%s' % get_cabinet_data_type(url)])
+            count_cabinet_cache_lookup(True)
+            return data
+
+        if self.shared_cache is not None:
+            try:
+                raw = self.shared_cache.get(key)
+            except SHARED_CACHE_ERRORS:
+                statsd.increment('cabinet.cache.error')
+                raw = None
+
+            if raw is not None:
+                statsd.increment('cabinet.cache.hit', tags=['tier:shared', 'data_type:%s' % get_cabinet_data_type(url)])
+                count_cabinet_cache_lookup(True)
+                data = json.loads(raw)
+                self.local_cache.set(key, data, len(raw))
+                return data
+
+        statsd.increment('cabinet.cache.miss', tags=['data_type:%s' % get_cabinet_data_type(url)])
+        count_cabinet_cache_lookup(False)
+        return None
+
+    def set(self, url, data, raw):
+        key = self.build_key(url)
+
+        self.local_cache.set(key, data, len(raw))
+        if self.shared_cache is not None:
+            try:
+                self.shared_cache.set(key, raw)
+            except SHARED_CACHE_ERRORS:
+                statsd.increment('cabinet.cache.error')
+
+    def next_generation(self):
+        try:
+            self.generation = self.shared_cache.bump_generation()
+        except SHARED_CACHE_ERRORS:
+            # the other processes keep serving the cached data until the shared tier is back and the cache is cleared
+            statsd.increment('cabinet.cache.error')
+            return
+        self.generation_checked = time.time()
+
+    def invalidate(self, urls):
+        """
+        Drops the cached data of the urls - right away from the shared tier and the local tier of this process, within
+        CABINET_CACHE_LOCAL_TTL seconds from the local tiers of the other processes (see the invalidation at the top)
+        """
+        for url in urls:
+            key = self.build_key(url)
+            self.local_cache.delete(key)
+            if self.shared_cache is not None:
+                try:
+                    self.shared_cache.delete(key)
+                except SHARED_CACHE_ERRORS:
+                    statsd.increment('cabinet.cache.error')
+        statsd.increment('cabinet.cache.invalidation', len(urls))
+
+    def clear(self):
+        self.local_cache.clear()
+        if self.shared_cache is not None:
+            self.next_generation()
+        statsd.increment('cabinet.cache.clear')
+
+
+CABINET_CACHE = CabinetCache(LRUByteCache(settings.CABINET_CACHE_MAX_BYTES, ttl=settings.CABINET_CACHE_LOCAL_TTL),
+                             build_shared_cache(settings.CABINET_SHARED_CACHE_URL))
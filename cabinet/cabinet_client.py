@@ -0,0 +1,57 @@
+# This file provides the shared http client used for all reads and writes to the openshiksha-cabinet server
+# Every process gets its own keep-alive connection pool so that cabinet files are not paying connection setup each time
+import os
+import threading
+
+import requests
+from datadog import statsd
+from requests.adapters import HTTPAdapter
+
+from openshiksha import settings
+
+
+class CabinetHTTPAdapter(HTTPAdapter):
+    """
+    Regular requests adapter that also reports whether each request was served on a new or a reused connection
+    """
+
+    def send(self, request, **kwargs):
+        connection_pool = self.get_connection(request.url, kwargs.get('proxies'))
+        connections_before = connection_pool.num_connections
+
+        response = super(CabinetHTTPAdapter, self).send(request, **kwargs)
+
+        if connection_pool.num_connections > connections_before:
+            statsd.increment('cabinet.connection.new')
+        else:
+            statsd.increment('cabinet.connection.reused')
+
+        return response
+
+
+def build_session():
+    session = requests.Session()
+    adapter = CabinetHTTPAdapter(pool_connections=1, pool_maxsize=settings.CABINET_POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# NOTE: the session is keyed on the pid as gunicorn preloads the app before forking its workers, and a pool created in
+# the master must never be shared (sockets and all) with the forked workers
+_session_pid = None
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session_pid != pid:
+        with _session_lock:
+            if _session_pid != pid:
+                _session = build_session()
+                _session_pid = pid
+
+    return _session
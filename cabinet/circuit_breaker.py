@@ -0,0 +1,69 @@
+# This file provides the circuit breaker that keeps requests away from the cabinet server while it is unhealthy
+#
+# The breaker opens after a number of consecutive failures, and then rejects all calls straight away (instead of every
+# worker waiting on timeouts) until the reset timeout has passed. It then lets a single trial call through (half open) -
+# a success closes the breaker again, a failure opens it for another reset timeout
+import threading
+import time
+
+from datadog import statsd
+
+
+class CircuitBreakerState(object):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    NAMES = {
+        CLOSED: 'closed',
+        HALF_OPEN: 'half_open',
+        OPEN: 'open'
+    }
+
+
+class CircuitBreaker(object):
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitBreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def set_state(self, state):
+        # NOTE: only called with the lock held
+        if state == self.state:
+            return
+        self.state = state
+        statsd.gauge('%s.breaker.state' % self.name, state)
+        statsd.increment('%s.breaker.transition' % self.name, tags=['state:%s' % CircuitBreakerState.NAMES[state]])
+
+    def allow(self):
+        """
+        Whether a call may go through right now. A call that has been allowed must be followed by record_success or
+        record_failure
+        """
+        with self.lock:
+            if self.state == CircuitBreakerState.CLOSED:
+                return True
+
+            if (self.state == CircuitBreakerState.OPEN) and (time.time() - self.opened_at >= self.reset_timeout):
+                self.set_state(CircuitBreakerState.HALF_OPEN)
+                return True  # the trial call
+
+        statsd.increment('%s.breaker.rejected' % self.name)
+        return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.set_state(CircuitBreakerState.CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if (self.state == CircuitBreakerState.HALF_OPEN) or (self.failures >= self.failure_threshold):
+                self.opened_at = time.time()
+                self.set_state(CircuitBreakerState.OPEN)
@@ -12,6 +12,10 @@ class CabinetSubmissionMissingError(CabinetError):
     def __init__(self, msg, *args, **kwargs):
         super(CabinetSubmissionMissingError, self).__init__("SubmissionMissing", msg)
 
+class CabinetSubmissionFormatError(CabinetError):
+    def __init__(self, version, *args, **kwargs):
+        super(CabinetSubmissionFormatError, self).__init__("SubmissionFormat", "Unsupported version: %s" % version)
+
 class CabinetConnectionError(CabinetError):
     def __init__(self, url, method, *args, **kwargs):
         super(CabinetConnectionError, self).__init__("CouldNotConnect", "url: %s method: %s" % (url, method))
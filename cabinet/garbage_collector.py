@@ -0,0 +1,375 @@
+# This file provides the garbage collector for the cabinet file system (run on the machine where the cabinet lives)
+#
+# Files are orphaned in the cabinet when their rows are deleted from the db (submissions and question containers), when
+# no live container of their chapter lists them any more (question subparts), when no live subpart or container of their
+# chapter refers to them any more (images and their variants), or when no submission refers to them any more (question
+# blobs). The cabinet is walked with scandir in parallel, one school directory (or blob prefix directory) per task, and
+# the orphans are either deleted, moved to a quarantine directory or only reported (dry run). Files younger than the
+# minimum age are never collected, as their rows may not have been committed yet
+import errno
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from collections import Counter
+
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
+from scandir import scandir, walk
+
+from cabinet.cabinet_api import dereference_question_blob
+from cabinet.exceptions import CabinetSubmissionFormatError
+from cabinet.models import QuestionBlob
+from cabinet.submission_format import decode_submission
+from core.utils.constants import OpenShikshaQuestionDataType
+
+
+class CabinetGCKind(object):
+    SUBMISSION = 'submission'
+    SUBPART = 'subpart'
+    CONTAINER = 'container'
+    IMAGE = 'image'
+    QUESTION_BLOB = 'question_blob'
+
+    ALL = [SUBMISSION, SUBPART, CONTAINER, IMAGE, QUESTION_BLOB]
+
+
+CONFIG_FILE_EXTENSION = '.json'
+
+
+def get_config_file_id(filename):
+    """
+    The id (pk or blob hash) of a config file, None for files that are not config files
+    """
+    if not filename.endswith(CONFIG_FILE_EXTENSION):
+        return None
+    return filename[:-len(CONFIG_FILE_EXTENSION)]
+
+
+def get_config_file_pk(filename):
+    file_id = get_config_file_id(filename)
+    if (file_id is None) or (not file_id.isdigit()):
+        return None
+    return long(file_id)
+
+
+def list_dirs(path):
+    try:
+        return [entry.name for entry in scandir(path) if entry.is_dir()]
+    except OSError, e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def list_files(path):
+    try:
+        return [entry.name for entry in scandir(path) if entry.is_file()]
+    except OSError, e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def get_container_subpart_ids(path):
+    """
+    The ids of the subpart files (names without the extension) listed by a question container file, None if it can not
+    be read. Subpart files are named by the QuestionSubpart pk for questions submitted through sphinx, but by the vault
+    subpart number for the question bank, so the container is the only place that tells which subpart files are live
+    """
+    try:
+        with open(path, 'rb') as f:
+            return set(str(subpart_id) for subpart_id in json.load(f)['subparts'])
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def get_question_blob_hash(path):
+    """
+    The hash of the question blob a submission questions file refers to, None if it has the full questions (split
+    before question blobs existed) or can not be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            questions_file_data = decode_submission(f.read())
+    except (IOError, ValueError, zlib.error, CabinetSubmissionFormatError):
+        return None
+    if not isinstance(questions_file_data, dict):
+        return None
+    return questions_file_data.get('blob')
+
+
+def get_data_strings(data):
+    """
+    All the strings (keys and values) found in the json data
+    """
+    if isinstance(data, basestring):
+        yield data
+    elif isinstance(data, dict):
+        for key, value in data.iteritems():
+            yield key
+            for string in get_data_strings(value):
+                yield string
+    elif isinstance(data, list):
+        for value in data:
+            for string in get_data_strings(value):
+                yield string
+
+
+class CabinetGarbageCollector(object):
+    def __init__(self, root, submission_pks, question_pks, question_blob_hashes, min_age, dry_run=False,
+                 quarantine_root=None, workers=8, verbose=False):
+        """
+        @param submission_pks, question_pks: sets of the pks of the rows in the db
+        @param question_blob_hashes: set of the hashes of the question blobs that are still referenced
+        """
+        self.root = root
+        self.live_pks = {
+            CabinetGCKind.SUBMISSION: submission_pks,
+            CabinetGCKind.CONTAINER: question_pks
+        }
+        self.question_blob_hashes = question_blob_hashes
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.quarantine_root = quarantine_root
+        self.workers = workers
+        self.verbose = verbose
+        self.now = None
+
+    def run(self):
+        """
+        Collects the orphans in the whole cabinet
+        @return: Counter of <kind>.scanned, <kind>.orphaned, <kind>.bytes, <kind>.recent (orphans younger than the
+        minimum age), <kind>.unknown (files that are not named like cabinet files, which are always left alone) and
+        question_blob.dereferenced (references given up by the collected submission questions files)
+        """
+        self.now = time.time()
+        stats = Counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            submissions_root = os.path.join(self.root, 'submissions')
+            submission_futures = [executor.submit(self.collect_submissions, os.path.join(submissions_root,
+                                                                                         school_dirname))
+                                  for school_dirname in list_dirs(submissions_root)]
+
+            question_futures = [executor.submit(self.collect_questions, board_dirname, school_dirname)
+                                for board_dirname, school_dirname in self.get_question_school_dirnames()]
+
+            blobs_root = os.path.join(self.root, 'question_blobs')
+            blob_futures = [executor.submit(self.find_question_blob_orphans, os.path.join(blobs_root, prefix_dirname))
+                            for prefix_dirname in list_dirs(blobs_root)]
+
+            # all the db writes are left to this thread, one at a time
+            for future in submission_futures:
+                submission_stats, blob_hashes = future.result()
+                stats.update(submission_stats)
+                for blob_hash in blob_hashes:
+                    dereference_question_blob(blob_hash)
+                    stats[CabinetGCKind.QUESTION_BLOB + '.dereferenced'] += 1
+
+            for future in question_futures:
+                stats.update(future.result())
+
+            for future in blob_futures:
+                blob_stats, blob_orphans = future.result()
+                stats.update(blob_stats)
+                for path, blob_hash in blob_orphans:
+                    self.collect_question_blob(stats, path, blob_hash)
+
+        return stats
+
+    def get_question_school_dirnames(self):
+        school_dirnames = set()
+        for question_data_type in [OpenShikshaQuestionDataType.SUBPART, OpenShikshaQuestionDataType.CONTAINER]:
+            type_root = os.path.join(self.root, 'questions', question_data_type)
+            for board_dirname in list_dirs(type_root):
+                for school_dirname in list_dirs(os.path.join(type_root, board_dirname)):
+                    school_dirnames.add((board_dirname, school_dirname))
+        return sorted(school_dirnames)
+
+    def collect_submissions(self, school_path):
+        """
+        Collects the submission files of a school - legacy, questions and answers files of a submission are all named by
+        its pk
+        @return: (stats, hashes of the question blobs referred to by the collected questions files)
+        """
+        stats = Counter()
+        blob_hashes = []
+        for dirpath, dirnames, filenames in walk(school_path):
+            is_questions_dirpath = (os.path.basename(dirpath) == 'questions')
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if self.check_pk_file(stats, CabinetGCKind.SUBMISSION, path) is not False:
+                    continue
+
+                # the blob reference has to be read before the questions file is gone
+                blob_hash = get_question_blob_hash(path) if is_questions_dirpath else None
+                if self.collect_file(stats, CabinetGCKind.SUBMISSION, path) and (blob_hash is not None):
+                    blob_hashes.append(blob_hash)
+        return stats, blob_hashes
+
+    def collect_questions(self, board_dirname, school_dirname):
+        """
+        Collects the containers of a school, then the subparts they no longer list and then the images of its chapters.
+        Subparts and containers of the same chapter (and their images) are in the same place in the raw and the
+        containers trees
+        """
+        stats = Counter()
+        live_paths = {}  # chapter path (relative to the type root) -> paths of the live subparts and containers
+        live_subpart_ids = {}  # chapter path -> ids of the subparts listed by the live containers of the chapter
+        unreadable_chapter_paths = set()  # chapters with a live container that can not be read
+        img_paths = []
+
+        for chapter_path, path in self.walk_question_files(OpenShikshaQuestionDataType.CONTAINER, board_dirname,
+                                                           school_dirname, img_paths):
+            is_live = self.check_pk_file(stats, CabinetGCKind.CONTAINER, path)
+            if is_live is False:
+                self.collect_file(stats, CabinetGCKind.CONTAINER, path)
+            elif is_live:
+                live_paths.setdefault(chapter_path, []).append(path)
+                subpart_ids = get_container_subpart_ids(path)
+                if subpart_ids is None:
+                    unreadable_chapter_paths.add(chapter_path)
+                else:
+                    live_subpart_ids.setdefault(chapter_path, set()).update(subpart_ids)
+
+        for chapter_path, path in self.walk_question_files(OpenShikshaQuestionDataType.SUBPART, board_dirname,
+                                                           school_dirname, img_paths):
+            subpart_id = get_config_file_id(os.path.basename(path))
+            if subpart_id is None:
+                stats[CabinetGCKind.SUBPART + '.unknown'] += 1
+                continue
+
+            stats[CabinetGCKind.SUBPART + '.scanned'] += 1
+            if chapter_path in unreadable_chapter_paths:
+                stats[CabinetGCKind.SUBPART + '.unreadable'] += 1  # nothing can be told about the subparts
+            elif subpart_id in live_subpart_ids.get(chapter_path, ()):
+                live_paths.setdefault(chapter_path, []).append(path)
+            else:
+                self.collect_file(stats, CabinetGCKind.SUBPART, path)
+
+        for chapter_path, img_path in img_paths:
+            self.collect_images(stats, img_path, live_paths.get(chapter_path, []))
+
+        return stats
+
+    def walk_question_files(self, question_data_type, board_dirname, school_dirname, img_paths):
+        """
+        Yields (chapter path relative to the type root, path) for the question files of a school, adding the image
+        directories found to img_paths - images are only collected once all the question files have been seen
+        """
+        type_root = os.path.join(self.root, 'questions', question_data_type)
+        for dirpath, dirnames, filenames in walk(os.path.join(type_root, board_dirname, school_dirname)):
+            chapter_path = os.path.relpath(dirpath, type_root)
+            if 'img' in dirnames:
+                dirnames.remove('img')
+                img_paths.append((chapter_path, os.path.join(dirpath, 'img')))
+
+            for filename in filenames:
+                yield chapter_path, os.path.join(dirpath, filename)
+
+    def collect_images(self, stats, img_path, live_paths):
+        referenced_text = self.get_referenced_text(live_paths)
+        if referenced_text is None:
+            stats[CabinetGCKind.IMAGE + '.unreadable'] += 1
+            return  # nothing can be told about the images of the chapter
+
+        image_paths = [(filename, os.path.join(img_path, filename)) for filename in list_files(img_path)]
+        variants_path = os.path.join(img_path, 'variants')
+        for variant_dirname in list_dirs(variants_path):
+            variant_path = os.path.join(variants_path, variant_dirname)
+            image_paths.extend((filename, os.path.join(variant_path, filename)) for filename in list_files(variant_path))
+
+        for filename, path in image_paths:
+            stats[CabinetGCKind.IMAGE + '.scanned'] += 1
+            if filename not in referenced_text:
+                self.collect_file(stats, CabinetGCKind.IMAGE, path)
+
+    def get_referenced_text(self, live_paths):
+        """
+        All the strings of the live subparts and containers of a chapter, which contain the names of all the images
+        referred to in the chapter (in img fields or img substitution tags)
+        Returns None if any of them can not be read
+        """
+        strings = []
+        for path in live_paths:
+            try:
+                with open(path, 'rb') as f:
+                    strings.extend(get_data_strings(json.load(f)))
+            except (IOError, ValueError):
+                return None
+        return '\n'.join(strings)
+
+    def check_pk_file(self, stats, kind, path):
+        """
+        @return: True if the file belongs to a live row, False if it is an orphan (to be collected by the caller) and
+        None if it is not named like a cabinet file
+        """
+        pk = get_config_file_pk(os.path.basename(path))
+        if pk is None:
+            stats[kind + '.unknown'] += 1
+            return None
+
+        stats[kind + '.scanned'] += 1
+        return pk in self.live_pks[kind]
+
+    def find_question_blob_orphans(self, prefix_path):
+        stats = Counter()
+        orphans = []
+        for filename in list_files(prefix_path):
+            blob_hash = get_config_file_id(filename)
+            if blob_hash is None:
+                stats[CabinetGCKind.QUESTION_BLOB + '.unknown'] += 1
+                continue
+
+            stats[CabinetGCKind.QUESTION_BLOB + '.scanned'] += 1
+            if blob_hash not in self.question_blob_hashes:
+                orphans.append((os.path.join(prefix_path, filename), blob_hash))
+        return stats, orphans
+
+    def collect_question_blob(self, stats, path, blob_hash):
+        # the row is locked while the blob goes, so that a submission referring to the blob meanwhile waits for it
+        # and then writes the blob again
+        with transaction.atomic():
+            question_blob = QuestionBlob.objects.select_for_update().filter(hash=blob_hash).first()
+            if (question_blob is not None) and (question_blob.references > 0):
+                return  # referred to again since the hashes were read
+
+            if self.collect_file(stats, CabinetGCKind.QUESTION_BLOB, path) and (question_blob is not None):
+                question_blob.delete()
+
+    def collect_file(self, stats, kind, path):
+        """
+        Deletes or quarantines an orphan (unless this is a dry run or it is too young)
+        @return: whether the file is gone from the cabinet
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False  # already gone
+
+        if stat.st_mtime > self.now - self.min_age:
+            stats[kind + '.recent'] += 1
+            return False
+
+        stats[kind + '.orphaned'] += 1
+        stats[kind + '.bytes'] += stat.st_size
+        if self.verbose:
+            sys.stdout.write('%s %s\n' % (kind, path))  # a single write, as the workers print at the same time
+
+        if self.dry_run:
+            return False
+
+        if self.quarantine_root is None:
+            os.remove(path)
+        else:
+            quarantine_path = os.path.join(self.quarantine_root, os.path.relpath(path, self.root))
+            try:
+                os.makedirs(os.path.dirname(quarantine_path))
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            shutil.move(path, quarantine_path)
+        return True
@@ -0,0 +1,75 @@
+# This file provides the variants (thumbnail, mobile width) derived from the images in the cabinet
+#
+# Variants are scaled down and recompressed copies of an image, stored alongside it in the cabinet under
+# <img-dir>/variants/<variant>/<image-name>. Images that are already narrow enough are stored unchanged as their variants,
+# so that a variant always exists once it has been built
+import os
+from cStringIO import StringIO
+
+from PIL import Image
+
+from openshiksha import settings
+
+
+class ImageVariant(object):
+    ORIGINAL = 'original'
+    THUMBNAIL = 'thumb'
+    MOBILE = 'mobile'
+
+
+VARIANT_IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg']  # gifs can be animated, so they are always served as they are
+
+
+def is_variant_supported(url):
+    return os.path.splitext(url)[1].lower() in VARIANT_IMAGE_EXTENSIONS
+
+
+def build_image_variant_url(url, variant):
+    dirname, filename = os.path.split(url)
+    return os.path.join(dirname, 'variants', variant, filename)
+
+
+def build_image_variant(image_data, width):
+    """
+    Returns the image data scaled down to the given width (keeping the aspect ratio) and recompressed in the same format
+    @throws: IOError if the image data can not be read as an image
+    """
+    image = Image.open(StringIO(image_data))
+    if image.size[0] <= width:
+        return image_data
+
+    image_format = image.format
+    if image.mode in ['1', 'P']:
+        image = image.convert('RGBA')  # palette images are only resized with the nearest neighbour otherwise
+
+    height = max(1, int(round(image.size[1] * float(width) / image.size[0])))
+    variant_image = image.resize((width, height), Image.ANTIALIAS)
+
+    output = StringIO()
+    if image_format == 'JPEG':
+        variant_image.save(output, 'JPEG', quality=settings.CABINET_IMAGE_VARIANT_JPEG_QUALITY, optimize=True)
+    else:
+        variant_image.save(output, image_format, optimize=True)
+    return output.getvalue()
+
+
+def pick_image_variant(query_variant, save_data, viewport_width):
+    """
+    Picks the variant to serve from an explicit variant (query parameter) or else from the client hints (Save-Data and
+    Viewport-Width headers)
+    """
+    if query_variant is not None:
+        if query_variant in settings.CABINET_IMAGE_VARIANT_WIDTHS:
+            return query_variant
+        return ImageVariant.ORIGINAL
+
+    if (save_data is not None) and (save_data.lower() == 'on'):
+        return ImageVariant.MOBILE
+
+    try:
+        if int(viewport_width) <= settings.CABINET_IMAGE_MOBILE_VIEWPORT_WIDTH:
+            return ImageVariant.MOBILE
+    except (TypeError, ValueError):
+        pass  # no (valid) viewport hint
+
+    return ImageVariant.ORIGINAL
@@ -0,0 +1,164 @@
+# This file provides the instrumentation of the calls made to the cabinet
+#
+# Every round trip to the cabinet backend is reported to statsd (latency and payload size histograms tagged by the
+# operation and the type of cabinet data), and counted against the cabinet call counter of the current request if there
+# is one. The counter follows the cabinet calls made from worker threads on behalf of the request as long as the work is
+# submitted through bind_cabinet_call_counter
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from datadog import statsd
+
+
+class CabinetDataType(object):
+    CONTAINER = 'container'
+    SUBPART = 'subpart'
+    SUBMISSION = 'submission'
+    QUESTION_BLOB = 'question_blob'
+    AQL_META = 'aql_meta'
+    AQL_BUNDLE = 'aql_bundle'
+    IMAGE = 'image'
+    DEALT_ASSIGNMENT = 'dealt_assignment'
+    OTHER = 'other'
+
+
+class CabinetOperation(object):
+    READ = 'read'
+    STREAM = 'stream'
+    WRITE = 'write'
+    DELETE = 'delete'
+    EXISTS = 'exists'
+
+
+CABINET_DATA_TYPE_ROOTS = {
+    'submissions': CabinetDataType.SUBMISSION,
+    'question_blobs': CabinetDataType.QUESTION_BLOB,
+    'aql_meta': CabinetDataType.AQL_META,
+    'aql_bundle': CabinetDataType.AQL_BUNDLE,
+    'images': CabinetDataType.IMAGE,
+    'dealt_assignments': CabinetDataType.DEALT_ASSIGNMENT
+}
+
+
+def get_cabinet_data_type(url):
+    """
+    The type of cabinet data behind the url, from the top level directory of the cabinet it lives in
+    """
+    if '/img/' in url:
+        return CabinetDataType.IMAGE  # images of questions and aql metas
+
+    segments = url.split('/')
+    for i, segment in enumerate(segments):
+        if segment == 'questions' and i + 1 < len(segments):
+            if segments[i + 1] == 'containers':
+                return CabinetDataType.CONTAINER
+            if segments[i + 1] == 'raw':
+                return CabinetDataType.SUBPART
+        if segment in CABINET_DATA_TYPE_ROOTS:
+            return CABINET_DATA_TYPE_ROOTS[segment]
+    return CabinetDataType.OTHER
+
+
+class CabinetCallCounter(object):
+    """
+    Counts the cabinet round trips (and their bytes) and the cabinet cache lookups made while handling a request
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.calls_by_data_type = Counter()
+        self.lock = threading.Lock()  # calls are counted from the worker threads of the request too
+
+    def add_call(self, operation, data_type, size):
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            self.calls_by_data_type['%s.%s' % (operation, data_type)] += 1
+
+    def add_cache_lookup(self, hit):
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+
+_local = threading.local()
+
+
+def get_cabinet_call_counter():
+    return getattr(_local, 'counter', None)
+
+
+def set_cabinet_call_counter(counter):
+    _local.counter = counter
+
+
+def start_cabinet_call_counter():
+    counter = CabinetCallCounter()
+    set_cabinet_call_counter(counter)
+    return counter
+
+
+def stop_cabinet_call_counter():
+    counter = get_cabinet_call_counter()
+    set_cabinet_call_counter(None)
+    return counter
+
+
+def bind_cabinet_call_counter(func):
+    """
+    Wraps the function so that the cabinet calls it makes (from whichever thread it is run on) are counted against the
+    cabinet call counter of the current thread
+    """
+    counter = get_cabinet_call_counter()
+
+    def bound_func(*args, **kwargs):
+        previous_counter = get_cabinet_call_counter()
+        set_cabinet_call_counter(counter)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            set_cabinet_call_counter(previous_counter)
+
+    return bound_func
+
+
+class CabinetCall(object):
+    def __init__(self, operation, url):
+        self.operation = operation
+        self.data_type = get_cabinet_data_type(url)
+        self.size = None  # bytes sent or received, set by the caller once known
+
+
+@contextmanager
+def cabinet_call(operation, url):
+    """
+    Reports the cabinet call made within the block. The payload size is reported if it is set on the yielded call
+    """
+    call = CabinetCall(operation, url)
+    start = time.time()
+    status = 'error'
+    try:
+        yield call
+        status = 'ok'
+    finally:
+        tags = ['operation:%s' % call.operation, 'data_type:%s' % call.data_type, 'status:%s' % status]
+        statsd.histogram('cabinet.call.latency', (time.time() - start) * 1000, tags=tags)
+        if call.size is not None:
+            statsd.histogram('cabinet.call.bytes', call.size, tags=tags)
+
+        counter = get_cabinet_call_counter()
+        if counter is not None:
+            counter.add_call(call.operation, call.data_type, call.size or 0)
+
+
+def count_cabinet_cache_lookup(hit):
+    counter = get_cabinet_call_counter()
+    if counter is not None:
+        counter.add_cache_lookup(hit)
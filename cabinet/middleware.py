@@ -0,0 +1,29 @@
+from datadog import statsd
+from django.utils.deprecation import MiddlewareMixin
+
+from cabinet.metrics import start_cabinet_call_counter, stop_cabinet_call_counter
+from openshiksha import settings
+
+
+class CabinetCallsMiddleware(MiddlewareMixin):
+    """
+    Counts the cabinet round trips made while handling each request. The counts are reported to statsd and (with
+    CABINET_CALLS_HEADER) sent back in the X-Cabinet-* debug headers
+    """
+
+    def process_request(self, request):
+        start_cabinet_call_counter()
+
+    def process_response(self, request, response):
+        counter = stop_cabinet_call_counter()
+        if counter is None:
+            return response  # the request never got to this middleware
+
+        statsd.histogram('cabinet.request.calls', counter.calls)
+        statsd.histogram('cabinet.request.bytes', counter.bytes)
+
+        if settings.CABINET_CALLS_HEADER:
+            response['X-Cabinet-Calls'] = str(counter.calls)
+            response['X-Cabinet-Bytes'] = str(counter.bytes)
+            response['X-Cabinet-Cache'] = '%s hits, %s misses' % (counter.cache_hits, counter.cache_misses)
+        return response
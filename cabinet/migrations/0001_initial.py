@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionBlob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('hash', models.CharField(help_text=b'The hash of the blob content, also its cabinet name.',
+                                          unique=True, max_length=40)),
+                ('references', models.PositiveIntegerField(default=0,
+                                                           help_text=b'Number of submissions referring to the blob.')),
+            ],
+        ),
+    ]
@@ -1 +1,12 @@
-# Create your models here.
+from django.db import models
+
+
+class QuestionBlob(models.Model):
+    """
+    Reference count of a content-addressed blob of dealt questions in the cabinet (see cabinet.question_blobs)
+    """
+    hash = models.CharField(max_length=40, unique=True, help_text='The hash of the blob content, also its cabinet name.')
+    references = models.PositiveIntegerField(default=0, help_text='Number of submissions referring to the blob.')
+
+    def __unicode__(self):
+        return unicode("%s (%s references)" % (self.hash, self.references))
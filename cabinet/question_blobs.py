@@ -0,0 +1,64 @@
+# This file provides the content addressing of dealt question sets stored in the cabinet
+#
+# Submissions of an assignment often have exactly the same dealt questions (always when the AQL has no variable
+# constraints) and only differ in the order of the questions and the order of the options of their MCQ subparts. The
+# question set is stored once as a blob named by the hash of its content, with the questions ordered by pk and without
+# any option orders, while each submission only keeps a small reference holding the blob hash and its own orders
+#
+# Blobs never hold the secure image urls dealt into the questions (signed per time bucket, so the same questions would
+# get a new blob every bucket) - they hold the cabinet urls of the images instead, listed in the blob so that they are
+# signed again when the blob is read (see cabinet_api.build_unsigned_question_blob)
+import hashlib
+import json
+
+from core.utils.json import dump_json_string_canonical, dump_json_string_compact
+
+
+def build_question_blob(questions, img_urls=()):
+    """
+    Splits the dealt questions of a submission into the shared blob data and the submission specific reference data
+    @param img_urls: cabinet urls of the images in the questions, to be signed when the blob is read
+    @return: (blob hash, blob data, reference data)
+    """
+    # plain data so that the option orders can be taken out without touching the data models
+    questions_data = json.loads(dump_json_string_compact(questions))
+
+    references = []
+    for question_data in questions_data:
+        options_orders = []
+        for subpart_data in question_data['subparts']:
+            options_data = subpart_data.get('options')
+            options_orders.append(None if options_data is None else options_data.pop('order', None))
+        references.append({'pk': question_data['pk'], 'options_orders': options_orders})
+
+    blob_data = {'questions': sorted(questions_data, key=lambda question_data: question_data['pk']),
+                 'img_urls': sorted(img_urls)}
+    blob_hash = hashlib.sha1(dump_json_string_canonical(blob_data)).hexdigest()
+
+    return blob_hash, blob_data, {'blob': blob_hash, 'questions': references}
+
+
+def is_question_blob_reference(data):
+    return 'blob' in data
+
+
+def assemble_questions_data(blob_data, reference_data):
+    """
+    Rebuilds the questions data of a submission (in the submission's order, with its option orders) from the blob data
+    and the submission's reference data. The blob data is left untouched as it can be shared through the cabinet cache
+    """
+    blob_questions_data = dict((question_data['pk'], question_data) for question_data in blob_data['questions'])
+
+    questions_data = []
+    for reference in reference_data['questions']:
+        blob_question_data = blob_questions_data[reference['pk']]
+
+        subparts_data = []
+        for subpart_data, options_order in zip(blob_question_data['subparts'], reference['options_orders']):
+            if options_order is not None:
+                subpart_data = dict(subpart_data, options=dict(subpart_data['options'], order=options_order))
+            subparts_data.append(subpart_data)
+
+        questions_data.append(dict(blob_question_data, subparts=subparts_data))
+
+    return questions_data
@@ -0,0 +1,39 @@
+# This file provides the on-disk format of submission files in the cabinet
+#
+# Submission files are written as a version header line followed by the zlib compressed, minified json of the
+# submission. Submission files written before the header existed are plain (pretty-printed) json, and are still read
+# transparently - they are recognized by the missing header
+import json
+import zlib
+
+from cabinet.exceptions import CabinetSubmissionFormatError
+from core.utils.json import dump_json_string_compact
+from openshiksha import settings
+
+SUBMISSION_FORMAT_MAGIC = 'OSSUB'
+SUBMISSION_FORMAT_VERSION = 1
+SUBMISSION_FORMAT_HEADER = '%s%s\n' % (SUBMISSION_FORMAT_MAGIC, SUBMISSION_FORMAT_VERSION)
+
+
+def encode_submission(submission_dm):
+    return SUBMISSION_FORMAT_HEADER + zlib.compress(dump_json_string_compact(submission_dm),
+                                                    settings.CABINET_SUBMISSION_COMPRESSION_LEVEL)
+
+
+def is_legacy_submission(raw):
+    return not raw.startswith(SUBMISSION_FORMAT_MAGIC)
+
+
+def decode_submission(raw):
+    """
+    Returns the submission data (dictionary) from the raw contents of a submission file in either format
+    """
+    if is_legacy_submission(raw):
+        return json.loads(raw)
+
+    header_end = raw.index('\n')
+    version = raw[len(SUBMISSION_FORMAT_MAGIC):header_end]
+    if version != str(SUBMISSION_FORMAT_VERSION):
+        raise CabinetSubmissionFormatError(version)
+
+    return json.loads(zlib.decompress(raw[header_end + 1:]))
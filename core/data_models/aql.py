@@ -10,10 +10,9 @@ class AQLMetaDM(object):
         self.revision = data['revision']
         self.pk = pk
 
-    def prep_render(self, user):
+    def prep_render(self):
         """
         substitutes in any secure img urls into the revision string and marks it as safe html
-        @param user:
         @return:
         """
         from cabinet.cabinet_api import get_aql_meta_img_url_secure
@@ -29,7 +28,7 @@ class AQLMetaDM(object):
         # now build secure urls for all of them
         secure_img_urls = []
         for img_filename in img_filenames:
-            secure_img_urls.append(get_aql_meta_img_url_secure(user, assignment_questions_list, img_filename))
+            secure_img_urls.append(get_aql_meta_img_url_secure(assignment_questions_list, img_filename))
 
         # now sub them back into the revision string
         self.revision = sub_substitution_tags(self.revision, secure_img_urls)
@@ -34,19 +34,19 @@ class QuestionElem(JSONModel):
         self.img = img
         self.img_url = img_url
 
-    def build_img_url(self, user, question, question_data_type):
+    def build_img_url(self, question, question_data_type):
         """
         This is done as a seperate step and not during initialization so that the QuestionElem creation is not dependant
-        on extra contextual data such as user that the cabinet needs to build the secure url
+        on extra contextual data such as the question that the cabinet needs to build the secure url
         """
         if self.img is not None:
             from cabinet import cabinet_api
-            self.img_url = cabinet_api.get_question_img_url_secure(user, question, question_data_type, self.img)
+            self.img_url = cabinet_api.get_question_img_url_secure(question, question_data_type, self.img)
         else:
             self.img_url = None
 
         if self.text is not None:
-            self.text = mark_safe(add_img_reloader(substitute_img(self.text, user, question, question_data_type)))
+            self.text = mark_safe(add_img_reloader(substitute_img(self.text, question, question_data_type)))
 
     def is_plaintext(self):
         """
@@ -99,11 +99,11 @@ class QuestionDM(JSONModel):
         self.container = container
         self.subparts = subparts
 
-    def build_img_urls(self, user):
+    def build_img_urls(self):
         question = Question.objects.get(pk=self.pk)
-        self.container.build_img_urls(user, question)
+        self.container.build_img_urls(question)
         for subpart in self.subparts:
-            subpart.build_img_urls(user, question)
+            subpart.build_img_urls(question)
 
     def get_protected_subparts(self):
         return [subpart.get_protected() for subpart in self.subparts]
@@ -119,11 +119,11 @@ class QuestionContainer(JSONModel):
 
         self.subparts = data['subparts']
 
-    def build_img_urls(self, user, question):
+    def build_img_urls(self, question):
         if self.hint is not None:
-            self.hint.build_img_url(user, question, OpenShikshaQuestionDataType.CONTAINER)
+            self.hint.build_img_url(question, OpenShikshaQuestionDataType.CONTAINER)
         if self.content is not None:
-            self.content.build_img_url(user, question, OpenShikshaQuestionDataType.CONTAINER)
+            self.content.build_img_url(question, OpenShikshaQuestionDataType.CONTAINER)
 
 class QuestionPart(JSONModel):
     """
@@ -141,12 +141,12 @@ class QuestionPart(JSONModel):
         self.hint = QuestionElem.from_data(data.get("hint"))
         self.solution = QuestionElem.from_data(data.get("solution"))
 
-    def build_img_urls(self, user, question):
-        self.content.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+    def build_img_urls(self, question):
+        self.content.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
         if self.hint is not None:
-            self.hint.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            self.hint.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
         if self.solution is not None:
-            self.solution.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            self.solution.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
     def get_protected(self):
         raise NotImplementedError("subclass of QuestionPart must implement method get_protected")
@@ -171,9 +171,9 @@ class MCOptions(JSONModel):
     def get_option_count(self):
         return len(self.incorrect)
 
-    def build_img_urls(self, user, question):
+    def build_img_urls(self, question):
         for option in self.incorrect:
-            option.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            option.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
     def evaluate_substitute(self, variable_values):
         for option in self.incorrect:
@@ -188,9 +188,9 @@ class MCSAOptions(MCOptions):
         if self.use_dropdown_widget:
             assert self.all_options_plaintext()
 
-    def build_img_urls(self, user, question):
-        super(MCSAOptions, self).build_img_urls(user, question)
-        self.correct.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+    def build_img_urls(self, question):
+        super(MCSAOptions, self).build_img_urls(question)
+        self.correct.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
     def evaluate_substitute(self, variable_values):
         super(MCSAOptions, self).evaluate_substitute(variable_values)
@@ -227,10 +227,10 @@ class MCMAOptions(MCOptions):
         # NOTE: correct option before incorrect
         return len(self.correct) + super(MCMAOptions, self).get_option_count()
 
-    def build_img_urls(self, user, question):
-        super(MCMAOptions, self).build_img_urls(user, question)
+    def build_img_urls(self, question):
+        super(MCMAOptions, self).build_img_urls(question)
         for option in self.correct:
-            option.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            option.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
     def evaluate_substitute(self, variable_values):
         super(MCMAOptions, self).evaluate_substitute(variable_values)
@@ -239,9 +239,9 @@ class MCMAOptions(MCOptions):
 
 
 class MCQuestionPart(QuestionPart):
-    def build_img_urls(self, user, question):
-        super(MCQuestionPart, self).build_img_urls(user, question)
-        self.options.build_img_urls(user, question)
+    def build_img_urls(self, question):
+        super(MCQuestionPart, self).build_img_urls(question)
+        self.options.build_img_urls(question)
 
     def evaluate_substitute(self, variable_values):
         super(MCQuestionPart, self).evaluate_substitute(variable_values)
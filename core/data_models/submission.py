@@ -32,9 +32,19 @@ class SubmissionDM(JSONModel):
     @classmethod
     def build_from_data(cls, data):
         # NOTE: A saved submission already has its questions and options ordered (subparts are ALWAYS ordered)
-        questions = [QuestionDM.from_data(x) for x in data['questions']]
+        questions = cls.build_questions_from_data(data['questions'])
+        return cls(questions, cls.build_answers_from_data(questions, data['answers']))
 
-        answers_data = data['answers']
+    @classmethod
+    def build_questions_from_data(cls, questions_data):
+        return [QuestionDM.from_data(x) for x in questions_data]
+
+    @classmethod
+    def build_answers_from_data(cls, questions, answers_data):
+        """
+        Answers are built against the (already built) questions of the submission as the answer type of each subpart
+        depends on the type of the subpart
+        """
         assert len(questions) == len(answers_data)
 
         answers = []  # building a new list to store lists of Answer data models
@@ -64,7 +74,7 @@ class SubmissionDM(JSONModel):
                 subparts_answers.append(subpart_answer)
             answers.append(subparts_answers)
 
-        return cls(questions, answers)
+        return answers
 
     def __init__(self, questions, answers):
         self.answers = answers
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0014_openstudenthighest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentquestionslist',
+            name='bundle_hash',
+            field=models.CharField(default=b'', max_length=40, blank=True,
+                                   help_text=b'Content hash of the current cabinet bundle of this Assignment Questions List (blank if it has none).'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0015_assignmentquestionslist_bundle_hash'),
+    ]
+
+    operations = [
+        # the assignments created before dealing versions keep dealing their seeds with version 1
+        migrations.AddField(
+            model_name='assignment',
+            name='dealing_version',
+            field=models.PositiveIntegerField(default=1,
+                                              help_text=b'Version of the dealing (see croupier.dealing) the questions of this assignment are dealt with.'),
+        ),
+        migrations.AlterField(
+            model_name='assignment',
+            name='dealing_version',
+            field=models.PositiveIntegerField(default=2,
+                                              help_text=b'Version of the dealing (see croupier.dealing) the questions of this assignment are dealt with.'),
+        ),
+    ]
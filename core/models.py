@@ -8,6 +8,7 @@ from django.db import models
 from core.utils.labels import get_classroom_label, get_subjectroom_label, get_user_label
 from core.utils.references import OpenShikshaGroup, OpenShikshaOpen
 from core.utils.user_checks import is_openshiksha_team_admin
+from croupier.dealing import DEALING_VERSION
 from openshiksha.exceptions import InvalidContentTypeError
 from openshiksha.settings import MAX_CHARFIELD_LENGTH
 
@@ -168,6 +169,8 @@ class AssignmentQuestionsList(models.Model):
     chapter = models.ForeignKey(Chapter, help_text='The Chapter that this Assignment Questions List pertains to.')
     description = models.TextField(max_length=MAX_TEXTFIELD_LENGTH,
                                    help_text='A brief description/listing of the topics covered by this Assignment Question List.')
+    bundle_hash = models.CharField(max_length=40, blank=True, default='',
+                                   help_text='Content hash of the current cabinet bundle of this Assignment Questions List (blank if it has none).')
 
     def __unicode__(self):
         return unicode('%s - %s - %s - %s' % (self.school.pk, self.standard, self.subject, self.get_title()))
@@ -196,6 +199,8 @@ class Assignment(models.Model):
                                    validators=FRACTION_VALIDATOR)
     number = models.PositiveIntegerField(
         help_text='A positive integer used to disinguish Assignments using the same AssignmentQuestionsList in the same subjectroom.')
+    dealing_version = models.PositiveIntegerField(default=DEALING_VERSION,
+                                                  help_text='Version of the dealing (see croupier.dealing) the questions of this assignment are dealt with.')
 
     def __unicode__(self):
         return unicode('%s - ASN %u' % (self.content_object.__unicode__(), self.pk))
@@ -2,3 +2,28 @@ class TCData(object):
     def __init__(self, input, expected_output=None):
         self.input = input
         self.expected_output = expected_output
+
+
+class CabinetCallBudget(object):
+    """
+    Asserts that the code run within stays under a budget of cabinet round trips (cache hits are free), e.g.
+        with CabinetCallBudget(self, 3):
+            response = submission_id_get(request, submission_id)
+    """
+
+    def __init__(self, test_case, max_calls):
+        self.test_case = test_case
+        self.max_calls = max_calls
+        self.counter = None
+
+    def __enter__(self):
+        from cabinet.metrics import start_cabinet_call_counter
+        self.counter = start_cabinet_call_counter()
+        return self.counter
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from cabinet.metrics import stop_cabinet_call_counter
+        stop_cabinet_call_counter()
+        if exc_type is None:
+            self.test_case.assertLessEqual(self.counter.calls, self.max_calls, 'Made %s cabinet calls (budget %s): %s' % (
+                self.counter.calls, self.max_calls, dict(self.counter.calls_by_data_type)))
@@ -9,6 +9,7 @@ import getpass
 from django.test import TestCase
 from sh import git
 
+from cabinet.cabinet_api import get_img_url_secure, CABINET_ENDPOINT
 from cabinet.cabinet_maintenance import delete_submission
 from core.utils.constants import OpenShikshaEnv
 from openshiksha import settings
@@ -178,7 +179,7 @@ class BasicSanityTest(TestCase):
         self.check_template_response_code('/password/', 'authenticated/password.html', 200)
         self.check_template_response_code('/assignment/', '404.html', 404)
         self.check_template_response_code('/assignment/override/', '404.html', 404)
-        self.check_response_code('/secure-static/b2FzaXNfdmFsaTpodHRwOi8vbG9jYWxob3N0Ojk4NzgvcXVlc3Rpb25zL2NvbnRhaW5lcnMvMS8xLzgvMS8xL2ltZy8xLnBuZzpUV1dqeVl2ejR3MC0yQzNueWpkcWltZHFBams/', 200)
+        self.check_response_code(get_img_url_secure(CABINET_ENDPOINT + 'questions/containers/1/1/8/1/1/img/1.png'), 200)
 
         self.check_json_response_code('/ajax/announcements/', 200)
         self.check_json_response_code('/ajax/question-set-choice-widget/', 404)
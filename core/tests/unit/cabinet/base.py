@@ -0,0 +1,53 @@
+from cStringIO import StringIO
+
+from mock import NonCallableMagicMock
+from PIL import Image
+
+from core.utils.constants import OpenShikshaQuestionType
+
+
+def build_question_mock(pk):
+    question = NonCallableMagicMock()
+    question.pk = pk
+    question.school.board.pk = 1
+    question.school.pk = 1
+    question.standard.number = 6
+    question.subject.pk = 1
+    question.chapter.pk = 1
+    return question
+
+
+def build_subpart_data(subpart_index):
+    return {
+        'type': OpenShikshaQuestionType.TEXTUAL,
+        'content': {'text': 'subpart %s' % subpart_index},
+        'subpart_index': subpart_index,
+        'answer': 'answer'
+    }
+
+
+def build_mcsa_subpart_data(subpart_index, options_order):
+    return {
+        'type': OpenShikshaQuestionType.MCSA,
+        'content': {'text': 'subpart %s' % subpart_index},
+        'subpart_index': subpart_index,
+        'options': {'correct': {'text': 'yes'}, 'incorrect': [{'text': 'no'}, {'text': 'maybe'}],
+                    'order': options_order}
+    }
+
+
+def build_submission_mock(pk):
+    submission = NonCallableMagicMock()
+    submission.pk = pk
+    submission.assignment.pk = 2
+    submission.assignment.get_classroom.return_value.school.pk = 1
+    submission.assignment.get_classroom.return_value.standard.number = 6
+    submission.assignment.get_classroom.return_value.division = 'A'
+    submission.assignment.assignmentQuestionsList.subject.pk = 1
+    return submission
+
+
+def build_image_data(width, height, image_format):
+    output = StringIO()
+    Image.new('RGB', (width, height), (255, 0, 0)).save(output, image_format)
+    return output.getvalue()
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import patch, NonCallableMagicMock
+from requests import RequestException
+
+from cabinet.backends import FileSystemCabinetBackend, CabinetWriteMode, HttpCabinetBackend
+from cabinet.circuit_breaker import CircuitBreakerState
+from cabinet.exceptions import Cabinet404Error, CabinetSubmissionExistsError, CabinetSubmissionMissingError, \
+    CabinetConnectionError
+from openshiksha import settings
+
+
+class FileSystemCabinetBackendTest(TestCase):
+    ENDPOINT = 'http://localhost:9878/'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend = FileSystemCabinetBackend(FileSystemCabinetBackendTest.ENDPOINT, self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_write_read_delete(self):
+        url = FileSystemCabinetBackendTest.ENDPOINT + 'submissions/1/6/A/1/2/3.json'
+        self.assertRaises(Cabinet404Error, self.backend.read, url)
+        self.assertFalse(self.backend.exists(url))
+
+        for data in ['{}', '{"answers": [[null, null], [null]]}']:
+            self.backend.write(url, data)
+            self.assertEqual(self.backend.read(url), data)
+        self.assertTrue(self.backend.exists(url))
+
+        self.backend.delete(url)
+        self.assertRaises(Cabinet404Error, self.backend.read, url)
+        self.assertFalse(self.backend.exists(url))
+        self.backend.delete(url)  # deleting a missing file is not an error
+
+    def test_stream(self):
+        url = FileSystemCabinetBackendTest.ENDPOINT + 'images/1/a.png'
+        self.assertRaises(Cabinet404Error, self.backend.stream, url, 4)
+
+        self.backend.write(url, '0123456789')
+        self.assertEqual(list(self.backend.stream(url, 4)), ['0123', '4567', '89'])
+
+    def test_conditional_writes(self):
+        url = FileSystemCabinetBackendTest.ENDPOINT + 'submissions/1/6/A/1/2/3.json'
+        self.assertRaises(CabinetSubmissionMissingError, self.backend.write, url, '{"v": 1}', None,
+                          CabinetWriteMode.UPDATE)
+        self.assertRaises(Cabinet404Error, self.backend.read, url)
+
+        self.backend.write(url, '{"v": 1}', mode=CabinetWriteMode.CREATE)
+        self.assertRaises(CabinetSubmissionExistsError, self.backend.write, url, '{"v": 2}', None,
+                          CabinetWriteMode.CREATE)
+        self.assertEqual(self.backend.read(url), '{"v": 1}')
+
+        self.backend.write(url, '{"v": 3}', mode=CabinetWriteMode.UPDATE)
+        self.assertEqual(self.backend.read(url), '{"v": 3}')
+        self.assertEqual(os.listdir(os.path.dirname(self.backend.build_path(url))), ['3.json'])  # no tmp files left
+
+    def test_urls_outside_cabinet(self):
+        self.assertRaises(Cabinet404Error, self.backend.read, 'http://elsewhere:9878/questions/1.json')
+        self.assertRaises(Cabinet404Error, self.backend.read, FileSystemCabinetBackendTest.ENDPOINT + '../etc/passwd')
+        self.assertFalse(self.backend.exists(FileSystemCabinetBackendTest.ENDPOINT + '../etc/passwd'))
+
+
+class HttpCabinetBackendTest(TestCase):
+    URL = 'http://localhost:9878/submissions/1/6/A/1/2/3.json'
+
+    def write(self, status_code, mode, conditional_writes=True, head_status_code=None):
+        with patch('cabinet.backends.get_session') as get_session_mock, \
+                patch.object(settings, 'CABINET_CONDITIONAL_WRITES', conditional_writes):
+            get_session_mock.return_value.put.return_value.status_code = status_code
+            get_session_mock.return_value.head.return_value.status_code = head_status_code
+            HttpCabinetBackend().write(HttpCabinetBackendTest.URL, '{}', mode=mode)
+            return get_session_mock.return_value
+
+    def test_conditional_headers(self):
+        session = self.write(201, CabinetWriteMode.CREATE)
+        self.assertEqual(session.put.call_args[1]['headers'], {'If-None-Match': '*'})
+        session = self.write(204, CabinetWriteMode.UPDATE)
+        self.assertEqual(session.put.call_args[1]['headers'], {'If-Match': '*'})
+        self.assertFalse(session.head.called)
+
+    def test_precondition_failed(self):
+        self.assertRaises(CabinetSubmissionExistsError, self.write, 412, CabinetWriteMode.CREATE)
+        self.assertRaises(CabinetSubmissionMissingError, self.write, 412, CabinetWriteMode.UPDATE)
+
+    def test_create_moved_into_place(self):
+        with patch('cabinet.backends.get_session') as get_session_mock, \
+                patch.object(settings, 'CABINET_CONDITIONAL_WRITES', False):
+            session = get_session_mock.return_value
+            session.put.return_value.status_code = 201
+            session.request.return_value.status_code = 201
+            HttpCabinetBackend().write(HttpCabinetBackendTest.URL, '{}', mode=CabinetWriteMode.CREATE)
+
+            tmp_url = session.put.call_args[0][0]
+            self.assertTrue(tmp_url.startswith(HttpCabinetBackendTest.URL + '.'))
+            self.assertEqual(session.request.call_args[0], ('MOVE', tmp_url))
+            self.assertEqual(session.request.call_args[1]['headers'],
+                             {'Destination': '/submissions/1/6/A/1/2/3.json', 'Overwrite': 'F'})
+            self.assertFalse(session.head.called)
+            self.assertFalse(session.delete.called)
+
+            # the file exists - it is never replaced, and the temporary file is removed
+            session.request.return_value.status_code = 412
+            self.assertRaises(CabinetSubmissionExistsError, HttpCabinetBackend().write, HttpCabinetBackendTest.URL,
+                              '{}', None, CabinetWriteMode.CREATE)
+            self.assertEqual(session.delete.call_args[0][0], session.put.call_args[0][0])
+
+    def test_update_existence_checked(self):
+        session = self.write(204, CabinetWriteMode.UPDATE, False, 200)
+        self.assertEqual(session.put.call_args[1]['headers'], {})
+
+        # the file is never written when the check fails
+        with patch('cabinet.backends.get_session') as get_session_mock, \
+                patch.object(settings, 'CABINET_CONDITIONAL_WRITES', False):
+            get_session_mock.return_value.head.return_value.status_code = 404
+            self.assertRaises(CabinetSubmissionMissingError, HttpCabinetBackend().write, HttpCabinetBackendTest.URL,
+                              '{}', None, CabinetWriteMode.UPDATE)
+            self.assertFalse(get_session_mock.return_value.put.called)
+
+    def test_update_race_detected(self):
+        # the file was removed between the existence check and the write
+        with patch('cabinet.backends.get_session') as get_session_mock, \
+                patch.object(settings, 'CABINET_CONDITIONAL_WRITES', False):
+            get_session_mock.return_value.put.return_value.status_code = 201
+            get_session_mock.return_value.head.return_value.status_code = 200
+            self.assertRaises(CabinetSubmissionMissingError, HttpCabinetBackend().write, HttpCabinetBackendTest.URL,
+                              '{}', None, CabinetWriteMode.UPDATE)
+            # the file written is never deleted again, it may be another writer's
+            self.assertFalse(get_session_mock.return_value.delete.called)
+
+    def build_response(self, status_code):
+        response = NonCallableMagicMock()
+        response.status_code = status_code
+        response.content = 'content'
+        return response
+
+    def test_get_retries(self):
+        with patch('cabinet.backends.get_session') as get_session_mock, patch('time.sleep') as sleep_mock:
+            get_session_mock.return_value.get.side_effect = [RequestException(), self.build_response(503),
+                                                             self.build_response(200)]
+            self.assertEqual(HttpCabinetBackend().read(HttpCabinetBackendTest.URL), 'content')
+            self.assertEqual(get_session_mock.return_value.get.call_count, 3)
+            self.assertEqual(sleep_mock.call_count, 2)
+            for call in sleep_mock.call_args_list:
+                self.assertTrue(0 <= call[0][0] <= settings.CABINET_RETRY_BACKOFF_MAX)
+
+            get_session_mock.return_value.get.side_effect = [self.build_response(503)] * 3
+            self.assertRaises(CabinetConnectionError, HttpCabinetBackend().read, HttpCabinetBackendTest.URL)
+
+    def test_put_not_retried(self):
+        with patch('cabinet.backends.get_session') as get_session_mock:
+            get_session_mock.return_value.put.side_effect = RequestException()
+            self.assertRaises(CabinetConnectionError, HttpCabinetBackend().write, HttpCabinetBackendTest.URL, '{}')
+            self.assertEqual(get_session_mock.return_value.put.call_count, 1)
+
+    def test_breaker_fails_fast(self):
+        backend = HttpCabinetBackend()
+        with patch('cabinet.backends.get_session') as get_session_mock, patch('time.sleep'):
+            get_session_mock.return_value.delete.side_effect = RequestException()
+            for _ in xrange(settings.CABINET_BREAKER_FAILURE_THRESHOLD):
+                self.assertRaises(CabinetConnectionError, backend.delete, HttpCabinetBackendTest.URL)
+
+            get_session_mock.reset_mock()
+            self.assertRaises(CabinetConnectionError, backend.read, HttpCabinetBackendTest.URL)
+            self.assertFalse(get_session_mock.return_value.get.called)
+
+    def test_breaker_unexpected_error(self):
+        backend = HttpCabinetBackend()
+        with patch('cabinet.backends.get_session') as get_session_mock, patch('time.sleep'):
+            get_session_mock.return_value.delete.side_effect = RequestException()
+            for _ in xrange(settings.CABINET_BREAKER_FAILURE_THRESHOLD):
+                self.assertRaises(CabinetConnectionError, backend.delete, HttpCabinetBackendTest.URL)
+
+            # the trial call fails with something other than a RequestException
+            get_session_mock.return_value.get.side_effect = ValueError()
+            with patch('time.time', return_value=time.time() + settings.CABINET_BREAKER_RESET_TIMEOUT):
+                self.assertRaises(ValueError, backend.read, HttpCabinetBackendTest.URL)
+            self.assertEqual(backend.breaker.state, CircuitBreakerState.OPEN)
+
+            # and the breaker lets the next trial call through once the reset timeout has passed again
+            get_session_mock.return_value.get.side_effect = [self.build_response(200)]
+            with patch('time.time', return_value=time.time() + 2 * settings.CABINET_BREAKER_RESET_TIMEOUT):
+                self.assertEqual(backend.read(HttpCabinetBackendTest.URL), 'content')
+            self.assertEqual(backend.breaker.state, CircuitBreakerState.CLOSED)
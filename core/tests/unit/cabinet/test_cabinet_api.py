@@ -0,0 +1,351 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.utils.http import urlsafe_base64_encode
+from mock import patch
+
+from cabinet import cabinet_api
+from cabinet.backends import FileSystemCabinetBackend, CabinetWriteMode
+from cabinet.cabinet_cache import LRUByteCache, CabinetCache
+from cabinet.exceptions import SubpartOutOfOrderException, Cabinet404Error, CabinetSubmissionExistsError, \
+    CabinetSubmissionMissingError
+from cabinet.submission_format import encode_submission, decode_submission
+from core.data_models.submission import SubmissionDM
+from core.tests.unit.cabinet.base import build_question_mock, build_subpart_data, build_submission_mock, \
+    build_image_data
+from core.utils.json import dump_json_string
+from croupier import constraints, croupier_api
+from croupier.constraints import ConstraintsPlanCache
+from openshiksha import settings
+
+
+class GetQuestionsTest(TestCase):
+    def setUp(self):
+        # cabinet files keyed by the last two components of their url
+        self.cabinet_files = {
+            'containers/1.json': {'subparts': [11, 12]},
+            'containers/2.json': {'subparts': [21]},
+            'containers/3.json': {'subparts': [31, 32, 33]},
+            'raw/11.json': build_subpart_data(0),
+            'raw/12.json': build_subpart_data(1),
+            'raw/21.json': build_subpart_data(0),
+            'raw/31.json': build_subpart_data(0),
+            'raw/32.json': build_subpart_data(1),
+            'raw/33.json': build_subpart_data(2),
+        }
+
+    def get_resource_content(self, url):
+        url_components = url.split('/')
+        return self.cabinet_files[url_components[-7] + '/' + url_components[-1]]
+
+    def test_get_questions(self):
+        with patch.object(cabinet_api, 'get_cached_resource_content', side_effect=self.get_resource_content):
+            undealt_question_dms = cabinet_api.get_questions([build_question_mock(pk) for pk in [3, 1, 2]])
+
+        self.assertEqual([dm.question_data.pk for dm in undealt_question_dms], [3, 1, 2])
+        self.assertEqual([len(dm.question_data.subparts) for dm in undealt_question_dms], [3, 2, 1])
+        for undealt_question_dm in undealt_question_dms:
+            for i, subpart in enumerate(undealt_question_dm.question_data.subparts):
+                self.assertEqual(subpart.subpart_index, i)
+
+    def get_resource_content_with_bundle(self, url):
+        if '/aql_bundle/' in url:
+            return cabinet_api.build_aql_bundle_data([
+                cabinet_api.build_aql_bundle_question_data(1, self.cabinet_files['containers/1.json'],
+                                                           [self.cabinet_files['raw/11.json'],
+                                                            self.cabinet_files['raw/12.json']])
+            ])
+        return self.get_resource_content(url)
+
+    def test_build_undealt_assignment_with_bundle(self):
+        assignment_questions_list = build_question_mock(7)
+        assignment_questions_list.bundle_hash = 'abc'
+        assignment_questions_list.questions.all.return_value = [build_question_mock(pk) for pk in [2, 1, 3]]
+
+        with patch.object(cabinet_api, 'get_cached_resource_content',
+                          side_effect=self.get_resource_content_with_bundle) as get_cached_resource_content_mock, \
+                patch('core.data_models.question.QuestionDM.build_img_urls'), \
+                patch.object(cabinet_api.time, 'time', side_effect=[10.0, 10.25]), \
+                patch.object(cabinet_api.statsd, 'timing') as timing_mock:
+            undealt_question_dms = cabinet_api.build_undealt_assignment(assignment_questions_list)
+
+        self.assertEqual([dm.question_data.pk for dm in undealt_question_dms], [2, 1, 3])
+        self.assertEqual([len(dm.question_data.subparts) for dm in undealt_question_dms], [1, 2, 3])
+        # bundled question 1 was not fetched file by file
+        fetched_urls = [call[0][0] for call in get_cached_resource_content_mock.call_args_list]
+        self.assertFalse(any(url.endswith('/containers/1/1/6/1/1/1.json') for url in fetched_urls))
+        self.assertFalse(any(url.endswith('/11.json') or url.endswith('/12.json') for url in fetched_urls))
+        # timings are sent in milliseconds
+        timing_mock.assert_any_call('cabinet.get.assignment.fetch', 250.0, tags=['aql:7'])
+
+    def test_build_aql_bundle(self):
+        assignment_questions_list = build_question_mock(7)
+        assignment_questions_list.bundle_hash = ''
+        assignment_questions_list.questions.all.return_value = [build_question_mock(1)]
+        self.assertIsNone(cabinet_api.get_aql_bundle(assignment_questions_list))
+
+        bundle_urls = []
+        for _ in xrange(2):
+            with patch.object(cabinet_api, 'get_cached_resource_content', side_effect=self.get_resource_content), \
+                    patch.object(cabinet_api, 'cabinet_put') as cabinet_put_mock:
+                cabinet_api.build_aql_bundle(assignment_questions_list)
+            assignment_questions_list.save.assert_called_with(update_fields=['bundle_hash'])
+            bundle_urls.append(cabinet_put_mock.call_args[0][0])
+        # the url of a bundle only depends on its content
+        self.assertEqual(bundle_urls[0], bundle_urls[1])
+        self.assertTrue(
+            bundle_urls[0].endswith('/aql_bundle/1/1/6/1/7/%s.json' % assignment_questions_list.bundle_hash))
+
+        self.cabinet_files['raw/12.json'] = dict(build_subpart_data(1), answer='changed')
+        with patch.object(cabinet_api, 'get_cached_resource_content', side_effect=self.get_resource_content), \
+                patch.object(cabinet_api, 'cabinet_put') as cabinet_put_mock:
+            cabinet_api.build_aql_bundle(assignment_questions_list)
+        self.assertNotEqual(cabinet_put_mock.call_args[0][0], bundle_urls[0])
+
+    def test_plans_of_chapters_sharing_subpart_numbers(self):
+        # subparts are numbered within their chapter, so both questions have a subpart 11 and 12
+        questions = [build_question_mock(1), build_question_mock(1)]
+        questions[1].chapter.pk = 2
+        subparts_data = [[dict(build_subpart_data(0), variable_constraints={'a': {'options': [chapter]}}),
+                          build_subpart_data(1)] for chapter in [1, 2]]
+
+        plan_cache = ConstraintsPlanCache(10)
+        with patch.object(constraints, 'CONSTRAINTS_PLAN_CACHE', plan_cache), \
+                patch.object(constraints, 'SubpartConstraintsPlan', wraps=constraints.SubpartConstraintsPlan) as \
+                plan_mock:
+            for _ in xrange(3):
+                for question, question_subparts_data in zip(questions, subparts_data):
+                    undealt_question_dm = cabinet_api.build_undealt_question(question, {'subparts': [11, 12]},
+                                                                             question_subparts_data)
+                    undealt_question_dm.variable_constraints_list[0].process(croupier_api.build_rng(1))
+                    self.assertEqual(undealt_question_dm.variable_constraints_list[0].values,
+                                     {'a': question.chapter.pk})
+
+        # compiled once per subpart, never replacing the plan of the other chapter
+        self.assertEqual(plan_mock.call_count, 4)
+
+    def test_get_questions_subpart_out_of_order(self):
+        self.cabinet_files['containers/3.json'] = {'subparts': [31, 33, 32]}
+
+        with patch.object(cabinet_api, 'get_cached_resource_content', side_effect=self.get_resource_content):
+            self.assertRaises(SubpartOutOfOrderException, cabinet_api.get_questions,
+                              [build_question_mock(pk) for pk in [1, 3]])
+
+
+class SubmissionFilesTest(TestCase):
+    SUBMISSION_DATA = {
+        'questions': [{'pk': 1, 'container': {'subparts': [11]}, 'subparts': [build_subpart_data(0)]}],
+        'answers': [[{'value': None, 'correct': None}]]
+    }
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend_patch = patch.object(cabinet_api, 'CABINET_BACKEND',
+                                          FileSystemCabinetBackend(cabinet_api.CABINET_ENDPOINT, self.root))
+        self.backend_patch.start()
+        self.cache_patch = patch.object(cabinet_api, 'CABINET_CACHE', CabinetCache(LRUByteCache(1024 * 1024), None))
+        self.cache_patch.start()
+        self.reference_patch = patch.object(cabinet_api, 'reference_question_blob')
+        self.reference_patch.start()
+        self.submission = build_submission_mock(3)
+
+    def tearDown(self):
+        self.reference_patch.stop()
+        self.cache_patch.stop()
+        self.backend_patch.stop()
+        shutil.rmtree(self.root)
+
+    def build_submission_dm(self):
+        return SubmissionDM.build_from_data(SubmissionFilesTest.SUBMISSION_DATA)
+
+    def test_update_writes_only_answers(self):
+        cabinet_api.build_submission(self.submission, self.build_submission_dm())
+        questions_url = cabinet_api.build_submission_questions_data_url(self.submission)
+        questions_raw = cabinet_api.get_resource(questions_url)
+
+        submission_dm = cabinet_api.get_submission(self.submission)
+        submission_dm.answers[0][0].value = 'answer'
+        with patch.object(cabinet_api, 'cabinet_put', wraps=cabinet_api.cabinet_put) as cabinet_put_mock:
+            cabinet_api.update_submission_answers(self.submission, submission_dm.answers)
+
+        self.assertEqual([call[0][0] for call in cabinet_put_mock.call_args_list],
+                         [cabinet_api.build_submission_answers_data_url(self.submission)])
+        self.assertEqual(cabinet_api.get_resource(questions_url), questions_raw)
+        self.assertEqual(cabinet_api.get_submission(self.submission).answers[0][0].value, 'answer')
+
+    def test_submissions_share_question_blob(self):
+        other_submission = build_submission_mock(4)
+        cabinet_api.build_submission(self.submission, self.build_submission_dm())
+        cabinet_api.build_submission(other_submission, self.build_submission_dm())
+
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'question_blobs'))), 1)
+        self.assertEqual(encode_submission(cabinet_api.get_submission(other_submission)),
+                         encode_submission(self.build_submission_dm()))
+
+    def test_question_blob_without_secure_urls(self):
+        img_url = cabinet_api.CABINET_ENDPOINT + 'questions/raw/1/1/6/1/1/img/a.png'
+        other_submission = build_submission_mock(4)
+        for submission, timestamp in [(self.submission, 1000000), (other_submission, 2000000)]:
+            with patch('time.time', return_value=timestamp):
+                secure_url = cabinet_api.get_img_url_secure(img_url)
+                subpart_data = dict(build_subpart_data(0), content={'text': '<img src="%s"/>' % secure_url,
+                                                                    'img': 'a.png', 'img_url': secure_url})
+                cabinet_api.build_submission(submission, SubmissionDM.build_from_data(
+                    {'questions': [{'pk': 1, 'container': {'subparts': [11]}, 'subparts': [subpart_data]}],
+                     'answers': [[{'value': None, 'correct': None}]]}))
+
+        # dealt in different time buckets, with different secure urls, and still sharing the blob
+        blobs_dir = os.path.join(self.root, 'question_blobs')
+        self.assertEqual(len(os.listdir(blobs_dir)), 1)
+        blob_dir = os.path.join(blobs_dir, os.listdir(blobs_dir)[0])
+        with open(os.path.join(blob_dir, os.listdir(blob_dir)[0]), 'rb') as f:
+            blob_data = decode_submission(f.read())
+        self.assertEqual(blob_data['img_urls'], [img_url])
+        self.assertNotIn(cabinet_api.SECURE_STATIC_URL_PREFIX, dump_json_string(blob_data))
+
+        # signed again for the time bucket the submission is read in
+        with patch('time.time', return_value=3000000):
+            content = cabinet_api.get_submission(other_submission).questions[0].subparts[0].content
+            secure_url = cabinet_api.get_img_url_secure(img_url)
+        self.assertEqual(content.img_url, secure_url)
+        self.assertEqual(content.text, '<img src="%s"/>' % secure_url)
+
+    def test_build_submissions(self):
+        submissions = [build_submission_mock(pk) for pk in [5, 6, 7]]
+        cabinet_api.build_submissions(submissions, [self.build_submission_dm() for _ in submissions])
+
+        self.assertEqual(cabinet_api.reference_question_blob.call_count, 1)
+        self.assertEqual(cabinet_api.reference_question_blob.call_args[0][1], 3)
+        for submission in submissions:
+            self.assertEqual(encode_submission(cabinet_api.get_submission(submission)),
+                             encode_submission(self.build_submission_dm()))
+
+    def test_build_submissions_rollback(self):
+        cabinet_api.build_submission(self.submission, self.build_submission_dm())
+        submissions = [build_submission_mock(5), self.submission, build_submission_mock(7)]
+
+        with patch.object(cabinet_api, 'dereference_question_blob') as dereference_mock:
+            self.assertRaises(CabinetSubmissionExistsError, cabinet_api.build_submissions, submissions,
+                              [self.build_submission_dm() for _ in submissions])
+
+        self.assertEqual(dereference_mock.call_args[0][1], 3)
+        self.assertFalse(cabinet_api.submission_exists(submissions[0]))
+        self.assertFalse(cabinet_api.submission_exists(submissions[2]))
+        self.assertTrue(cabinet_api.submission_exists(self.submission))
+
+    def test_legacy_submission(self):
+        cabinet_api.cabinet_put(cabinet_api.build_submission_data_url(self.submission),
+                                dump_json_string(SubmissionFilesTest.SUBMISSION_DATA))
+        self.assertTrue(cabinet_api.submission_exists(self.submission))
+        submission_dm = cabinet_api.get_submission(self.submission)
+        self.assertEqual(encode_submission(submission_dm), encode_submission(self.build_submission_dm()))
+
+        # the first save splits the legacy file
+        submission_dm.answers[0][0].value = 'answer'
+        cabinet_api.update_submission_answers(self.submission, submission_dm.answers)
+
+        self.assertFalse(cabinet_api.get_resource_exists(cabinet_api.build_submission_data_url(self.submission)))
+        self.assertEqual(cabinet_api.get_submission(self.submission).answers[0][0].value, 'answer')
+        self.assertFalse(cabinet_api.split_legacy_submission(self.submission))
+
+    def test_update_missing_submission(self):
+        self.assertRaises(CabinetSubmissionMissingError, cabinet_api.update_submission_answers, self.submission,
+                          self.build_submission_dm().answers)
+
+
+class StaticContentTest(TestCase):
+    def test_content_type(self):
+        self.assertEqual(cabinet_api.get_static_content_type(cabinet_api.CABINET_ENDPOINT + 'images/a.png'), 'image/png')
+        self.assertEqual(cabinet_api.get_static_content_type(cabinet_api.CABINET_ENDPOINT + 'images/a.jpg'),
+                         'image/jpeg')
+        self.assertEqual(cabinet_api.get_static_content_type(cabinet_api.CABINET_ENDPOINT + 'images/a'),
+                         'application/octet-stream')
+
+    def test_accel_path(self):
+        self.assertEqual(cabinet_api.build_static_accel_path(cabinet_api.CABINET_ENDPOINT + 'questions/raw/a.png'),
+                         '/cabinet-internal/questions/raw/a.png')
+
+
+class SecureImgUrlTest(TestCase):
+    IMG_URL = cabinet_api.CABINET_ENDPOINT + 'questions/raw/1/1/6/1/1/img/a.png'
+
+    def get_token(self, secure_url):
+        return cabinet_api.SECURE_STATIC_URL_REGEX.match(secure_url).group(1)
+
+    def test_same_url_within_bucket(self):
+        bucket = cabinet_api.get_secure_static_bucket(1000000)
+        with patch('time.time', return_value=bucket + 1):
+            secure_url = cabinet_api.get_img_url_secure(SecureImgUrlTest.IMG_URL)
+        with patch('time.time', return_value=bucket + settings.SECURE_STATIC_TOKEN_BUCKET - 1):
+            self.assertEqual(cabinet_api.get_img_url_secure(SecureImgUrlTest.IMG_URL), secure_url)
+
+        self.assertEqual(cabinet_api.unsign_img_url_secure(self.get_token(secure_url)),
+                         (SecureImgUrlTest.IMG_URL, bucket + settings.SECURE_STATIC_TOKEN_MAX_AGE))
+
+    def test_refresh(self):
+        legacy_token = urlsafe_base64_encode(cabinet_api.SIGNER.sign('student:' + SecureImgUrlTest.IMG_URL))
+        data = {'text': 'see <img src="/secure-static/%s/"> and /secure-static/bad/' % legacy_token, 'img': None}
+
+        refreshed_data = cabinet_api.refresh_img_urls_secure_data(data)
+
+        self.assertNotEqual(refreshed_data['text'], data['text'])
+        self.assertIn(legacy_token, data['text'])  # the data itself is not touched
+        self.assertIn('/secure-static/bad/', refreshed_data['text'])
+        secure_url = cabinet_api.SECURE_STATIC_URL_REGEX.search(refreshed_data['text']).group(0)
+        self.assertEqual(secure_url, cabinet_api.get_img_url_secure(SecureImgUrlTest.IMG_URL))
+
+
+class BuildFilesTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend_patch = patch.object(cabinet_api, 'CABINET_BACKEND',
+                                          FileSystemCabinetBackend(cabinet_api.CABINET_ENDPOINT, self.root))
+        self.backend_patch.start()
+
+    def tearDown(self):
+        self.backend_patch.stop()
+        shutil.rmtree(self.root)
+
+    def build_question_files(self):
+        cabinet_files = [cabinet_api.build_subpart_or_container_file('questions/raw/1/1/6/1/1/%s.json' % pk,
+                                                                    build_subpart_data(0)) for pk in xrange(1, 6)]
+        cabinet_files.append(cabinet_api.build_subpart_or_container_file('questions/containers/1/1/6/1/1/1.json',
+                                                                        {'content': '', 'hint': None,
+                                                                         'subparts': ['1', '2', '3', '4', '5']}))
+        cabinet_files.extend(cabinet_api.build_image_files('questions/raw/1/1/6/1/1/img/a.png',
+                                                           build_image_data(1000, 500, 'PNG'), 'a.png'))
+        return cabinet_files
+
+    def test_build_files(self):
+        cabinet_files = self.build_question_files()
+        self.assertEqual(len(cabinet_files), 6 + 1 + len(settings.CABINET_IMAGE_VARIANT_WIDTHS))
+
+        cabinet_api.build_files(cabinet_files)
+
+        for cabinet_file in cabinet_files:
+            self.assertEqual(cabinet_api.get_resource(cabinet_file.url), cabinet_file.data)
+
+    def test_rollback(self):
+        cabinet_files = self.build_question_files()
+        existing_file = cabinet_files[3]
+        cabinet_api.CABINET_BACKEND.write(existing_file.url, 'existing', None, CabinetWriteMode.CREATE)
+
+        self.assertRaises(CabinetSubmissionExistsError, cabinet_api.build_files, cabinet_files)
+
+        # nothing written by the batch is left behind, and the file that already existed is not touched
+        for cabinet_file in cabinet_files:
+            if cabinet_file is not existing_file:
+                self.assertRaises(Cabinet404Error, cabinet_api.get_resource, cabinet_file.url)
+        self.assertEqual(cabinet_api.get_resource(existing_file.url), 'existing')
+
+    def test_rollback_sequential(self):
+        cabinet_files = self.build_question_files()
+        cabinet_api.CABINET_BACKEND.write(cabinet_files[-1].url, 'existing', None, CabinetWriteMode.CREATE)
+
+        with patch.object(settings, 'CABINET_WRITE_WORKERS', 1):
+            self.assertRaises(CabinetSubmissionExistsError, cabinet_api.build_files, cabinet_files)
+
+        for cabinet_file in cabinet_files[:-1]:
+            self.assertRaises(Cabinet404Error, cabinet_api.get_resource, cabinet_file.url)
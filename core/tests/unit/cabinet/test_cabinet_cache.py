@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import redis
+from mock import patch
+
+from cabinet.cabinet_cache import LRUByteCache, CabinetCache, FileSharedCache
+
+
+class LRUByteCacheTest(TestCase):
+    def test_eviction_by_bytes(self):
+        cache = LRUByteCache(10)
+        cache.set('a', 'A', 4)
+        cache.set('b', 'B', 4)
+        self.assertEqual(cache.get('a'), 'A')  # a is now more recently used than b
+
+        cache.set('c', 'C', 4)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+        self.assertEqual(cache.total_bytes, 8)
+
+    def test_oversized_value(self):
+        cache = LRUByteCache(10)
+        cache.set('a', 'A', 11)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.total_bytes, 0)
+
+
+class CabinetCacheTest(TestCase):
+    def setUp(self):
+        self.shared_cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shared_cache_dir)
+
+    def build_cabinet_cache(self):
+        return CabinetCache(LRUByteCache(1024, ttl=60), FileSharedCache(self.shared_cache_dir, 1024))
+
+    def test_shared_tier(self):
+        data = {'subparts': [1, 2]}
+        self.build_cabinet_cache().set('http://cabinet/1.json', data, json.dumps(data))
+
+        # a different process only shares the second tier
+        cabinet_cache = self.build_cabinet_cache()
+        self.assertEqual(cabinet_cache.get('http://cabinet/1.json'), data)
+        self.assertEqual(cabinet_cache.get('http://cabinet/2.json'), None)
+
+    def test_invalidate(self):
+        data = {'subparts': [1, 2]}
+        cabinet_cache = self.build_cabinet_cache()
+        other_cabinet_cache = self.build_cabinet_cache()
+        with patch('time.time', return_value=1000):
+            cabinet_cache.set('http://cabinet/1.json', data, json.dumps(data))
+            cabinet_cache.set('http://cabinet/2.json', data, json.dumps(data))
+            self.assertEqual(other_cabinet_cache.get('http://cabinet/1.json'), data)
+
+            cabinet_cache.invalidate(['http://cabinet/1.json'])
+
+            self.assertEqual(cabinet_cache.get('http://cabinet/1.json'), None)
+            self.assertEqual(self.build_cabinet_cache().get('http://cabinet/1.json'), None)
+            # only the invalidated url is dropped
+            self.assertEqual(self.build_cabinet_cache().get('http://cabinet/2.json'), data)
+            self.assertEqual(cabinet_cache.generation, 0)
+
+        # the other process's local tier expires the url
+        with patch('time.time', return_value=1060):
+            self.assertEqual(other_cabinet_cache.get('http://cabinet/1.json'), None)
+
+    def test_shared_tier_errors(self):
+        data = {'subparts': [1, 2]}
+        shared_cache = FileSharedCache(self.shared_cache_dir, 1024)
+        cabinet_cache = CabinetCache(LRUByteCache(1024), shared_cache)
+
+        with patch.object(shared_cache, 'set', side_effect=IOError(28, 'No space left on device')):
+            cabinet_cache.set('http://cabinet/1.json', data, json.dumps(data))
+        self.assertEqual(cabinet_cache.get('http://cabinet/1.json'), data)  # still in the local tier
+
+        with patch.object(shared_cache, 'delete', side_effect=redis.ConnectionError()):
+            cabinet_cache.invalidate(['http://cabinet/1.json'])
+        self.assertEqual(cabinet_cache.get('http://cabinet/1.json'), None)
+
+    def test_clear(self):
+        data = {'subparts': [1, 2]}
+        other_cabinet_cache = self.build_cabinet_cache()
+        other_cabinet_cache.set('http://cabinet/1.json', data, json.dumps(data))
+
+        self.build_cabinet_cache().clear()
+
+        # the other process's local tier is dropped once it picks up the new generation
+        other_cabinet_cache.generation_checked = None
+        self.assertEqual(other_cabinet_cache.get('http://cabinet/1.json'), None)
+
+
+class FileSharedCacheTest(TestCase):
+    def setUp(self):
+        self.shared_cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shared_cache_dir)
+
+    def test_trim(self):
+        shared_cache = FileSharedCache(self.shared_cache_dir, 10 * 4)
+        for i in xrange(FileSharedCache.TRIM_INTERVAL):
+            shared_cache.set(str(i), '%4d' % i)
+            os.utime(shared_cache.build_entry_path(str(i)), (i, i))
+
+        # trimmed down to the bound, keeping the entries written last
+        self.assertEqual([shared_cache.get(str(i)) for i in xrange(FileSharedCache.TRIM_INTERVAL - 10)],
+                         [None] * (FileSharedCache.TRIM_INTERVAL - 10))
+        for i in xrange(FileSharedCache.TRIM_INTERVAL - 10, FileSharedCache.TRIM_INTERVAL - 1):
+            self.assertEqual(shared_cache.get(str(i)), '%4d' % i)
@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+from mock import patch, NonCallableMagicMock
+from requests import PreparedRequest
+from requests.adapters import HTTPAdapter
+
+from cabinet import cabinet_client
+from cabinet.cabinet_client import CabinetHTTPAdapter, build_session, get_session
+from openshiksha import settings
+
+
+class CabinetSessionTest(TestCase):
+    def setUp(self):
+        self.session_pid_patch = patch.object(cabinet_client, '_session_pid', None)
+        self.session_pid_patch.start()
+        self.session_patch = patch.object(cabinet_client, '_session', None)
+        self.session_patch.start()
+
+    def tearDown(self):
+        self.session_patch.stop()
+        self.session_pid_patch.stop()
+
+    def test_session_per_process(self):
+        with patch('os.getpid', return_value=100):
+            session = get_session()
+            self.assertIs(get_session(), session)
+
+        # a forked worker never uses the pool of the process it was forked from
+        with patch('os.getpid', return_value=101):
+            worker_session = get_session()
+            self.assertIsNot(worker_session, session)
+            self.assertIs(get_session(), worker_session)
+
+    def test_pool_size(self):
+        with patch.object(settings, 'CABINET_POOL_SIZE', 3):
+            session = build_session()
+
+        for url in ['http://cabinet/1.json', 'https://cabinet/1.json']:
+            adapter = session.get_adapter(url)
+            self.assertIsInstance(adapter, CabinetHTTPAdapter)
+            # a single pool (the cabinet server) with a connection for each of the concurrent requests
+            self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 3)
+            self.assertEqual(adapter.poolmanager.pools._maxsize, 1)
+            self.assertEqual(adapter.get_connection(url).pool.maxsize, 3)
+
+
+class CabinetHTTPAdapterTest(TestCase):
+    def send(self, adapter, new_connection):
+        connection_pool = NonCallableMagicMock()
+        connection_pool.num_connections = 1
+
+        def send(request, **kwargs):
+            if new_connection:
+                connection_pool.num_connections += 1
+            return NonCallableMagicMock()
+
+        request = PreparedRequest()
+        request.prepare(method='GET', url='http://cabinet/1.json')
+        with patch.object(adapter, 'get_connection', return_value=connection_pool), \
+                patch.object(HTTPAdapter, 'send', side_effect=send):
+            adapter.send(request)
+
+    def test_connection_counters(self):
+        adapter = CabinetHTTPAdapter()
+        with patch('cabinet.cabinet_client.statsd') as statsd_mock:
+            self.send(adapter, True)
+            self.send(adapter, False)
+            self.send(adapter, False)
+
+        self.assertEqual([call[0][0] for call in statsd_mock.increment.call_args_list],
+                         ['cabinet.connection.new', 'cabinet.connection.reused', 'cabinet.connection.reused'])
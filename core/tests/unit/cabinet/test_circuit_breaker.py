@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from mock import patch
+
+from cabinet.circuit_breaker import CircuitBreaker, CircuitBreakerState
+
+
+class CircuitBreakerTest(TestCase):
+    def test_open_half_open_close(self):
+        breaker = CircuitBreaker('test', 2, 10)
+        with patch('time.time', return_value=100):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreakerState.OPEN)
+            self.assertFalse(breaker.allow())
+
+        with patch('time.time', return_value=110):
+            self.assertTrue(breaker.allow())  # trial call
+            self.assertEqual(breaker.state, CircuitBreakerState.HALF_OPEN)
+            self.assertFalse(breaker.allow())  # only a single trial call
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreakerState.OPEN)
+
+        with patch('time.time', return_value=120):
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+            self.assertEqual(breaker.state, CircuitBreakerState.CLOSED)
+            self.assertTrue(breaker.allow())
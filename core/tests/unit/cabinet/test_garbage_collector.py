@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from cabinet import garbage_collector
+from cabinet.garbage_collector import CabinetGarbageCollector, CabinetGCKind
+from cabinet.submission_format import encode_submission
+
+
+class GarbageCollectorTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.quarantine_root = tempfile.mkdtemp()
+        self.dereference_patch = patch.object(garbage_collector, 'dereference_question_blob')
+        self.dereference_mock = self.dereference_patch.start()
+
+    def tearDown(self):
+        self.dereference_patch.stop()
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.quarantine_root)
+
+    def write_file(self, path, data='{}'):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(self.root, path))
+
+    def build_cabinet(self):
+        for pk, blob_hash in [(1, 'ab12'), (2, 'cd34')]:
+            self.write_file('submissions/1/6/A/1/1/%s.json' % pk)
+            self.write_file('submissions/1/6/A/1/1/questions/%s.json' % pk,
+                            encode_submission({'blob': blob_hash, 'questions': []}))
+            self.write_file('submissions/1/6/A/1/1/answers/%s.json' % pk)
+        self.write_file('submissions/2/6/A/1/3/answers/3.json')
+        self.write_file('submissions/2/6/A/1/3/answers/notes.txt')
+
+        # subpart files are named as listed by their container (vault subpart numbers for the question bank), which
+        # have nothing to do with the pks of the QuestionSubpart rows
+        self.write_file('questions/raw/1/1/6/1/1/1.json', json.dumps({'content': {'text': 'see [[img a.png]]'}}))
+        self.write_file('questions/raw/1/1/6/1/1/2.json', json.dumps({'content': {'text': 'x', 'img': 'b.png'}}))
+        self.write_file('questions/raw/1/1/6/1/1/3.json', json.dumps({'content': {'text': 'y'}}))
+        self.write_file('questions/raw/1/1/6/1/1/7.json', json.dumps({'content': {'text': 'z'}}))
+        self.write_file('questions/containers/1/1/6/1/1/5.json',
+                        json.dumps({'content': {'text': '', 'img': 'c.png'}, 'subparts': [1, 3]}))
+        self.write_file('questions/containers/1/1/6/1/1/6.json', json.dumps({'content': {'text': ''}, 'subparts': [7]}))
+        for name in ['a.png', 'b.png', 'c.png']:
+            self.write_file('questions/raw/1/1/6/1/1/img/' + name, 'png')
+            self.write_file('questions/raw/1/1/6/1/1/img/variants/thumb/' + name, 'png')
+
+        self.write_file('question_blobs/ab/ab12.json')
+        self.write_file('question_blobs/cd/cd34.json')
+
+    def build_collector(self, **kwargs):
+        # submission 2 and question 6 are gone from the db, and no live container lists subpart 2 (the only one
+        # referring to b.png)
+        return CabinetGarbageCollector(self.root, {1L, 3L}, {5L}, {'ab12', 'cd34'}, kwargs.pop('min_age', 0),
+                                       workers=4, **kwargs)
+
+    def test_collect(self):
+        self.build_cabinet()
+
+        stats = self.build_collector().run()
+
+        self.assertTrue(self.exists('submissions/1/6/A/1/1/answers/1.json'))
+        self.assertTrue(self.exists('submissions/2/6/A/1/3/answers/3.json'))
+        self.assertTrue(self.exists('submissions/2/6/A/1/3/answers/notes.txt'))
+        for path in ['submissions/1/6/A/1/1/2.json', 'submissions/1/6/A/1/1/questions/2.json',
+                     'submissions/1/6/A/1/1/answers/2.json']:
+            self.assertFalse(self.exists(path))
+
+        for name in ['1.json', '3.json']:
+            self.assertTrue(self.exists('questions/raw/1/1/6/1/1/' + name))
+        for name in ['2.json', '7.json']:
+            self.assertFalse(self.exists('questions/raw/1/1/6/1/1/' + name))
+        self.assertTrue(self.exists('questions/containers/1/1/6/1/1/5.json'))
+        self.assertFalse(self.exists('questions/containers/1/1/6/1/1/6.json'))
+        for name in ['a.png', 'c.png']:
+            self.assertTrue(self.exists('questions/raw/1/1/6/1/1/img/' + name))
+            self.assertTrue(self.exists('questions/raw/1/1/6/1/1/img/variants/thumb/' + name))
+        self.assertFalse(self.exists('questions/raw/1/1/6/1/1/img/b.png'))
+        self.assertFalse(self.exists('questions/raw/1/1/6/1/1/img/variants/thumb/b.png'))
+
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.scanned'], 7)
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.orphaned'], 3)
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.unknown'], 1)
+        self.assertEqual(stats[CabinetGCKind.SUBPART + '.scanned'], 4)
+        self.assertEqual(stats[CabinetGCKind.SUBPART + '.orphaned'], 2)
+        self.assertEqual(stats[CabinetGCKind.CONTAINER + '.orphaned'], 1)
+        self.assertEqual(stats[CabinetGCKind.IMAGE + '.scanned'], 6)
+        self.assertEqual(stats[CabinetGCKind.IMAGE + '.orphaned'], 2)
+        self.assertEqual(stats[CabinetGCKind.QUESTION_BLOB + '.scanned'], 2)
+        self.assertEqual(stats[CabinetGCKind.QUESTION_BLOB + '.orphaned'], 0)
+
+        # the collected questions file of submission 2 gives up its reference to its blob
+        self.dereference_mock.assert_called_once_with('cd34')
+        self.assertEqual(stats[CabinetGCKind.QUESTION_BLOB + '.dereferenced'], 1)
+
+    def test_dry_run(self):
+        self.build_cabinet()
+
+        stats = self.build_collector(dry_run=True).run()
+
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.orphaned'], 3)
+        self.assertTrue(self.exists('submissions/1/6/A/1/1/answers/2.json'))
+        self.assertTrue(self.exists('questions/raw/1/1/6/1/1/img/b.png'))
+        self.assertFalse(self.dereference_mock.called)
+
+    def test_quarantine(self):
+        self.build_cabinet()
+
+        self.build_collector(quarantine_root=self.quarantine_root).run()
+
+        self.assertFalse(self.exists('submissions/1/6/A/1/1/answers/2.json'))
+        self.assertTrue(os.path.exists(os.path.join(self.quarantine_root, 'submissions/1/6/A/1/1/answers/2.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.quarantine_root, 'questions/raw/1/1/6/1/1/img/b.png')))
+
+    def test_recent_orphans_kept(self):
+        self.build_cabinet()
+
+        stats = self.build_collector(min_age=3600).run()
+
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.recent'], 3)
+        self.assertEqual(stats[CabinetGCKind.SUBMISSION + '.orphaned'], 0)
+        self.assertTrue(self.exists('submissions/1/6/A/1/1/answers/2.json'))
+        self.assertFalse(self.dereference_mock.called)
+
+    def test_unreadable_chapter(self):
+        self.build_cabinet()
+        self.write_file('questions/raw/1/1/6/1/1/1.json', 'not json')
+
+        stats = self.build_collector().run()
+
+        self.assertEqual(stats[CabinetGCKind.IMAGE + '.unreadable'], 1)
+        self.assertTrue(self.exists('questions/raw/1/1/6/1/1/img/b.png'))
+
+    def test_unreadable_container(self):
+        self.build_cabinet()
+        self.write_file('questions/containers/1/1/6/1/1/5.json', 'not json')
+
+        stats = self.build_collector().run()
+
+        # without the subparts list of a live container, none of the subparts of its chapter can be collected
+        self.assertEqual(stats[CabinetGCKind.SUBPART + '.unreadable'], 4)
+        self.assertEqual(stats[CabinetGCKind.SUBPART + '.orphaned'], 0)
+        for name in ['1.json', '2.json', '3.json', '7.json', 'img/b.png']:
+            self.assertTrue(self.exists('questions/raw/1/1/6/1/1/' + name))
+        self.assertFalse(self.exists('questions/containers/1/1/6/1/1/6.json'))
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from cStringIO import StringIO
+from unittest import TestCase
+
+from mock import patch
+from PIL import Image
+
+from cabinet import cabinet_api
+from cabinet.backends import FileSystemCabinetBackend
+from cabinet.cabinet_cache import LRUByteCache, CabinetCache
+from cabinet.exceptions import Cabinet404Error
+from cabinet.image_variants import build_image_variant, pick_image_variant, ImageVariant, build_image_variant_url
+from core.tests.unit.cabinet.base import build_image_data
+
+
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend_patch = patch.object(cabinet_api, 'CABINET_BACKEND',
+                                          FileSystemCabinetBackend(cabinet_api.CABINET_ENDPOINT, self.root))
+        self.backend_patch.start()
+        self.cache_patch = patch.object(cabinet_api, 'CABINET_CACHE', CabinetCache(LRUByteCache(1024 * 1024), None))
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.backend_patch.stop()
+        shutil.rmtree(self.root)
+
+    def test_build_image_variant(self):
+        for image_format in ['PNG', 'JPEG']:
+            variant_image = Image.open(StringIO(build_image_variant(build_image_data(1000, 500, image_format), 480)))
+            self.assertEqual(variant_image.size, (480, 240))
+            self.assertEqual(variant_image.format, image_format)
+
+        image_data = build_image_data(100, 50, 'PNG')
+        self.assertEqual(build_image_variant(image_data, 480), image_data)
+
+    def test_pick_image_variant(self):
+        self.assertEqual(pick_image_variant('thumb', None, None), ImageVariant.THUMBNAIL)
+        self.assertEqual(pick_image_variant('huge', 'on', '320'), ImageVariant.ORIGINAL)
+        self.assertEqual(pick_image_variant(None, 'on', None), ImageVariant.MOBILE)
+        self.assertEqual(pick_image_variant(None, None, '320'), ImageVariant.MOBILE)
+        self.assertEqual(pick_image_variant(None, None, '1280'), ImageVariant.ORIGINAL)
+        self.assertEqual(pick_image_variant(None, None, 'wide'), ImageVariant.ORIGINAL)
+
+    def test_variants_built_at_upload(self):
+        cabinet_api.build_image('questions/raw/1/1/6/1/1/img/a.png', build_image_data(1000, 500, 'PNG'), 'a.png')
+        url = cabinet_api.build_image_data_url('questions/raw/1/1/6/1/1/img/a.png')
+
+        with patch.object(cabinet_api, 'build_image_variant_file') as build_image_variant_file_mock, \
+                patch.object(cabinet_api.CABINET_BACKEND, 'read') as read_mock:
+            variant_url = cabinet_api.get_image_variant_url(url, ImageVariant.THUMBNAIL)
+        self.assertFalse(build_image_variant_file_mock.called)
+        self.assertFalse(read_mock.called)  # the existence of the variant is checked without reading it
+        self.assertEqual(Image.open(StringIO(cabinet_api.get_resource(variant_url))).size, (160, 80))
+
+    def test_variant_built_lazily(self):
+        url = cabinet_api.build_image_data_url('questions/raw/1/1/6/1/1/img/b.jpg')
+        self.assertRaises(Cabinet404Error, cabinet_api.get_image_variant_url, url, ImageVariant.MOBILE)
+
+        cabinet_api.cabinet_put_img(url, build_image_data(1000, 500, 'JPEG'), 'b.jpg')
+        variant_url = cabinet_api.get_image_variant_url(url, ImageVariant.MOBILE)
+        self.assertEqual(variant_url, build_image_variant_url(url, ImageVariant.MOBILE))
+        self.assertEqual(Image.open(StringIO(cabinet_api.get_resource(variant_url))).size, (480, 240))
+
+        self.assertEqual(cabinet_api.get_image_variant_url(url, ImageVariant.ORIGINAL), url)
+        gif_url = cabinet_api.build_image_data_url('questions/raw/1/1/6/1/1/img/c.gif')
+        self.assertEqual(cabinet_api.get_image_variant_url(gif_url, ImageVariant.MOBILE), gif_url)
@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+from mock import patch
+
+from cabinet import cabinet_api
+from cabinet.backends import FileSystemCabinetBackend
+from cabinet.cabinet_cache import LRUByteCache, CabinetCache
+from cabinet.metrics import get_cabinet_data_type, CabinetDataType
+from cabinet.middleware import CabinetCallsMiddleware
+from core.tests.base import CabinetCallBudget
+from core.tests.unit.cabinet.base import build_subpart_data
+from core.utils.json import dump_json_string
+from openshiksha import settings
+
+
+class CabinetMetricsTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend_patch = patch.object(cabinet_api, 'CABINET_BACKEND',
+                                          FileSystemCabinetBackend(cabinet_api.CABINET_ENDPOINT, self.root))
+        self.backend_patch.start()
+        self.cache_patch = patch.object(cabinet_api, 'CABINET_CACHE', CabinetCache(LRUByteCache(1024 * 1024), None))
+        self.cache_patch.start()
+
+        self.urls = [cabinet_api.CABINET_ENDPOINT + 'questions/raw/1/1/6/1/1/%s.json' % pk for pk in xrange(1, 5)]
+        for url in self.urls:
+            cabinet_api.cabinet_put(url, dump_json_string(build_subpart_data(0)))
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.backend_patch.stop()
+        shutil.rmtree(self.root)
+
+    def test_data_type(self):
+        endpoint = cabinet_api.CABINET_ENDPOINT
+        self.assertEqual(get_cabinet_data_type(endpoint + 'questions/containers/1/1/6/1/1/1.json'),
+                         CabinetDataType.CONTAINER)
+        self.assertEqual(get_cabinet_data_type(endpoint + 'questions/raw/1/1/6/1/1/1.json'), CabinetDataType.SUBPART)
+        self.assertEqual(get_cabinet_data_type(endpoint + 'questions/raw/1/1/6/1/1/img/a.png'), CabinetDataType.IMAGE)
+        self.assertEqual(get_cabinet_data_type(endpoint + 'submissions/1/6/A/1/1/answers/1.json'),
+                         CabinetDataType.SUBMISSION)
+        self.assertEqual(get_cabinet_data_type(endpoint + 'aql_meta/1/1/6/1/1.json'), CabinetDataType.AQL_META)
+        self.assertEqual(get_cabinet_data_type('dealt_assignments/2/3/da39a3/7'), CabinetDataType.DEALT_ASSIGNMENT)
+        self.assertEqual(get_cabinet_data_type(endpoint + 'unknown/1.json'), CabinetDataType.OTHER)
+
+    def test_calls_counted_across_workers(self):
+        with patch.object(settings, 'CABINET_FETCH_WORKERS', 4):
+            with CabinetCallBudget(self, 4) as counter:
+                cabinet_api.get_cached_resources_content(self.urls)
+            self.assertEqual(counter.calls_by_data_type, {'read.subpart': 4})
+            self.assertEqual(counter.cache_misses, 4)
+
+            with CabinetCallBudget(self, 0) as counter:
+                cabinet_api.get_cached_resources_content(self.urls)
+            self.assertEqual(counter.cache_hits, 4)
+
+    def test_budget_exceeded(self):
+        def read_all():
+            with CabinetCallBudget(self, 3):
+                for url in self.urls:
+                    cabinet_api.get_resource(url)
+
+        self.assertRaises(AssertionError, read_all)
+
+    def test_middleware_headers(self):
+        def view(request):
+            return HttpResponse(cabinet_api.get_resource(self.urls[0]))
+
+        middleware = CabinetCallsMiddleware(view)
+        with patch.object(settings, 'CABINET_CALLS_HEADER', True):
+            response = middleware(RequestFactory().get('/'))
+
+        self.assertEqual(response['X-Cabinet-Calls'], '1')
+        self.assertEqual(response['X-Cabinet-Bytes'], str(len(response.content)))
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from cabinet.question_blobs import build_question_blob, assemble_questions_data, is_question_blob_reference
+from core.tests.unit.cabinet.base import build_subpart_data, build_mcsa_subpart_data
+
+
+class QuestionBlobTest(TestCase):
+    def build_questions_data(self, question_pks, options_order):
+        questions_data = {
+            1: {'pk': 1, 'container': {'subparts': [11, 12]},
+                'subparts': [build_subpart_data(0), build_mcsa_subpart_data(1, options_order)]},
+            2: {'pk': 2, 'container': {'subparts': [21]}, 'subparts': [build_subpart_data(0)]}
+        }
+        return [questions_data[pk] for pk in question_pks]
+
+    def test_same_questions_share_blob(self):
+        questions_data = self.build_questions_data([2, 1], [2, 0, 1])
+        blob_hash, blob_data, reference_data = build_question_blob(questions_data)
+        other_blob_hash, other_blob_data, other_reference_data = build_question_blob(
+            self.build_questions_data([1, 2], [0, 1, 2]))
+
+        self.assertEqual(blob_hash, other_blob_hash)
+        self.assertEqual(blob_data, other_blob_data)
+        self.assertNotEqual(reference_data, other_reference_data)
+        self.assertTrue(is_question_blob_reference(reference_data))
+
+        self.assertEqual(assemble_questions_data(blob_data, reference_data), questions_data)
+        # the blob data is not touched by the assembly
+        self.assertEqual(blob_data, other_blob_data)
+
+    def test_different_questions(self):
+        questions_data = self.build_questions_data([1, 2], [0, 1, 2])
+        questions_data[1]['subparts'][0]['content']['text'] = 'dealt differently'
+        self.assertNotEqual(build_question_blob(questions_data)[0],
+                            build_question_blob(self.build_questions_data([1, 2], [0, 1, 2]))[0])
@@ -0,0 +1,22 @@
+from unittest import TestCase
+
+from cabinet.submission_format import encode_submission, decode_submission, is_legacy_submission
+from core.tests.unit.cabinet.base import build_subpart_data
+from core.utils.json import dump_json_string
+
+
+class SubmissionFormatTest(TestCase):
+    SUBMISSION_DATA = {
+        'questions': [{'pk': 1, 'container': {'subparts': [11]}, 'subparts': [build_subpart_data(0)]}],
+        'answers': [[{'text': None, 'correct': None}]]
+    }
+
+    def test_round_trip(self):
+        raw = encode_submission(SubmissionFormatTest.SUBMISSION_DATA)
+        self.assertFalse(is_legacy_submission(raw))
+        self.assertEqual(decode_submission(raw), SubmissionFormatTest.SUBMISSION_DATA)
+
+    def test_legacy(self):
+        raw = dump_json_string(SubmissionFormatTest.SUBMISSION_DATA)
+        self.assertTrue(is_legacy_submission(raw))
+        self.assertEqual(decode_submission(raw), SubmissionFormatTest.SUBMISSION_DATA)
@@ -0,0 +1,51 @@
+from mock import NonCallableMagicMock
+
+from cabinet import cabinet_api
+from core.utils.constants import OpenShikshaQuestionType
+
+
+VARIABLE_CONSTRAINTS_DATA = {
+    'a': {'range': {'include': [[1, 50], [60, 100]], 'exclude': [[10, 20], [45, 65], [99]]}},
+    'b': {'range': {'include': [[0, 5]], 'exclude': [[1, 2]], 'decimal': 2}},
+    'c': {'options': [3, 5, 7, 11]},
+    'd': {'fraction': {'numerator': {'rangeint': {'include': [[1, 9]]}}, 'denominator': {'options': [2, 4, 8, 16]}}},
+    'e': {'fraction': {'numerator': {}, 'denominator': {'rangeint': {'include': [[-5, 5]], 'exclude': [[0]]}}}},
+    'f': {}
+}
+
+
+def build_undealt_questions():
+    questions_data = []
+    for pk in xrange(1, 5):
+        textual_subpart_data = {
+            'type': OpenShikshaQuestionType.TEXTUAL,
+            'content': {'text': 'what is _{a}_ and _{c}_?'},
+            'subpart_index': 0,
+            'answer': '_{a}_ _{c}_',
+            'variable_constraints': VARIABLE_CONSTRAINTS_DATA
+        }
+        mcsa_subpart_data = {
+            'type': OpenShikshaQuestionType.MCSA,
+            'content': {'text': 'is _{a}_ more than 50?'},
+            'subpart_index': 1,
+            'options': {'correct': {'text': 'yes'}, 'incorrect': [{'text': 'no'}, {'text': 'maybe'}]}
+        }
+        questions_data.append((pk, {'content': {'text': 'question %s' % pk}, 'subparts': [pk * 10, pk * 10 + 1]},
+                               [textual_subpart_data, mcsa_subpart_data]))
+
+    undealt_questions = []
+    for pk, container_data, subparts_data in questions_data:
+        question = NonCallableMagicMock()
+        question.pk = pk
+        undealt_questions.append(cabinet_api.build_undealt_question(question, container_data, subparts_data))
+    return undealt_questions
+
+
+def build_textual_subpart_data(text, variable_constraints_data):
+    return {
+        'type': OpenShikshaQuestionType.TEXTUAL,
+        'content': {'text': text},
+        'subpart_index': 0,
+        'answer': '_{{ a + 1 }}_',
+        'variable_constraints': variable_constraints_data
+    }
@@ -0,0 +1,159 @@
+from fractions import Fraction
+from unittest import TestCase
+
+from concurrent.futures import ThreadPoolExecutor
+
+from core.tests.unit.croupier.base import VARIABLE_CONSTRAINTS_DATA
+from croupier import croupier_api
+from croupier.constraints import SubpartVariableConstraints, OptionsConstraint, RangeConstraint, FractionConstraint, \
+    ConstraintsPlanCache, compile_range_constraint
+from croupier.exceptions import InvalidRangeLimitsError, RangeProcessingError, InvalidDenominatorConstraintError
+
+
+def evaluate_uncompiled(variable_constraints_data, rng):
+    """
+    Value selection as it was done before the constraints were compiled - building the constraints from the data on
+    every evaluation
+    """
+    values = {}
+    options_selection_index = None
+    for variable in variable_constraints_data:
+        constraints_block = variable_constraints_data[variable]
+        if len(constraints_block) == 0:
+            values[variable] = SubpartVariableConstraints.default_constraints().evaluate(rng)
+        elif 'options' in constraints_block:
+            values[variable], options_selection_index = OptionsConstraint(constraints_block['options']).evaluate(
+                rng, options_selection_index)
+        elif 'range' in constraints_block:
+            values[variable] = RangeConstraint(constraints_block['range']).evaluate(rng)
+        else:
+            values[variable], options_selection_index = FractionConstraint(constraints_block['fraction']).evaluate(
+                rng, options_selection_index)
+    return values
+
+
+def evaluate_range_legacy(range_data, rng):
+    """
+    Frozen copy of how a range constraint was sampled before dealing version 2 - a value drawn from every processed
+    range, and then one of those picked (so every processed range was equally likely, whatever its length)
+    """
+    decimal = range_data.get('decimal')
+    if decimal:
+        processed_ranges = RangeConstraint(range_data).process_ranges(1.0 / (10 ** decimal))
+        valid_choices = [rng.uniform(processed_range.min, processed_range.max) for processed_range in processed_ranges]
+        return float(("{0:.%uf}" % decimal).format(rng.choice(valid_choices)))
+
+    processed_ranges = RangeConstraint(range_data).process_ranges(1)
+    valid_choices = [rng.randint(processed_range.min, processed_range.max) for processed_range in processed_ranges]
+    return rng.choice(valid_choices)
+
+
+class SubpartVariableConstraintsTest(TestCase):
+    def test_same_values_as_uncompiled(self):
+        variable_constraints = SubpartVariableConstraints(VARIABLE_CONSTRAINTS_DATA)
+        for seed in ['1:signature', 'student:42'] + range(200):
+            expected_values = evaluate_uncompiled(VARIABLE_CONSTRAINTS_DATA, croupier_api.build_rng(seed))
+            variable_constraints.process(croupier_api.build_rng(seed))
+            self.assertEqual(variable_constraints.values, expected_values)
+
+    def test_seed_values(self):
+        # a seed must always deal the same values, as the assignments dealt for the user's own seed (read-only views
+        # and previews) are expected to stay the same - if these have to change, croupier_api.DEALING_VERSION has to be
+        # bumped along with them
+        expected_values_list = [
+            (1, {'a': 21, 'b': 4.06, 'c': 11, 'd': Fraction(5, 16), 'e': Fraction(-6, 1), 'f': 14}),
+            ('student:42', {'a': 42, 'b': 3.19, 'c': 11, 'd': Fraction(7, 16), 'e': Fraction(-14, 3), 'f': 17})
+        ]
+        variable_constraints = SubpartVariableConstraints(VARIABLE_CONSTRAINTS_DATA)
+        for seed, expected_values in expected_values_list:
+            variable_constraints.process(croupier_api.build_rng(seed))
+            self.assertEqual(variable_constraints.values, expected_values)
+        self.assertEqual(croupier_api.DEALING_VERSION, 2)
+
+    def test_seed_values_version_1(self):
+        # the values dealt before dealing version 2, which the assignments created then keep dealing
+        expected_values_list = [
+            (1, {'a': 41, 'b': 0.65, 'c': 5, 'd': Fraction(5, 4), 'e': Fraction(-2, 3), 'f': 6}),
+            ('student:42', {'a': 5, 'b': 0.79, 'c': 7, 'd': Fraction(5, 8), 'e': Fraction(-7, 2), 'f': 15})
+        ]
+        variable_constraints = SubpartVariableConstraints(VARIABLE_CONSTRAINTS_DATA)
+        for seed, expected_values in expected_values_list:
+            variable_constraints.process(croupier_api.build_rng(seed, 1))
+            self.assertEqual(variable_constraints.values, expected_values)
+
+        range_data = {'include': [[1, 10]], 'exclude': [[4, 6]], 'decimal': 1}
+        range_plan = compile_range_constraint(RangeConstraint(range_data))
+        for seed in xrange(50):
+            self.assertEqual(range_plan.evaluate(croupier_api.build_rng(seed, 1), None)[0],
+                             evaluate_range_legacy(range_data, croupier_api.build_rng(seed)))
+
+    def test_same_valid_values_as_legacy(self):
+        # dealing version 2 only changed how likely each valid value is, never which values are valid
+        for range_data in [
+            {'include': [[1, 10]], 'exclude': [[4, 6]]},
+            {'include': [[-5, 5]], 'exclude': [[0]]},
+            {'include': [[0, 1]], 'exclude': [[0.2, 0.8]], 'decimal': 1},
+            {'include': [[1, 2]], 'exclude': [[1.5, 1.9]], 'decimal': 2}
+        ]:
+            rng = croupier_api.build_rng(1)
+            range_constraint = RangeConstraint(range_data)
+            legacy_values = set(evaluate_range_legacy(range_data, rng) for _ in xrange(3000))
+            values = set(range_constraint.evaluate(rng) for _ in xrange(3000))
+            self.assertEqual(values, legacy_values)
+
+    def test_length_weighted_unlike_legacy(self):
+        range_data = {'include': [[1, 1], [100, 399]]}
+        rng = croupier_api.build_rng(1)
+        legacy_values = [evaluate_range_legacy(range_data, rng) for _ in xrange(3000)]
+        values = [RangeConstraint(range_data).evaluate(rng) for _ in xrange(3000)]
+        self.assertGreater(legacy_values.count(1), 1200)  # 1500 expected - every processed range equally likely
+        self.assertLess(values.count(1), 50)  # 10 expected - every valid value equally likely
+
+    def test_concurrent_dealing(self):
+        variable_constraints_list = [SubpartVariableConstraints(VARIABLE_CONSTRAINTS_DATA) for _ in xrange(20)]
+
+        def process(variable_constraints):
+            rng = croupier_api.build_rng('seed')
+            for _ in xrange(50):
+                variable_constraints.process(rng)
+            return variable_constraints.values
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            values_list = list(executor.map(process, variable_constraints_list))
+        self.assertEqual(values_list, [process(SubpartVariableConstraints(VARIABLE_CONSTRAINTS_DATA))] * 20)
+
+    def test_processed_ranges(self):
+        plan = SubpartVariableConstraints({'a': VARIABLE_CONSTRAINTS_DATA['a']}).plan
+        self.assertEqual(plan.variables[0][1].intervals, ((1, 9), (21, 44), (66, 98), (100, 100)))
+
+    def test_no_constraints(self):
+        for variable_constraints_data in [None, {}]:
+            variable_constraints = SubpartVariableConstraints(variable_constraints_data)
+            variable_constraints.process(croupier_api.build_rng(1))
+            self.assertEqual(variable_constraints.values, {})
+
+    def test_malformed_on_build(self):
+        self.assertRaises(InvalidRangeLimitsError, SubpartVariableConstraints, {'a': {'range': {'include': [[5, 1]]}}})
+        self.assertRaises(RangeProcessingError, SubpartVariableConstraints,
+                          {'a': {'range': {'include': [[1, 5]], 'exclude': [[0, 10]]}}})
+        self.assertRaises(InvalidDenominatorConstraintError, SubpartVariableConstraints,
+                          {'a': {'fraction': {'numerator': {}, 'denominator': {'options': [0, 1]}}}})
+
+    def test_plan_cache(self):
+        plan_cache = ConstraintsPlanCache(2)
+        plan = plan_cache.get_plan('raw/1.json', VARIABLE_CONSTRAINTS_DATA)
+        self.assertIs(plan_cache.get_plan('raw/1.json', VARIABLE_CONSTRAINTS_DATA), plan)
+        # data read from the cabinet again
+        self.assertIsNot(plan_cache.get_plan('raw/1.json', dict(VARIABLE_CONSTRAINTS_DATA)), plan)
+
+        # changed data for the subpart
+        changed_data = {'c': {'options': [1]}}
+        changed_plan = plan_cache.get_plan('raw/1.json', changed_data)
+        self.assertEqual(changed_plan.evaluate(croupier_api.build_rng(1)), ({'c': 1}, 0))
+
+        # the least recently used plan is evicted
+        plan_cache.get_plan('raw/2.json', None)
+        self.assertIs(plan_cache.get_plan('raw/1.json', changed_data), changed_plan)
+        plan_cache.get_plan('raw/3.json', None)
+        self.assertEqual(plan_cache.entries.get('raw/2.json'), None)
+        self.assertIs(plan_cache.get_plan('raw/1.json', changed_data), changed_plan)
@@ -0,0 +1,121 @@
+from unittest import TestCase
+
+from mock import patch, NonCallableMagicMock
+
+from cabinet import cabinet_api
+from cabinet.cabinet_cache import CabinetCache, LRUByteCache
+from core.data_models.question import build_question_subpart_from_data
+from core.tests.unit.croupier.base import VARIABLE_CONSTRAINTS_DATA, build_undealt_questions, build_textual_subpart_data
+from core.utils.json import dump_json_string_canonical
+from croupier import croupier_api
+from croupier.constraints import SubpartVariableConstraints
+
+
+class DealSubpartBatchTest(TestCase):
+    def deal_batch(self, subpart_data, num_deals, seed):
+        subpart = build_question_subpart_from_data(subpart_data)
+        variable_constraints = SubpartVariableConstraints(subpart_data['variable_constraints'])
+        return [(dict(values), dealt_subpart and dump_json_string_canonical(dealt_subpart), error) for
+                values, dealt_subpart, error in croupier_api.iter_deal_subpart_batch(
+                    subpart, variable_constraints, num_deals, croupier_api.build_rng(seed))]
+
+    def test_deterministic(self):
+        subpart_data = build_textual_subpart_data('what is _{{ a * b }}_ with _{d}_?', VARIABLE_CONSTRAINTS_DATA)
+        deals = self.deal_batch(subpart_data, 50, 'batch')
+        self.assertEqual(len(deals), 50)
+        self.assertEqual(deals, self.deal_batch(subpart_data, 50, 'batch'))
+        self.assertTrue(all(error is None for values, dealt_subpart, error in deals))
+        self.assertGreater(len(set(dealt_subpart for values, dealt_subpart, error in deals)), 1)
+
+    def test_failures(self):
+        subpart_data = build_textual_subpart_data('_{{ a / 0 }}_', VARIABLE_CONSTRAINTS_DATA)
+        subpart = build_question_subpart_from_data(subpart_data)
+        undealt_subpart = dump_json_string_canonical(subpart)
+        variable_constraints = SubpartVariableConstraints(subpart_data['variable_constraints'])
+        deals = list(croupier_api.iter_deal_subpart_batch(subpart, variable_constraints, 5,
+                                                          croupier_api.build_rng(1)))
+        self.assertEqual(len(deals), 5)
+        for values, dealt_subpart, error in deals:
+            self.assertIn('a', values)
+            self.assertIsNone(dealt_subpart)
+            self.assertIsInstance(error, ZeroDivisionError)
+        # every dealing substitutes into a copy
+        self.assertEqual(dump_json_string_canonical(subpart), undealt_subpart)
+
+
+class BuildAssignmentsTest(TestCase):
+    def test_same_as_build_assignment(self):
+        seeds = [1, 2, 3, 'student']
+        with patch.object(cabinet_api, 'build_undealt_assignment',
+                          side_effect=lambda assignment_questions_list: build_undealt_questions()) as fetch_mock:
+            expected_dealt_questions_list = [croupier_api.build_assignment(seed, None) for seed in seeds]
+            fetch_mock.reset_mock()
+            dealt_questions_list = croupier_api.build_assignments(seeds, None)
+
+        self.assertEqual(fetch_mock.call_count, 1)
+        self.assertEqual([dump_json_string_canonical(dealt_questions) for dealt_questions in dealt_questions_list],
+                         [dump_json_string_canonical(dealt_questions) for dealt_questions in
+                          expected_dealt_questions_list])
+        self.assertNotEqual(dump_json_string_canonical(dealt_questions_list[0]),
+                            dump_json_string_canonical(dealt_questions_list[1]))
+
+
+class BuildAssignmentUserSeedTest(TestCase):
+    def setUp(self):
+        self.cache_patch = patch.object(cabinet_api, 'CABINET_CACHE', CabinetCache(LRUByteCache(1024 * 1024), None))
+        self.cache_patch.start()
+        self.fetch_patch = patch.object(cabinet_api, 'build_undealt_assignment',
+                                        side_effect=lambda assignment_questions_list: build_undealt_questions())
+        self.fetch_mock = self.fetch_patch.start()
+
+        self.user = NonCallableMagicMock()
+        self.user.pk = 7
+        self.assignment_questions_list = NonCallableMagicMock()
+        self.assignment_questions_list.pk = 3
+        self.assignment_questions_list.questions.values_list.return_value = [1, 2, 3, 4]
+
+    def tearDown(self):
+        self.fetch_patch.stop()
+        self.cache_patch.stop()
+
+    def test_cached(self):
+        dealt_questions = croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+        cached_dealt_questions = croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+
+        self.assertEqual(self.fetch_mock.call_count, 1)
+        self.assertEqual(dump_json_string_canonical(cached_dealt_questions), dump_json_string_canonical(dealt_questions))
+        self.assertEqual(dump_json_string_canonical(cached_dealt_questions),
+                         dump_json_string_canonical(croupier_api.build_assignment(7, None)))
+
+        # every call gets its own data models
+        self.assertIsNot(croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)[0],
+                         cached_dealt_questions[0])
+
+    def test_invalidated(self):
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+
+        # questions of the aql changed
+        self.assignment_questions_list.questions.values_list.return_value = [1, 2, 3]
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+        self.assertEqual(self.fetch_mock.call_count, 2)
+
+        # question bank reloaded
+        cabinet_api.invalidate_question_cache()
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+        self.assertEqual(self.fetch_mock.call_count, 3)
+
+        # another user
+        self.user.pk = 8
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+        self.assertEqual(self.fetch_mock.call_count, 4)
+
+        # a seed deals different values than before
+        with patch.object(croupier_api, 'DEALING_VERSION', croupier_api.DEALING_VERSION + 1):
+            croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list)
+        self.assertEqual(self.fetch_mock.call_count, 5)
+
+        # an assignment created with an older dealing version
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list, 1)
+        self.assertEqual(self.fetch_mock.call_count, 6)
+        croupier_api.build_assignment_user_seed(self.user, self.assignment_questions_list, 1)
+        self.assertEqual(self.fetch_mock.call_count, 6)
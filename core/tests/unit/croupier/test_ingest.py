@@ -0,0 +1,67 @@
+import json
+from unittest import TestCase
+
+from mock import patch, NonCallableMagicMock
+
+from cabinet import cabinet_api
+from core.tests.unit.croupier.base import VARIABLE_CONSTRAINTS_DATA, build_textual_subpart_data
+from core.utils.constants import OpenShikshaQuestionType
+from core.utils.json import dump_json_string_canonical, dump_json_string
+from croupier import croupier_api
+from croupier import constraints
+from croupier.exceptions import SubpartIngestError
+from croupier.ingest import ingest_question
+
+
+class IngestQuestionTest(TestCase):
+    def deal(self, subpart_ids, subparts_data, seed):
+        question = NonCallableMagicMock()
+        question.pk = 1
+        undealt_question = cabinet_api.build_undealt_question(question, {'subparts': subpart_ids}, subparts_data)
+        dealt_question = croupier_api.deal([undealt_question], croupier_api.build_rng(seed))[0]
+        return dump_json_string_canonical(dealt_question.subparts)
+
+    def test_same_deal_as_not_ingested(self):
+        subpart_data = build_textual_subpart_data('what is _{{ a * b }}_ with _{d}_ and _{c}_?',
+                                                  VARIABLE_CONSTRAINTS_DATA)
+        # as read back from the cabinet
+        ingested_subpart_data = json.loads(dump_json_string(ingest_question([subpart_data])))[0]
+        self.assertIn('compiled', ingested_subpart_data)
+        self.assertNotIn('compiled', subpart_data)
+
+        for seed in xrange(20):
+            self.assertEqual(self.deal(['ingest-%s' % seed], [ingested_subpart_data], seed),
+                             self.deal(['no-ingest-%s' % seed], [subpart_data], seed))
+
+    def test_cross_subpart_variables(self):
+        # the second subpart has no constraints of its own and uses the variables of the first
+        subparts_data = [build_textual_subpart_data('what is _{a}_?', VARIABLE_CONSTRAINTS_DATA),
+                         build_textual_subpart_data('what is _{{ a * c }}_ with _{d}_?', None)]
+        subparts_data[1]['subpart_index'] = 1
+        self.assertRaises(SubpartIngestError, ingest_question, subparts_data[1:])
+
+        ingested_subparts_data = json.loads(dump_json_string(ingest_question(subparts_data)))
+        for seed in xrange(20):
+            self.assertEqual(self.deal(['ingest-1-%s' % seed, 'ingest-2-%s' % seed], ingested_subparts_data, seed),
+                             self.deal(['no-ingest-1-%s' % seed, 'no-ingest-2-%s' % seed], subparts_data, seed))
+
+    def test_not_compiled_again(self):
+        ingested_subparts_data = ingest_question([build_textual_subpart_data('_{a}_', VARIABLE_CONSTRAINTS_DATA)])
+        with patch.object(constraints, 'compile_constraints_block', side_effect=AssertionError) as compile_mock:
+            self.deal(['ingest-compiled'], ingested_subparts_data, 1)
+        self.assertFalse(compile_mock.called)
+
+    def test_malformed(self):
+        self.assertRaises(SubpartIngestError, ingest_question, [{'type': OpenShikshaQuestionType.TEXTUAL}])
+        self.assertRaises(SubpartIngestError, ingest_question,
+                          [build_textual_subpart_data('_{a}_', {'a': {'range': {'include': [[5, 1]]}}})])
+        self.assertRaises(SubpartIngestError, ingest_question,
+                          [build_textual_subpart_data('_{a}_ _{b', VARIABLE_CONSTRAINTS_DATA)])
+        self.assertRaises(SubpartIngestError, ingest_question,
+                          [build_textual_subpart_data('_{{ a / 0 }}_', VARIABLE_CONSTRAINTS_DATA)])
+        self.assertRaises(SubpartIngestError, ingest_question,
+                          [build_textual_subpart_data('_{z}_', VARIABLE_CONSTRAINTS_DATA)])
+        # the subpart is named in the error
+        with self.assertRaisesRegexp(SubpartIngestError, '^Subpart 2: '):
+            ingest_question([build_textual_subpart_data('_{a}_', VARIABLE_CONSTRAINTS_DATA),
+                             build_textual_subpart_data('_{z}_', None)])
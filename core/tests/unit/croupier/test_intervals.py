@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from croupier import croupier_api
+from croupier.exceptions import RangeProcessingError
+from croupier.intervals import IntervalSet
+
+
+class IntervalSetTest(TestCase):
+    def test_values(self):
+        interval_set = IntervalSet([(1, 3), (7, 7), (10, 11)])
+        self.assertEqual(len(interval_set), 6)
+        self.assertEqual([interval_set.get_value(i) for i in xrange(6)], [1, 2, 3, 7, 10, 11])
+
+    def test_decimal_values(self):
+        # limits as left by cutting out the exclude range [0.5, 1] with a float step
+        interval_set = IntervalSet([(0, 0.5 - 0.01), (1 + 0.01, 1.02)], 2)
+        values = [interval_set.get_value(i) for i in xrange(len(interval_set))]
+        self.assertEqual(values, [float('%.2f' % (i / 100.0)) for i in range(50) + [101, 102]])
+
+    def test_length_weighted(self):
+        interval_set = IntervalSet([(1, 1), (100, 399)])
+        rng = croupier_api.build_rng(1)
+        values = [interval_set.sample(rng) for _ in xrange(3000)]
+        self.assertLess(values.count(1), 50)  # 10 expected, against 1500 when every interval is equally likely
+        self.assertTrue(all((value == 1) or (100 <= value <= 399) for value in values))
+
+    def test_no_valid_values(self):
+        self.assertRaises(RangeProcessingError, IntervalSet, [(0.001, 0.004)], 2)
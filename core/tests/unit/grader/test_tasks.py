@@ -0,0 +1,187 @@
+from unittest import TestCase
+
+from mock import patch, NonCallableMagicMock
+
+from cabinet import cabinet_api
+from cabinet.exceptions import CabinetConnectionError
+from core.data_models.submission import SubmissionDM
+from core.tests.unit.cabinet.base import build_subpart_data
+from core.utils.constants import HttpMethod
+from grader import tasks
+from grader.tasks import split_grading_batches
+
+
+class SplitGradingBatchesTest(TestCase):
+    def test_balanced(self):
+        weighted_assignments = [(1, 40), (2, 10), (3, 30), (4, 20), (5, 20), (6, 1)]
+        batches = split_grading_batches(weighted_assignments, 3)
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(sorted(pk for batch in batches for pk in batch), [1, 2, 3, 4, 5, 6])
+
+        weights = dict(weighted_assignments)
+        batch_weights = sorted(sum(weights[pk] for pk in batch) for batch in batches)
+        self.assertEqual(batch_weights, [40, 40, 41])
+
+    def test_fewer_assignments_than_batches(self):
+        self.assertEqual(split_grading_batches([(1, 5), (2, 0)], 8), [[1], [2]])
+        self.assertEqual(split_grading_batches([], 8), [])
+
+
+class GradingTasksTest(TestCase):
+    """
+    Runs the grading tasks eagerly (the chord included) with the database and the cabinet mocked out
+    """
+
+    def setUp(self):
+        self.assignments = {}  # pk -> assignment mock
+        self.submissions = {}  # assignment pk -> submission mocks
+        self.shell_submissions = {}  # assignment pk -> submission mocks created for the students without one
+        self.correct_answers = set()  # pks of the submissions whose answer is correct
+        self.unreadable_submissions = set()  # pks of the submissions that cannot be read from the cabinet
+
+        # run the tasks (and the chord callback) in process, as CELERY_TASK_ALWAYS_EAGER does
+        celery_conf = tasks.grade.app.conf
+        self.addCleanup(setattr, celery_conf, 'task_always_eager', celery_conf.task_always_eager)
+        celery_conf.task_always_eager = True
+
+        self.patches = [
+            patch.object(tasks.Assignment.objects, 'filter', side_effect=self.filter_assignments),
+            patch.object(tasks.Submission.objects, 'filter', side_effect=self.filter_submissions),
+            patch.object(tasks, 'create_shell_submissions', side_effect=self.create_shell_submissions),
+            patch.object(tasks, 'is_corrected_open_assignment', return_value=False),
+            patch.object(tasks, 'check_homework_assignment'),
+            patch.object(tasks, 'ContentType'),
+            patch.object(tasks, 'calculate_edge_data', return_value='Edge data calculated'),
+            patch.object(cabinet_api, 'get_submission', side_effect=self.get_submission),
+            patch.object(cabinet_api, 'update_submission_answers'),
+            patch('core.data_models.submission.Question')
+        ]
+        for p in self.patches:
+            p.start()
+        self.notify_overnight_mock = patch.object(tasks.notify_overnight, 'run', return_value='overnight').start()
+        self.notify_due_mock = patch.object(tasks.notify_due, 'run', return_value='due').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def add_assignment(self, pk, submission_pks, shell_submission_pks=()):
+        assignment = NonCallableMagicMock()
+        assignment.pk = pk
+        assignment.average = None
+        assignment.completion = None
+        self.assignments[pk] = assignment
+
+        self.submissions[pk] = [self.build_submission(submission_pk) for submission_pk in submission_pks]
+        self.shell_submissions[pk] = [self.build_submission(submission_pk) for submission_pk in shell_submission_pks]
+        students = []
+        for submission in self.submissions[pk] + self.shell_submissions[pk]:
+            student = NonCallableMagicMock()
+            student.pk = submission.student_id
+            students.append(student)
+        assignment.content_object.students.all.return_value = students
+        return assignment
+
+    def build_submission(self, pk):
+        submission = NonCallableMagicMock()
+        submission.pk = pk
+        submission.student_id = pk * 10
+        submission.completion = 0.0
+        submission.marks = None
+        return submission
+
+    def filter_assignments(self, pk__in):
+        return [self.assignments[pk] for pk in pk__in if pk in self.assignments]
+
+    def filter_submissions(self, **kwargs):
+        if 'assignment__in' not in kwargs:
+            return list(self.submissions[kwargs['assignment'].pk])
+
+        # the averages of the graded assignments (values + annotate)
+        averages = []
+        for pk in kwargs['assignment__in']:
+            submissions = self.submissions[pk]
+            averages.append({
+                'assignment': pk,
+                'marks__avg': sum(submission.marks for submission in submissions) / len(submissions),
+                'completion__avg': sum(submission.completion for submission in submissions) / len(submissions)
+            })
+        queryset = NonCallableMagicMock()
+        queryset.values.return_value.annotate.return_value = averages
+        return queryset
+
+    def create_shell_submissions(self, assignment, students, timestamp):
+        self.assertEqual([student.pk for student in students],
+                         [submission.student_id for submission in self.shell_submissions[assignment.pk]])
+        self.submissions[assignment.pk].extend(self.shell_submissions[assignment.pk])
+        return self.shell_submissions[assignment.pk]
+
+    def get_submission(self, submission):
+        if submission.pk in self.unreadable_submissions:
+            raise CabinetConnectionError('submissions/%s.json' % submission.pk, HttpMethod.GET)
+        answer = 'answer' if submission.pk in self.correct_answers else None
+        return SubmissionDM.build_from_data({
+            'questions': [{'pk': 1, 'container': {'subparts': [11]}, 'subparts': [build_subpart_data(0)]}],
+            'answers': [[{'value': answer, 'correct': None}]]
+        })
+
+    def test_grade_chord(self):
+        self.add_assignment(1, [1], [2])
+        self.add_assignment(2, [3])
+        self.add_assignment(3, [4, 5])
+        self.correct_answers.update([1, 4, 5])
+
+        with patch.object(tasks, 'build_grading_batches', return_value=[[1, 2], [3]]), \
+                patch.object(tasks, 'handle_graded_assignments',
+                             wraps=tasks.handle_graded_assignments) as handle_graded_assignments_mock:
+            report = tasks.grade(False, True)
+        self.assertIn('Grading 3 assignments in 2 batches', report)
+
+        # the results of both batches reach the chord callback
+        batch_results = handle_graded_assignments_mock.call_args[0][0]
+        self.assertEqual(sorted(pk for batch_result in batch_results for pk in batch_result['graded']), [1, 2, 3])
+        self.assertEqual(sum(batch_result['submissions_graded'] for batch_result in batch_results), 5)
+        self.assertEqual(sum(batch_result['shell_submissions_created'] for batch_result in batch_results), 1)
+
+        self.assertEqual([self.assignments[pk].average for pk in [1, 2, 3]], [0.5, 0.0, 1.0])
+        self.assertTrue(all(self.assignments[pk].save.called for pk in [1, 2, 3]))
+        self.assertEqual(cabinet_api.update_submission_answers.call_count, 5)
+        # everything was graded, so the run notifies
+        self.assertTrue(self.notify_overnight_mock.called)
+        self.assertTrue(self.notify_due_mock.called)
+
+    def test_partial_failure(self):
+        self.add_assignment(1, [1, 2])
+        self.add_assignment(2, [3])
+        self.correct_answers.update([1, 3])
+        self.unreadable_submissions.add(2)
+
+        with patch.object(tasks, 'build_grading_batches', return_value=[[1], [2]]):
+            tasks.grade(False, True)
+
+        # the failed assignment is left ungraded (for the next run), and the other is graded as usual
+        self.assertIsNone(self.assignments[1].average)
+        self.assertFalse(self.assignments[1].save.called)
+        self.assertEqual(self.assignments[2].average, 1.0)
+        self.assertFalse(self.notify_overnight_mock.called)
+
+        batch_results = [tasks.grade_assignments([1], False), tasks.grade_assignments([2], False)]
+        self.assertEqual(batch_results[0]['graded'], [])
+        self.assertEqual(len(batch_results[0]['errors']), 1)
+        self.assertIn('Error while grading assignment 1', batch_results[0]['errors'][0])
+
+        report = tasks.finish_grading(batch_results, False, True, [])
+        self.assertIn('Assignments Graded: 1\n', report[0])
+        self.assertIn('Error while grading assignment 1', report[0])
+        self.assertEqual(report[1], 'Edge data calculated')
+        self.assertEqual(len(report), 2)  # not notified
+
+    def test_empty_batches(self):
+        self.assertEqual(tasks.grade_assignments([], False),
+                         {'graded': [], 'submissions_graded': 0, 'shell_submissions_created': 0, 'errors': []})
+
+        with patch.object(tasks, 'build_grading_batches', return_value=[]), \
+                patch.object(tasks, 'chord') as chord_mock:
+            report = tasks.grade(False, True)
+        self.assertFalse(chord_mock.called)
+        self.assertIn('Assignments Graded: 0\n', report[1])
+        self.assertEqual(report[2:], ['Edge data calculated', 'overnight', 'due'])
@@ -0,0 +1,76 @@
+from decimal import Decimal
+from fractions import Fraction
+from unittest import TestCase
+
+from core.utils.regex import evaluate_substitute_uncompiled
+from core.utils.text_template import TextTemplate, TextTemplateCache
+
+VARIABLE_VALUES_LIST = [
+    {'a': 2, 'b': Decimal('1.50'), 'c': Fraction(3, 4), 'd': -7, 'e': ''},
+    {'a': -1, 'b': Decimal('-0.25'), 'c': Fraction(4, 2), 'd': 0, 'e': '{x'},
+    {'a': 10, 'b': Decimal('100'), 'c': Fraction(-1, 3), 'd': 5, 'e': 'x}'}
+]
+
+TEXTS = [
+    '',
+    'no tags at all',
+    u'unicode \u0905 _{a}_ and _{ b }_',
+    'what is _{a}_ + _{b}_ + _{c}_ + _{d}_?',
+    'sum _{{a + b}}_ and product _{{ a * d }}_',
+    '_{{\ta + 1}}_ leading blanks',
+    'nested _{{ Fraction(a, 3) + c }}_ and _{{ sqrt(Decimal(a * a)) }}_',
+    'comprehension _{{ sum([x * a for x in range(3)]) }}_ _{{ x if False else a }}_',
+    '_{{a}}__{{d}}_ adjacent evaluations',
+    '_{a}__{{d}}__{b}_ evaluation between substitutions',
+    'value forms tags _{{ e }}_a}_ and _{{ e }}_',
+    '_{{ "_" }}_{a}_ and _{{ "}" }}__',
+    'underscores __{a}__ and _{{a}}__{{ "{" }}_b}_',
+    'empty evaluation _{{ "" }}_ _{{ e }}_',
+    'missing variable _{z}_',
+    'missing variable in evaluation _{{ z + 1 }}_',
+    'invalid expression _{{ a + }}_',
+    'invalid substitution _{a b}_',
+    'mismatched _{a}_ _{b',
+    'mismatched evaluation _{{a}}_ _{{b',
+    'division _{{ a / d }}_',
+    'multi\nline _{a}_\n_{{ a +\n 1 }}_',
+    'null \x00 byte _{a}_'
+]
+
+
+def render_uncompiled(text, variable_values):
+    try:
+        result = evaluate_substitute_uncompiled(text, variable_values)
+        return result, type(result)
+    except Exception, e:
+        return type(e)
+
+
+def render_compiled(template, variable_values):
+    try:
+        result = template.render(variable_values)
+        return result, type(result)
+    except Exception, e:
+        return type(e)
+
+
+class TextTemplateTest(TestCase):
+    def test_same_as_uncompiled(self):
+        for text in TEXTS:
+            template = TextTemplate(text)
+            for variable_values in VARIABLE_VALUES_LIST:
+                self.assertEqual(render_compiled(template, variable_values),
+                                 render_uncompiled(text, variable_values), repr(text))
+
+    def test_compiled(self):
+        self.assertIsNotNone(TextTemplate('sum _{{a + b}}_ and _{c}_').segments)
+        self.assertIsNone(TextTemplate('mismatched _{a}_ _{b').segments)
+        self.assertIsNone(TextTemplate('invalid expression _{{ a + }}_').segments)
+
+    def test_cache(self):
+        cache = TextTemplateCache(2)
+        template = cache.get_template('_{a}_')
+        self.assertIs(cache.get_template('_{a}_'), template)
+        cache.get_template('_{b}_')
+        cache.get_template('_{c}_')
+        self.assertEqual(len(cache.templates), 1)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.test import RequestFactory
+from django.utils.http import http_date
+from mock import patch, NonCallableMagicMock
+
+from cabinet import cabinet_api
+from cabinet.backends import FileSystemCabinetBackend
+from core.utils.constants import SecureStaticDelivery
+from core.views import secure_static_get
+from openshiksha import settings
+
+
+class SecureStaticGetTest(TestCase):
+    # gifs are always served as they are, without variants
+    IMG_URL = cabinet_api.CABINET_ENDPOINT + 'questions/raw/1/1/6/1/1/img/a.gif'
+    LAST_MODIFIED = 1000000000
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        backend = FileSystemCabinetBackend(cabinet_api.CABINET_ENDPOINT, self.root)
+        self.backend_patch = patch.object(cabinet_api, 'CABINET_BACKEND', backend)
+        self.backend_patch.start()
+        self.delivery_patch = patch.object(settings, 'SECURE_STATIC_DELIVERY', SecureStaticDelivery.STREAM)
+        self.delivery_patch.start()
+
+        cabinet_api.cabinet_put(SecureStaticGetTest.IMG_URL, 'GIF89a')
+        path = backend.build_path(SecureStaticGetTest.IMG_URL)
+        os.utime(path, (SecureStaticGetTest.LAST_MODIFIED, SecureStaticGetTest.LAST_MODIFIED))
+
+    def tearDown(self):
+        self.delivery_patch.stop()
+        self.backend_patch.stop()
+        shutil.rmtree(self.root)
+
+    def get(self, **headers):
+        secure_url = cabinet_api.get_img_url_secure(SecureStaticGetTest.IMG_URL)
+        request = RequestFactory().get(secure_url, **headers)
+        request.user = NonCallableMagicMock()
+        return secure_static_get(request, cabinet_api.SECURE_STATIC_URL_REGEX.match(secure_url).group(1))
+
+    def test_private(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(''.join(response.streaming_content), 'GIF89a')
+        self.assertTrue(response['Cache-Control'].startswith('private, '))
+        self.assertEqual(response['Last-Modified'], http_date(SecureStaticGetTest.LAST_MODIFIED))
+
+    def test_if_modified_since(self):
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=http_date(SecureStaticGetTest.LAST_MODIFIED)).status_code,
+                         304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=http_date(SecureStaticGetTest.LAST_MODIFIED + 60)).status_code,
+                         304)
+        # modified since the copy of the client, or no date to compare
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=http_date(SecureStaticGetTest.LAST_MODIFIED - 60)).status_code,
+                         200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE='yesterday').status_code, 200)
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the If-Modified-Since is not looked at along with an If-None-Match
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"',
+                                  HTTP_IF_MODIFIED_SINCE=http_date(SecureStaticGetTest.LAST_MODIFIED)).status_code, 200)
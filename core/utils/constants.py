@@ -11,6 +11,8 @@ class HttpMethod(object):
     POST = 'POST'
     PUT = 'PUT'
     DELETE = 'DELETE'
+    HEAD = 'HEAD'
+    MOVE = 'MOVE'
 
 
 class OpenShikshaQuestionType(object):
@@ -46,3 +48,8 @@ class OpenShikshaEnv(object):
     PROD = 1
     QA = 3
     LOCAL = 4
+
+
+class SecureStaticDelivery(object):
+    ACCEL = 'accel'  # X-Accel-Redirect to the internal nginx location
+    STREAM = 'stream'  # streamed through django
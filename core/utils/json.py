@@ -21,11 +21,22 @@ class OpenShikshaJSONEncoder(DjangoJSONEncoder):
 
 
 ENCODER = OpenShikshaJSONEncoder(indent=2)
+COMPACT_ENCODER = OpenShikshaJSONEncoder(separators=(',', ':'))
+CANONICAL_ENCODER = OpenShikshaJSONEncoder(separators=(',', ':'), sort_keys=True)
 
 
 def dump_json_string(data):
     return ENCODER.encode(data)
 
+
+def dump_json_string_compact(data):
+    return COMPACT_ENCODER.encode(data)
+
+
+def dump_json_string_canonical(data):
+    # same data always gives the same string (used for hashing)
+    return CANONICAL_ENCODER.encode(data)
+
 class JSONModel(object):
     def get_json(self):
         return self.__dict__
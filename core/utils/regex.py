@@ -205,6 +205,16 @@ def format_value_for_sub(value):
 
 
 def evaluate_substitute(text, variable_values):
+    from core.utils.text_template import render_text_template
+
+    return render_text_template(text, variable_values)
+
+
+def evaluate_substitute_uncompiled(text, variable_values):
+    """
+    Evaluates and substitutes the tags of the text straight from its source - used by the compiled text templates for
+    the texts they can not render themselves
+    """
     check_all_tags(text)
     # first sub evaluate
     eval_tag_contents = get_evaluation_tag_contents(text)
@@ -217,11 +227,11 @@ def evaluate_substitute(text, variable_values):
     return sub_substitution_tags(text, replacements)
 
 
-def substitute_img(text, user, question, question_data_type):
+def substitute_img(text, question, question_data_type):
     from cabinet.cabinet_api import get_question_img_url_secure
 
     check_img_substitution_tags(text)
     img_substitution_tag_contents = get_img_substitution_tag_contents(text)
-    replacements = [get_question_img_url_secure(user, question, question_data_type, img_filename) for img_filename in
+    replacements = [get_question_img_url_secure(question, question_data_type, img_filename) for img_filename in
                     img_substitution_tag_contents]
     return sub_img_substitution_tags(text, replacements)
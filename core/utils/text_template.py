@@ -0,0 +1,152 @@
+# Contains the compiled form of the texts with evaluation and substitution tags
+#
+# Dealing a question runs evaluate_substitute over every text of its subparts, once per student. Instead of checking
+# the tags, scanning the text with the tag regexes and parsing the expressions every time, each distinct text is split
+# once into literal, evaluation (with the compiled code of the expression) and substitution segments, and dealing only
+# renders the segments. The rendered text is exactly that of evaluate_substitute_uncompiled, which is still used for
+# the texts (and evaluated values) the segments can not reproduce it for
+from openshiksha import settings
+from core.utils.helpers import merge_dicts
+from core.utils.regex import EvaluationTag, SubstitutionTag, EVAL_HELPERS, check_all_tags, \
+    get_substitution_tag_contents, format_value_for_sub, evaluate_substitute_uncompiled
+
+
+class TextSegmentType(object):
+    LITERAL = 0
+    EVALUATION = 1
+    SUBSTITUTION = 2
+
+
+EVALUATION_SENTINEL = '\x00'  # stands in for the evaluation tags while the substitution tags are found
+
+
+class TextTemplate(object):
+    def __init__(self, text, segments_data=None):
+        """
+        @param segments_data: the segments of the text as given by tokenize (stored at ingest), tokenized here if None
+        """
+        self.text = text
+        self.segments_data = segments_data
+        if self.segments_data is None:
+            try:
+                self.segments_data = self.tokenize(text)
+            except Exception:
+                # the uncompiled path raises the same error for the text, in the same order with respect to the
+                # evaluations
+                self.segments_data = None
+
+        self.segments = None  # list of (TextSegmentType, literal string or code object or variable), None if uncompiled
+        self.num_evaluations = 0
+        if self.segments_data is not None:
+            self.segments = [(segment_type, compile(value, '<string>', 'eval'))
+                             if segment_type == TextSegmentType.EVALUATION else (segment_type, value) for
+                             segment_type, value in self.segments_data]
+            self.num_evaluations = sum(1 for segment_type, value in self.segments
+                                       if segment_type == TextSegmentType.EVALUATION)
+
+    @staticmethod
+    def tokenize(text):
+        """
+        @return: the segments of the text as (TextSegmentType, literal string or expression or variable) lists, None if
+        they may not render the text as evaluate_substitute_uncompiled does
+        """
+        if EVALUATION_SENTINEL in text:
+            return None
+        check_all_tags(text)
+
+        # eval strips the leading blanks of an expression, compile does not
+        expressions = [match.group(1).lstrip(' \t') for match in EvaluationTag.FULL.finditer(text)]
+        for expression in expressions:
+            compile(expression, '<string>', 'eval')  # the uncompiled path raises the syntax errors at render time
+
+        # the substitution tags are found in the text with the evaluation tags taken out, any substitution tag running
+        # into an evaluation tag depends on the evaluated value
+        sentinel_text = EvaluationTag.FULL.sub(EVALUATION_SENTINEL, text)
+        variables = get_substitution_tag_contents(sentinel_text)
+        segments = []
+        expressions = iter(expressions)
+        position = 0
+        for match, variable in zip(SubstitutionTag.FULL.finditer(sentinel_text), variables):
+            if EVALUATION_SENTINEL in match.group(0):
+                return None
+            add_literal_segments(segments, sentinel_text[position:match.start()], expressions)
+            segments.append([TextSegmentType.SUBSTITUTION, variable])
+            position = match.end()
+        add_literal_segments(segments, sentinel_text[position:], expressions)
+        return segments
+
+    def render(self, variable_values):
+        if self.segments is None:
+            return evaluate_substitute_uncompiled(self.text, variable_values)
+
+        # evaluations first, in order, and only then the substitutions (which may fail on a missing variable)
+        pieces = []
+        if self.num_evaluations > 0:
+            namespace = merge_dicts([EVAL_HELPERS, variable_values])
+            for segment_type, value in self.segments:
+                if segment_type == TextSegmentType.EVALUATION:
+                    # a fresh namespace for every expression, as list comprehensions leak their variables into it
+                    value = format_value_for_sub(eval(value, {}, dict(namespace)))
+                pieces.append(value)
+            if not self.is_rendered_as_compiled(pieces):
+                return evaluate_substitute_uncompiled(self.text, variable_values)
+        else:
+            pieces = [value for segment_type, value in self.segments]
+
+        for i, (segment_type, value) in enumerate(self.segments):
+            if segment_type == TextSegmentType.SUBSTITUTION:
+                pieces[i] = format_value_for_sub(variable_values[value])
+        return (u'' if isinstance(self.text, unicode) else '').join(pieces)
+
+    def is_rendered_as_compiled(self, pieces):
+        """
+        Whether the substitution tags of the text with the evaluated values in it are the ones found at compile time,
+        i.e. no evaluated value opens or closes a substitution tag (alone or together with the text around it)
+        """
+        for i, (segment_type, value) in enumerate(self.segments):
+            if segment_type != TextSegmentType.EVALUATION:
+                continue
+            surrounded_value = self.get_adjacent_char(pieces, i, -1) + pieces[i] + self.get_adjacent_char(pieces, i, 1)
+            if ('_{' in surrounded_value) or ('}_' in surrounded_value):
+                return False
+        return True
+
+    def get_adjacent_char(self, pieces, i, step):
+        i += step
+        while 0 <= i < len(pieces):
+            if self.segments[i][0] == TextSegmentType.SUBSTITUTION:
+                return '_'  # substitution tags start and end with an underscore
+            if pieces[i]:
+                return pieces[i][-1] if step < 0 else pieces[i][0]
+            i += step  # empty evaluated value
+        return ''
+
+
+def add_literal_segments(segments, sentinel_literal, expressions):
+    for i, literal in enumerate(sentinel_literal.split(EVALUATION_SENTINEL)):
+        if i > 0:
+            segments.append([TextSegmentType.EVALUATION, expressions.next()])
+        if literal:
+            segments.append([TextSegmentType.LITERAL, literal])
+
+
+class TextTemplateCache(object):
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.templates = {}  # text -> TextTemplate
+
+    def get_template(self, text, segments_data=None):
+        template = self.templates.get(text)
+        if template is None:
+            template = TextTemplate(text, segments_data)
+            if len(self.templates) >= self.max_entries:
+                self.templates = {}  # compiling again is cheaper than keeping track of the use of every template
+            self.templates[text] = template
+        return template
+
+
+TEXT_TEMPLATE_CACHE = TextTemplateCache(settings.TEXT_TEMPLATE_CACHE_MAX_ENTRIES)
+
+
+def render_text_template(text, variable_values):
+    return TEXT_TEMPLATE_CACHE.get_template(text).render(variable_values)
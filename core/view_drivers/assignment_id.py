@@ -30,8 +30,7 @@ class AssignmentIdGet(GroupDrivenViewCommonTemplate):
         Renders an assignment (read-only) with the user's username as randomization key
         """
         authenticated_body = AssignmentIdBody(self.user, self.assignment,
-                                              build_readonly_submission_form(self.user,
-                                                                             self.assignment.assignmentQuestionsList))
+                                              build_readonly_submission_form(self.user, self.assignment))
 
         return render(self.request, self.template,
                       AuthenticatedVM(self.user, authenticated_body).as_context())
@@ -66,26 +65,37 @@ def create_shell_submission(assignment, student, timestamp):
     """
     Creates shell submission both in database and in the cabinet
     """
+    return create_shell_submissions(assignment, [student], timestamp)[0]
 
-    # first build the submission in the database to minimize race condition window
-    shell_submission_db = Submission.objects.create(assignment=assignment, student=student,
-                                                    timestamp=timestamp,
-                                                    completion=0.0)
+
+def create_shell_submissions(assignment, students, timestamp):
+    """
+    Creates the shell submissions of the given students for the assignment both in database and in the cabinet. The
+    assignment is fetched from the cabinet once and dealt for all the students together
+    """
+
+    # first build the submissions in the database to minimize race condition window
+    shell_submissions_db = [Submission.objects.create(assignment=assignment, student=student, timestamp=timestamp,
+                                                      completion=0.0) for student in students]
 
     try:
-        questions_randomized_dealt = croupier_api.build_assignment_time_seed(student,
-                                                                             assignment.assignmentQuestionsList)
-        cabinet_api.build_submission(shell_submission_db, SubmissionDM.build_shell(questions_randomized_dealt))
+        questions_randomized_dealt_list = croupier_api.build_assignments_time_seed(students,
+                                                                                   assignment.assignmentQuestionsList)
+        cabinet_api.build_submissions(shell_submissions_db,
+                                      [SubmissionDM.build_shell(questions_randomized_dealt) for
+                                       questions_randomized_dealt in questions_randomized_dealt_list])
     except Exception, e:
-        # clean up the submission in the database if shell submission could not be generated successfully in cabinet
-        shell_submission_db.delete()
+        # clean up the submissions in the database if shell submissions could not be generated successfully in cabinet
+        Submission.objects.filter(pk__in=[shell_submission_db.pk for shell_submission_db in
+                                          shell_submissions_db]).delete()
         raise e
 
-    return shell_submission_db
+    return shell_submissions_db
 
 
-def build_readonly_submission_form(user, assignment_questions_list):
-    questions_randomized_dealt = croupier_api.build_assignment_user_seed(user, assignment_questions_list)
+def build_readonly_submission_form(user, assignment):
+    questions_randomized_dealt = croupier_api.build_assignment_user_seed(user, assignment.assignmentQuestionsList,
+                                                                         assignment.dealing_version)
 
     # finally build a shell submission
     shell_submission_dm = SubmissionDM.build_shell(questions_randomized_dealt)
@@ -156,7 +156,7 @@ class SubmissionIdPostStudent(SubmissionIdDriver):
         # update the submission data with the form data
         submission_dm.update_answers(submission_form.get_answers())
         # update the submission data in cabinet
-        cabinet_api.update_submission(self.submission, submission_dm)
+        cabinet_api.update_submission_answers(self.submission, submission_dm.answers)
         # update the submission in db
         self.submission.timestamp = django.utils.timezone.now()
         self.submission.completion = submission_dm.calculate_completion()
@@ -407,7 +407,7 @@ class SubmissionIdPostUncorrected(SubmissionIdUncorrected):
             # update the submission data with the form data
             submission_dm.update_answers(submission_form.get_answers())
             # update the submission data in cabinet
-            cabinet_api.update_submission(self.submission, submission_dm)
+            cabinet_api.update_submission_answers(self.submission, submission_dm.answers)
             # update the submisssion in db
             self.submission.timestamp = django.utils.timezone.now()
             self.submission.completion = submission_dm.calculate_completion()
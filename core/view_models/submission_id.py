@@ -22,7 +22,7 @@ class RootSubmissionIdBody(object):
         else:
             self.assignment_info = AssignmentInfo(assignment, categorization)
         self.aql_info = AQLInfo(assignment.assignmentQuestionsList)
-        self.revision = Revision(user, assignment.assignmentQuestionsList)
+        self.revision = Revision(assignment.assignmentQuestionsList)
 
 
 class BaseSubmissionIdBody(RootSubmissionIdBody):
@@ -67,8 +67,6 @@ class CorrectedSubmissionIdBodySubmissionUser(CorrectedSubmissionIdBody):
 
 class CorrectedSubmissionIdBodyDifferentUser(CorrectedSubmissionIdBody):
     def __init__(self, submission_db, submission_vm, user, categorization):
-        # customize submission viewmodel for the given user
-        submission_vm.change_img_urls_for_user(user)
         super(CorrectedSubmissionIdBodyDifferentUser, self).__init__(user, submission_db, submission_vm, True,
                                                                      categorization)
 
@@ -101,11 +99,11 @@ class AQLInfo(object):
         self.title = assignment_questions_list.get_title()
 
 class Revision(object):
-    def __init__(self, user, assignment_questions_list):
+    def __init__(self, assignment_questions_list):
         from cabinet.cabinet_api import get_aql_meta
 
         aql_meta = get_aql_meta(assignment_questions_list)
-        aql_meta.prep_render(user)
+        aql_meta.prep_render()
         self.content = aql_meta.revision
 
 class AssignmentInfo(object):
@@ -133,19 +131,14 @@ class SubmissionVMBase(object):
 
 class SubmissionVMUnprotected(SubmissionVMBase):
     """
-    This is basically just the submission dm, with added functionality to update the image urls for a given user
+    This is basically just the submission dm - its secure img urls are the same for every user (and re-signed when the
+    submission is read from the cabinet), so they are not rebuilt for the user viewing it
     """
 
     def __init__(self, submission_dm):
         super(SubmissionVMUnprotected, self).__init__(submission_dm.answers)
         self.questions = submission_dm.questions
 
-    # NOTE: only the non-protected version of submissionVM should need to change img urls for user (e.g. when teacher/parent/admin view a corrected submission)
-    def change_img_urls_for_user(self, user):
-        for question in self.questions:
-            # change by overwriting
-            question.build_img_urls(user)
-
 
 class SubmissionVMProtected(SubmissionVMBase):
     def __init__(self, submission_dm):
@@ -163,10 +156,10 @@ class QuestionPartProtected(object):
 
         self.hint = question_part_dm.hint
 
-    def build_img_urls(self, user, question):
-        self.content.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+    def build_img_urls(self, question):
+        self.content.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
         if self.hint is not None:
-            self.hint.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            self.hint.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
 
 class MCOptionsProtected(object):
@@ -175,9 +168,9 @@ class MCOptionsProtected(object):
         self.combined = mc_options_dm.get_combined_options()
         self.order = mc_options_dm.order
 
-    def build_img_urls(self, user, question):
+    def build_img_urls(self, question):
         for option in self.combined:
-            option.build_img_url(user, question, OpenShikshaQuestionDataType.SUBPART)
+            option.build_img_url(question, OpenShikshaQuestionDataType.SUBPART)
 
 
 class MCSAOptionsProtected(MCOptionsProtected):
@@ -191,9 +184,9 @@ class MCMAOptionsProtected(MCOptionsProtected):
 
 
 class MCQuestionPartProtected(QuestionPartProtected):
-    def build_img_urls(self, user, question):
-        super(MCQuestionPartProtected, self).build_img_urls(user, question)
-        self.options.build_img_urls(user, question)
+    def build_img_urls(self, question):
+        super(MCQuestionPartProtected, self).build_img_urls(question)
+        self.options.build_img_urls(question)
 
 
 class MCSAQuestionPartProtected(MCQuestionPartProtected):
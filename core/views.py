@@ -1,18 +1,22 @@
+import time
+
 from datadog import statsd
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.signing import BadSignature
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse, HttpResponseNotModified
 from django.shortcuts import render, redirect, get_object_or_404
-from django.utils.http import urlsafe_base64_decode
+from django.utils.http import http_date, parse_http_date_safe
 
 from cabinet import cabinet_api
-from cabinet.cabinet_api import SIGNER, ENCODING_SEPERATOR
+from cabinet.exceptions import Cabinet404Error
+from cabinet.image_variants import pick_image_variant
 from core.models import Assignment, SubjectRoom, ClassRoom, AssignmentQuestionsList, Submission
 from core.routing.urlnames import UrlNames
 from core.utils.assignment import get_assignment_type, is_assignment_corrected, get_student_assignment_submission_type, \
     is_practice_assignment, is_student_assignment, is_open_assignment, is_corrected_open_assignment
-from core.utils.constants import OpenShikshaAssignmentType, OpenShikshaStudentAssignmentSubmissionType
+from core.utils.constants import OpenShikshaAssignmentType, OpenShikshaStudentAssignmentSubmissionType, \
+    SecureStaticDelivery
 from core.utils.json import Json404Response
 from core.utils.references import OpenShikshaGroup
 from core.utils.user_checks import is_subjectroom_student_relationship, \
@@ -456,24 +460,74 @@ def password_post(request):
 def secure_static_get(request, b64_string):
     statsd.increment('core.hits.get.secure_static')
 
-    # first we decode the signed id
-    id_signed = urlsafe_base64_decode(b64_string)
+    # unsign the token - make sure the url is not tampered and has not expired
+    try:
+        resource_url, expiry = cabinet_api.unsign_img_url_secure(b64_string)
+    except (BadSignature, TypeError, ValueError):
+        raise Http404
+
+    max_age = int(expiry - time.time())
+    if max_age <= 0:
+        statsd.increment('core.secure_static.expired')
+        raise Http404
 
-    # then we unsign the id - make sure the url is not tampered
+    # pick the image variant asked for - the url itself only identifies the original image
+    query_variant = request.GET.get('v')
+    variant = pick_image_variant(query_variant, request.META.get('HTTP_SAVE_DATA'),
+                                 request.META.get('HTTP_VIEWPORT_WIDTH'))
     try:
-        id_unsigned = SIGNER.unsign(id_signed)
-    except BadSignature:
+        resource_url = cabinet_api.get_image_variant_url(resource_url, variant)
+    except Cabinet404Error:
         raise Http404
 
+    # validation passed - files are never replaced in the cabinet, so a copy with the etag of the url is still good
+    etag = cabinet_api.get_static_etag(resource_url)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        statsd.increment('core.secure_static.not_modified')
+        return set_secure_static_cache_headers(HttpResponseNotModified(), etag, max_age, query_variant is None)
+
+    # hand over the file from the static resource server
+    content_type = cabinet_api.get_static_content_type(resource_url)
 
-    # validation
-    username = id_unsigned.split(ENCODING_SEPERATOR)[0]
-    if request.user.username != username:
+    if settings.SECURE_STATIC_DELIVERY == SecureStaticDelivery.ACCEL:
+        # nginx fetches and sends the file itself, so the worker is free as soon as this response is returned (nginx
+        # also answers an If-Modified-Since against the Last-Modified of the file)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = cabinet_api.build_static_accel_path(resource_url)
+        return set_secure_static_cache_headers(response, etag, max_age, query_variant is None)
+
+    try:
+        static_stream = cabinet_api.stream_static_content(resource_url)
+    except Cabinet404Error:
         raise Http404
+    if is_not_modified_since(request, static_stream.last_modified):
+        static_stream.close()
+        statsd.increment('core.secure_static.not_modified')
+        return set_secure_static_cache_headers(HttpResponseNotModified(), etag, max_age, query_variant is None)
+    response = StreamingHttpResponse(static_stream, content_type=content_type)
+    if static_stream.last_modified is not None:
+        response['Last-Modified'] = http_date(static_stream.last_modified)
+    return set_secure_static_cache_headers(response, etag, max_age, query_variant is None)
+
 
-    # validation passed - send request to static resource server and relay the response
-    resource_url = id_unsigned[len(username) + 1:]
-    return HttpResponse(cabinet_api.get_static_content(resource_url), content_type='image/jpeg')
+def is_not_modified_since(request, last_modified):
+    """
+    Whether the copy the client has (as of its If-Modified-Since) is still good for a file last modified at the given
+    time (epoch seconds, None if unknown). The If-Modified-Since is only looked at without an If-None-Match (RFC 7232)
+    """
+    if ('HTTP_IF_NONE_MATCH' in request.META) or (last_modified is None):
+        return False
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return (if_modified_since is not None) and (int(last_modified) <= if_modified_since)
+
+
+def set_secure_static_cache_headers(response, etag, max_age, variant_from_hints):
+    # the same secure url is shared by all users, but only a logged in user may get the file - no shared caches
+    response['Cache-Control'] = 'private, max-age=%s' % max_age
+    response['ETag'] = etag
+    if variant_from_hints:
+        response['Vary'] = 'Save-Data, Viewport-Width'
+    return response
 
 def test_500_get(request):
     """
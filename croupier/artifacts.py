@@ -0,0 +1,39 @@
+# This file provides the compiled artifact stored with a question subpart in the cabinet
+#
+# The artifact is written into the subpart file (under its own key) when the subpart is ingested, so it comes with
+# every read of the subpart - from the cabinet, the cabinet cache or an aql bundle - at no extra cost. It holds the
+# compiled variable constraints (the processed ranges) and the tokenized texts of the subpart, which the request path
+# uses as they are instead of validating and compiling the subpart again
+from core.utils.text_template import TEXT_TEMPLATE_CACHE
+
+SUBPART_ARTIFACT_KEY = 'compiled'
+SUBPART_ARTIFACT_VERSION = 1  # bump whenever the plans or the tokenizing of the texts change
+
+
+def build_subpart_artifact(plan, templates):
+    """
+    @param plan: SubpartConstraintsPlan of the subpart
+    @param templates: TextTemplates of the texts of the subpart
+    """
+    return {
+        'version': SUBPART_ARTIFACT_VERSION,
+        'variable_constraints': plan.get_data(),
+        'templates': [[template.text, template.segments_data] for template in templates if
+                      template.segments_data is not None]
+    }
+
+
+def get_subpart_artifact(subpart_data):
+    """
+    Returns the artifact stored with the subpart data, or None if it has none (not ingested yet) or an outdated one
+    """
+    artifact = subpart_data.get(SUBPART_ARTIFACT_KEY)
+    if (artifact is None) or (artifact.get('version') != SUBPART_ARTIFACT_VERSION):
+        return None
+    return artifact
+
+
+def load_subpart_artifact_templates(artifact):
+    # texts already in the cache are left as they are
+    for text, segments_data in artifact['templates']:
+        TEXT_TEMPLATE_CACHE.get_template(text, segments_data)
@@ -1,13 +1,18 @@
 from fractions import Fraction
-import random
 
+from datadog import statsd
+
+from cabinet.cabinet_cache import LRUByteCache
+from croupier.dealing import PER_RANGE_DEALING_VERSION
 from croupier.exceptions import InvalidRangeLimitsError, EmptyOptionsListError, MissingIncludeRangesError, \
     RangeProcessingError, InvalidDenominatorConstraintError, InvalidConstraintsTypeError
 from croupier.exceptions import InvalidRangeLengthError
+from croupier.intervals import IntervalSet
+from openshiksha import settings
 
 
 class ConstraintBase(object):
-    def evaluate(self, *args):
+    def evaluate(self, rng, *args):
         raise NotImplementedError("subclass of ConstraintBase must implement method evaluate")
 
 
@@ -17,9 +22,9 @@ class OptionsConstraint(ConstraintBase):
             raise EmptyOptionsListError()
         self.options_list = options_list
 
-    def evaluate(self, options_selection_index):
+    def evaluate(self, rng, options_selection_index):
         if options_selection_index is None:
-            options_selection_index = random.randint(0, len(self.options_list) - 1)
+            options_selection_index = rng.randint(0, len(self.options_list) - 1)
         return (self.options_list[options_selection_index], options_selection_index)
 
 
@@ -54,6 +59,10 @@ class Ranges(object):
             prev_range_max = range.max
 
 
+def get_range_step(decimal):
+    return (1.0 / (10 ** decimal)) if decimal else 1
+
+
 class RangeConstraintBase(ConstraintBase):
     def __init__(self, range_data):
         self.include_ranges = Ranges(range_data["include"])
@@ -119,11 +128,13 @@ class RangeConstraintBase(ConstraintBase):
 
         return processed_include_ranges
 
-    def evaluate(self):
-        processed_ranges = self.process_ranges(1)
-        valid_choices = [random.randint(processed_range.min, processed_range.max) for processed_range in
-                         processed_ranges]
-        return random.choice(valid_choices)
+    def build_interval_set(self, decimal=None):
+        processed_ranges = self.process_ranges(get_range_step(decimal))
+        return IntervalSet([(processed_range.min, processed_range.max) for processed_range in processed_ranges],
+                           decimal)
+
+    def evaluate(self, rng):
+        return self.build_interval_set().sample(rng)
 
     def check_valid_range_for_denominator(self):
         # first check if any of the excludes exclude 0
@@ -141,18 +152,10 @@ class RangeConstraint(RangeConstraintBase):
         super(RangeConstraint, self).__init__(range_data)
         self.decimal = range_data.get("decimal")
 
-    def evaluate(self):
-        if self.decimal:
-            # using float rather than decimal here since decimal is only useful for avoiding grading errors and sane display
-            # hence we use decimal for the numerical answer and in the question data file display (including evaluation block)
-            step = 1.0 / (10 ** self.decimal)
-            processed_ranges = super(RangeConstraint, self).process_ranges(step)
-            valid_choices = [random.uniform(processed_range.min, processed_range.max) for processed_range in
-                             processed_ranges]
-            return float(("{0:.%uf}" % self.decimal).format(random.choice(valid_choices)))
-
-        else:
-            return super(RangeConstraint, self).evaluate()
+    def evaluate(self, rng):
+        # using float rather than decimal here since decimal is only useful for avoiding grading errors and sane display
+        # hence we use decimal for the numerical answer and in the question data file display (including evaluation block)
+        return self.build_interval_set(self.decimal).sample(rng)
 
 
 class RangeIntConstraint(RangeConstraintBase):
@@ -175,10 +178,10 @@ class FractionElemConstraintBase(ConstraintBase):  # has a constraint element th
 
         raise InvalidConstraintsTypeError()
 
-    def evaluate(self, option_selection_index):
+    def evaluate(self, rng, option_selection_index):
         if self.is_options_constraint:
-            return self.constraint.evaluate(option_selection_index)
-        return (self.constraint.evaluate(), option_selection_index)
+            return self.constraint.evaluate(rng, option_selection_index)
+        return (self.constraint.evaluate(rng), option_selection_index)
 
 
 class FractionDenominatorConstraint(FractionElemConstraintBase):
@@ -202,12 +205,214 @@ class FractionConstraint(ConstraintBase):
         self.numerator = FractionNumeratorConstraint(fraction_data["numerator"])
         self.denominator = FractionDenominatorConstraint(fraction_data["denominator"])
 
-    def evaluate(self, options_selection_index):
-        numerator_value, options_selection_index = self.numerator.evaluate(options_selection_index)
-        denominator_value, options_selection_index = self.denominator.evaluate(options_selection_index)
+    def evaluate(self, rng, options_selection_index):
+        numerator_value, options_selection_index = self.numerator.evaluate(rng, options_selection_index)
+        denominator_value, options_selection_index = self.denominator.evaluate(rng, options_selection_index)
+        # use Fraction for simplification
+        return (Fraction(numerator_value, denominator_value), options_selection_index)
+
+
+class OptionsPlan(object):
+    """
+    Compiled options constraint - see compile_constraints_block
+    """
+    __slots__ = ('options',)
+
+    def __init__(self, options):
+        self.options = tuple(options)
+
+    def evaluate(self, rng, options_selection_index):
+        if options_selection_index is None:
+            options_selection_index = rng.randint(0, len(self.options) - 1)
+        return (self.options[options_selection_index], options_selection_index)
+
+    def get_data(self):
+        return {'options': list(self.options)}
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data['options'])
+
+
+class RangePlan(object):
+    """
+    Compiled range constraint - the include ranges with the exclude ranges already cut out of them, and the valid
+    values in them ready to be sampled (every valid value is equally likely)
+    """
+    __slots__ = ('intervals', 'decimal', 'interval_set')
+
+    def __init__(self, intervals, decimal):
+        """
+        @param intervals: (min, max) pairs of the processed ranges
+        """
+        self.intervals = tuple((interval_min, interval_max) for interval_min, interval_max in intervals)
+        self.decimal = decimal
+        self.interval_set = IntervalSet(self.intervals, decimal)
+
+    def evaluate(self, rng, options_selection_index):
+        if rng.dealing_version == PER_RANGE_DEALING_VERSION:
+            return (self.evaluate_per_range(rng), options_selection_index)
+        return (self.interval_set.sample(rng), options_selection_index)
+
+    def evaluate_per_range(self, rng):
+        """
+        Range constraints as sampled up to dealing version 1 (every processed range equally likely, whatever its length)
+        - kept as it was, so the seeds of assignments created then keep dealing the same values
+        """
+        if self.decimal:
+            valid_choices = [rng.uniform(interval_min, interval_max) for interval_min, interval_max in self.intervals]
+            return float(("{0:.%uf}" % self.decimal).format(rng.choice(valid_choices)))
+        valid_choices = [rng.randint(interval_min, interval_max) for interval_min, interval_max in self.intervals]
+        return rng.choice(valid_choices)
+
+    def get_data(self):
+        return {'intervals': [list(interval) for interval in self.intervals], 'decimal': self.decimal}
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data['intervals'], data['decimal'])
+
+
+class FractionPlan(object):
+    __slots__ = ('numerator', 'denominator')
+
+    def __init__(self, numerator, denominator):
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def evaluate(self, rng, options_selection_index):
+        numerator_value, options_selection_index = self.numerator.evaluate(rng, options_selection_index)
+        denominator_value, options_selection_index = self.denominator.evaluate(rng, options_selection_index)
         # use Fraction for simplification
         return (Fraction(numerator_value, denominator_value), options_selection_index)
 
+    def get_data(self):
+        return {'fraction': {'numerator': self.numerator.get_data(), 'denominator': self.denominator.get_data()}}
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(load_constraints_plan(data['fraction']['numerator']),
+                   load_constraints_plan(data['fraction']['denominator']))
+
+
+def load_constraints_plan(plan_data):
+    """
+    Rebuilds a compiled plan from its (json) data, without validating it again
+    """
+    if 'options' in plan_data:
+        return OptionsPlan.from_data(plan_data)
+    if 'intervals' in plan_data:
+        return RangePlan.from_data(plan_data)
+    if 'fraction' in plan_data:
+        return FractionPlan.from_data(plan_data)
+    raise InvalidConstraintsTypeError()
+
+
+def compile_range_constraint(range_constraint):
+    decimal = getattr(range_constraint, 'decimal', None)
+    return RangePlan([(processed_range.min, processed_range.max) for processed_range in
+                      range_constraint.process_ranges(get_range_step(decimal))], decimal)
+
+
+def compile_fraction_elem_constraint(fraction_elem_constraint):
+    if fraction_elem_constraint.is_options_constraint:
+        return OptionsPlan(fraction_elem_constraint.constraint.options_list)
+    return compile_range_constraint(fraction_elem_constraint.constraint)
+
+
+def compile_constraints_block(constraints_block):
+    """
+    Looks at the constraints block and compiles the right type of constraints based on constraint precedence. The
+    constraints are validated (and their ranges processed) here, once, instead of every time a value is selected
+    """
+    if len(constraints_block) == 0:
+        return compile_range_constraint(SubpartVariableConstraints.default_constraints())
+
+    if "options" in constraints_block:
+        return OptionsPlan(OptionsConstraint(constraints_block['options']).options_list)
+
+    if "range" in constraints_block:
+        return compile_range_constraint(RangeConstraint(constraints_block['range']))
+
+    if "fraction" in constraints_block:
+        fraction_constraint = FractionConstraint(constraints_block['fraction'])
+        return FractionPlan(compile_fraction_elem_constraint(fraction_constraint.numerator),
+                            compile_fraction_elem_constraint(fraction_constraint.denominator))
+
+    raise InvalidConstraintsTypeError()
+
+
+class SubpartConstraintsPlan(object):
+    """
+    The compiled variable constraints block of a subpart - immutable, so a single plan is shared by every dealing of
+    the subpart
+    """
+    __slots__ = ('variables',)
+
+    def __init__(self, variable_constraints_data, plans_data=None):
+        """
+        @param plans_data: the data of the plan compiled from the block at ingest (see get_data), if any - the block is
+        compiled (and validated) here otherwise
+        """
+        # the variables keep the iteration order of the block, as the values are selected in that order
+        if not variable_constraints_data:  # no variable constraints block, or no variables in it
+            self.variables = ()
+        elif plans_data is not None:
+            if set(plans_data) != set(variable_constraints_data):
+                raise InvalidConstraintsTypeError()
+            self.variables = tuple((variable, load_constraints_plan(plans_data[variable])) for
+                                   variable in variable_constraints_data)
+        else:
+            self.variables = tuple((variable, compile_constraints_block(variable_constraints_data[variable])) for
+                                   variable in variable_constraints_data)
+
+    def __deepcopy__(self, memo):
+        return self  # immutable - copies of an undealt question share the plan
+
+    def evaluate(self, rng):
+        """
+        @param rng: random.Random instance the values are drawn from
+        @return: (dict of the selected value for each variable, options selection index)
+        """
+        values = {}
+        options_selection_index = None
+        for variable, plan in self.variables:
+            values[variable], options_selection_index = plan.evaluate(rng, options_selection_index)
+        return values, options_selection_index
+
+    def get_data(self):
+        return dict((variable, plan.get_data()) for variable, plan in self.variables)
+
+
+class ConstraintsPlanCache(object):
+    """
+    Compiled plans by the cabinet url of their subpart (subpart file numbers repeat across chapters). The constraints
+    data a plan was compiled from is kept with it - subpart data is shared through the cabinet cache, so data that is
+    not the very object the plan was compiled from has been read from the cabinet again (changed, after a question bank
+    reload) and is compiled again instead of using the stale plan
+    """
+
+    def __init__(self, max_entries):
+        # every entry counts as a single byte, so the bound is the number of plans
+        self.entries = LRUByteCache(max_entries, 'croupier.plan_cache')  # subpart url -> (constraints data, plan)
+
+    def get_plan(self, subpart_url, variable_constraints_data, plans_data=None):
+        entry = self.entries.get(subpart_url)
+        if (entry is not None) and (entry[0] is variable_constraints_data):
+            statsd.increment('croupier.plan_cache.hit')
+            return entry[1]
+
+        statsd.increment('croupier.plan_cache.miss')
+        plan = SubpartConstraintsPlan(variable_constraints_data, plans_data)
+        self.entries.set(subpart_url, (variable_constraints_data, plan), 1)
+        return plan
+
+    def clear(self):
+        self.entries.clear()
+
+
+CONSTRAINTS_PLAN_CACHE = ConstraintsPlanCache(settings.CROUPIER_PLAN_CACHE_MAX_ENTRIES)
+
 
 class SubpartVariableConstraints(object):
     """
@@ -215,21 +420,27 @@ class SubpartVariableConstraints(object):
     selection cannot happen in init as first all variables need to be initialized with the right type of constraints
     """
 
-    def __init__(self, variable_constraints_data):
+    def __init__(self, variable_constraints_data, plan=None):
+        """
+        @param plan: compiled plan of the variable constraints data (from the plan cache), compiled here if not given
+        @throws: CroupierMalformedDataError if the variable constraints data is malformed
+        """
         self.values = {}  # this dictionary stores the selected value for each variable, where the variable is the key
         self.options_selection_index = None
         self.variable_constraints_data = variable_constraints_data
+        self.plan = plan if plan is not None else SubpartConstraintsPlan(variable_constraints_data)
 
-    def process(self):  # seperate function so seed-setting can be done between init and processing
-        if self.variable_constraints_data is None:  # no variable constraints block
-            return
-
-        if (len(self.variable_constraints_data) == 0):
-            return
+    @classmethod
+    def build_cached(cls, subpart_url, variable_constraints_data, plans_data=None):
+        return cls(variable_constraints_data,
+                   CONSTRAINTS_PLAN_CACHE.get_plan(subpart_url, variable_constraints_data, plans_data))
 
-        # so there is a variable constraints block and it has some variables
-        for variable in self.variable_constraints_data:
-            self.values[variable] = self.process_constraints_block(self.variable_constraints_data[variable])
+    def process(self, rng):
+        """
+        Selects the values of the variables, drawing from the given random.Random instance (never the global random, so
+        that dealings can run concurrently)
+        """
+        self.values, self.options_selection_index = self.plan.evaluate(rng)
 
     @classmethod
     def default_constraints(cls):
@@ -238,25 +449,3 @@ class SubpartVariableConstraints(object):
                 [2, 20]
             ]
         })
-
-    def process_constraints_block(self, constraints_block):
-        """
-        Looks at the constraints block and applies the right type of constraints based on constraint precedence
-        """
-        if len(constraints_block) == 0:
-            return SubpartVariableConstraints.default_constraints().evaluate()
-
-        if "options" in constraints_block:
-            value, self.options_selection_index = OptionsConstraint(constraints_block['options']).evaluate(
-                self.options_selection_index)
-            return value
-
-        if "range" in constraints_block:
-            return RangeConstraint(constraints_block['range']).evaluate()
-
-        if "fraction" in constraints_block:
-            value, self.options_selection_index = FractionConstraint(constraints_block['fraction']).evaluate(
-                self.options_selection_index)
-            return value
-
-        raise InvalidConstraintsTypeError()
@@ -1,4 +1,4 @@
-import random
+import copy
 import time
 
 from datadog import statsd
@@ -6,25 +6,35 @@ from django.core.signing import Signer
 
 from cabinet import cabinet_api
 from core.utils.constants import OpenShikshaQuestionType
+from croupier.dealing import DEALING_VERSION, DealingRandom
 
 SIGNER = Signer()
 
-def deal(undealt_questions):
+def build_rng(seed, dealing_version=DEALING_VERSION):
+    """
+    The random number generator for one dealing. Dealing never touches the global random, so any number of dealings can
+    run at the same time (threads). Seeded like the global random used to be, so a seed gives the same assignment for
+    the same dealing version (see croupier.dealing)
+    """
+    return DealingRandom(seed, dealing_version)
+
+
+def deal(undealt_questions, rng):
     """
     This method takes undealt questions, deals them (variable value selection, substitution and evaluation) and then
     returns just the dealt questions as regular data models
     """
     dealt_questions = []
     for undealt_question in undealt_questions:
-        dealt_questions.append(undealt_question.deal())
+        dealt_questions.append(undealt_question.deal(rng))
     return dealt_questions
 
-def shuffle(undealt_questions):
+def shuffle(undealt_questions, rng):
     """
     Shuffles the given list of questions as well as the options of any MCQs in the list using the given technique
     """
     # first shuffle question order (IN PLACE)
-    random.shuffle(undealt_questions)
+    rng.shuffle(undealt_questions)
 
     for undealt_question in undealt_questions:
         for subpart in undealt_question.question_data.subparts:
@@ -33,38 +43,100 @@ def shuffle(undealt_questions):
                 # storing a separate option order rather than ordering a list of options so that we can still easily
                 # identify the correct and incorrect options based on the human-readable template format
                 options_order = range(subpart.options.get_option_count())
-                random.shuffle(options_order)
+                rng.shuffle(options_order)
                 subpart.options.order = options_order
 
-def build_assignment_user_seed(user, assignment_questions_list):
-    return build_assignment(user.pk, user, assignment_questions_list)
+@statsd.timed('croupier.build_assignment_user_seed')
+def build_assignment_user_seed(user, assignment_questions_list, dealing_version=None):
+    """
+    The assignment as dealt for the user's own seed (read-only views and previews). Dealt once for every question bank
+    revision and set of questions of the aql, and served from the cabinet cache after that
+    @param dealing_version: the dealing version of the assignment (Assignment.dealing_version), the current
+    DEALING_VERSION if None (previews of an aql not yet assigned)
+    """
+    if dealing_version is None:
+        dealing_version = DEALING_VERSION
+
+    question_pks = list(assignment_questions_list.questions.values_list('pk', flat=True))
+    cache_url = cabinet_api.build_dealt_assignment_cache_url(user.pk, assignment_questions_list, question_pks,
+                                                             dealing_version)
+
+    dealt_questions = cabinet_api.get_cached_dealt_assignment(cache_url)
+    if dealt_questions is None:
+        dealt_questions = build_assignment(user.pk, assignment_questions_list, dealing_version)
+        cabinet_api.cache_dealt_assignment(cache_url, dealt_questions)
+    return dealt_questions
 
 
 def build_assignment_time_seed(student, assignment_questions_list):
-    return build_assignment(time.time(), student, assignment_questions_list)
+    return build_assignment('%s:%s' % (time.time(), student.pk), assignment_questions_list)
 
 
 @statsd.timed('croupier.build_assignment')
-def build_assignment(seed, user, assignment_questions_list):
+def build_assignment(seed, assignment_questions_list, dealing_version=DEALING_VERSION):
 
     # first we grab the question data to build the assignment from the cabinet
-    undealt_questions = cabinet_api.build_undealt_assignment(user, assignment_questions_list)
+    undealt_questions = cabinet_api.build_undealt_assignment(assignment_questions_list)
+
+    return deal_assignment(seed, undealt_questions, dealing_version)
+
 
+def deal_assignment(seed, undealt_questions, dealing_version=DEALING_VERSION):
     # setup random with the seed for this round of building the assignment
-    seed = SIGNER.sign(seed)
-    random.seed(seed)
+    rng = build_rng(SIGNER.sign(seed), dealing_version)
 
     # then we use croupier to shiffle and deal the values
-    shuffle(undealt_questions)
-    return deal(undealt_questions)
+    shuffle(undealt_questions, rng)
+    return deal(undealt_questions, rng)
+
+
+def build_assignments_time_seed(students, assignment_questions_list):
+    timestamp = time.time()
+    return build_assignments(['%s:%s' % (timestamp, student.pk) for student in students], assignment_questions_list)
+
+
+@statsd.timed('croupier.build_assignments')
+def build_assignments(seeds, assignment_questions_list):
+    """
+    Batch version of build_assignment for many students of the same aql. The aql is fetched from the cabinet (and the
+    variable constraints of its subparts compiled) once, and then dealt for every seed - a seed gives the same questions
+    here as with build_assignment
+    @return: list of the dealt questions for each seed, in the order of the seeds
+    """
+    # the img urls of the questions are the same for every user, so the questions are fetched once for all of them
+    undealt_questions = cabinet_api.build_undealt_assignment(assignment_questions_list)
+
+    dealt_questions_list = []
+    for seed in seeds:
+        # dealing shuffles and substitutes in place, so every seed gets its own copy of the undealt questions
+        dealt_questions_list.append(deal_assignment(seed, copy.deepcopy(undealt_questions)))
+    return dealt_questions_list
 
 
 def deal_subpart(subpart, variable_constraints):
     # first initialize this dealer run with timestamp
-    random.seed(time.time())
+    rng = build_rng(time.time())
 
-    variable_constraints.process()
+    variable_constraints.process(rng)
 
     subpart.evaluate_substitute(variable_constraints.values)
 
     return subpart
+
+
+def iter_deal_subpart_batch(subpart, variable_constraints, num_deals, rng):
+    """
+    Deals the subpart a number of times in a row, all drawn from the one rng - the subpart is parsed and its constraints
+    compiled once for the whole batch, and every dealing substitutes into its own copy of the subpart
+    @return: iterator of (variable values, dealt subpart, error) for each dealing - the dealt subpart is None and the
+    error is the exception raised if the dealing failed
+    """
+    for _ in xrange(num_deals):
+        variable_constraints.process(rng)
+        dealt_subpart = copy.deepcopy(subpart)
+        try:
+            dealt_subpart.evaluate_substitute(variable_constraints.values)
+        except Exception, e:
+            yield variable_constraints.values, None, e
+            continue
+        yield variable_constraints.values, dealt_subpart, None
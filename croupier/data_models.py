@@ -16,10 +16,13 @@ class UndealtQuestionDM(object):
         self.question_data = QuestionDM(question_id, container, subparts)
         self.variable_constraints_list = variable_constraints_list
 
-    def deal(self):
+    def deal(self, rng):
+        """
+        @param rng: random.Random instance the variable values are drawn from
+        """
         values = {}  # common dict which will be extended with every subsequent subpart's variable values
         for i, constraints in enumerate(self.variable_constraints_list):
-            constraints.process()  # first select the value based on constraint
+            constraints.process(rng)  # first select the value based on constraint
             values.update(constraints.values)
             self.question_data.subparts[i].evaluate_substitute(values)
 
@@ -0,0 +1,31 @@
+# This file provides the dealing versions and the random number generator every dealing draws from
+#
+# The same seed has to deal the same values for as long as anything dealt from it is expected to stay the same (the
+# assignment dealt for the user's own seed is shown again on every read-only view). Whenever a change makes a seed deal
+# different values, DEALING_VERSION is bumped, the old way of drawing is kept for the old version, and the version an
+# assignment was created with is stored on it (Assignment.dealing_version), so its seeds keep dealing the old values
+import random
+
+# dealing versions
+#   1: range constraints are sampled with every processed range equally likely (a value drawn from every processed
+#      range, and then one of those picked)
+#   2: range constraints are sampled with every valid value equally likely
+PER_RANGE_DEALING_VERSION = 1
+DEALING_VERSION = 2
+
+
+class DealingRandom(random.Random):
+    """
+    random.Random that carries the dealing version the values are drawn for
+    """
+
+    def __new__(cls, seed=None, dealing_version=DEALING_VERSION):
+        # random.Random seeds itself with the arguments of __new__ as well
+        return super(DealingRandom, cls).__new__(cls, seed)
+
+    def __init__(self, seed=None, dealing_version=DEALING_VERSION):
+        self.dealing_version = dealing_version
+        super(DealingRandom, self).__init__(seed)
+
+    def __reduce__(self):
+        return self.__class__, (None, self.dealing_version), self.getstate()
@@ -37,3 +37,7 @@ class InvalidImgSubstitutionTagContentError(CroupierMalformedDataError):
 
 class RangeProcessingError(CroupierMalformedDataError):
     pass
+
+
+class SubpartIngestError(CroupierMalformedDataError):
+    pass
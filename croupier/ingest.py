@@ -0,0 +1,99 @@
+# This file provides the ingest of questions - run on the subparts of every question before they are written to the
+# cabinet (by the sphinx submit and the assignment setup of the question bank reloader)
+#
+# Malformed variable constraints, mismatched tags and expressions that fail to evaluate are caught here, instead of
+# when the question is first dealt to a student. Every subpart is written along with the artifact compiled from it (see
+# croupier.artifacts)
+from core.data_models.question import build_question_subpart_from_data
+from core.utils.regex import check_all_tags
+from core.utils.text_template import TextTemplate
+from croupier.artifacts import SUBPART_ARTIFACT_KEY, build_subpart_artifact
+from croupier.constraints import SubpartConstraintsPlan
+from croupier.croupier_api import build_rng
+from croupier.exceptions import SubpartIngestError
+from openshiksha import settings
+from openshiksha.exceptions import TagMismatchError
+
+
+def get_subpart_texts(data):
+    """
+    All the strings among the values of the subpart data, which include all the texts that are dealt
+    """
+    if isinstance(data, basestring):
+        yield data
+    elif isinstance(data, dict):
+        for value in data.itervalues():
+            for text in get_subpart_texts(value):
+                yield text
+    elif isinstance(data, list):
+        for value in data:
+            for text in get_subpart_texts(value):
+                yield text
+
+
+def prepare_subpart(subpart_data):
+    """
+    Validates the subpart data and compiles it
+    @return: (copy of the subpart data, SubpartConstraintsPlan, TextTemplates of its texts)
+    @throws: SubpartIngestError
+    """
+    # an artifact from an earlier ingest is compiled again
+    subpart_data = dict((key, value) for key, value in subpart_data.iteritems() if key != SUBPART_ARTIFACT_KEY)
+
+    try:
+        build_question_subpart_from_data(subpart_data)
+    except Exception, e:
+        raise SubpartIngestError('Malformed subpart data: %s' % e)
+
+    try:
+        plan = SubpartConstraintsPlan(subpart_data.get('variable_constraints'))
+    except Exception, e:
+        raise SubpartIngestError('Malformed variable constraints data: %s' % e)
+
+    templates = []
+    texts = set(text for key, value in subpart_data.iteritems() if key != 'variable_constraints' for text in
+                get_subpart_texts(value))
+    for text in sorted(texts):
+        try:
+            check_all_tags(text)
+        except TagMismatchError:
+            raise SubpartIngestError('Mismatched tags in text: %s' % text)
+        if ('_{' in text) or ('}_' in text):
+            templates.append(TextTemplate(text))
+
+    return subpart_data, plan, templates
+
+
+def ingest_question(subparts_data, sample_deals=settings.CROUPIER_INGEST_SAMPLE_DEALS):
+    """
+    Validates the subparts of a question, deals the question a number of times and compiles the subparts. The values of
+    the variables are carried over from a subpart to the ones after it, as when the question is dealt
+    (UndealtQuestionDM.deal), so a subpart may use the variables of the subparts before it
+    @param subparts_data: data of the subparts of the question, in order
+    @return: copies of the subparts data with the compiled artifact in them, to be written to the cabinet
+    @throws: SubpartIngestError with the subpart and the reason it can not be dealt
+    """
+    prepared_subparts = []
+    for i, subpart_data in enumerate(subparts_data):
+        try:
+            prepared_subparts.append(prepare_subpart(subpart_data))
+        except SubpartIngestError, e:
+            raise SubpartIngestError('Subpart %s: %s' % (i + 1, e))
+
+    for seed in xrange(sample_deals):
+        rng = build_rng(seed)
+        values = {}
+        for i, (subpart_data, plan, templates) in enumerate(prepared_subparts):
+            subpart = build_question_subpart_from_data(subpart_data)
+            try:
+                subpart_values, options_selection_index = plan.evaluate(rng)
+                values.update(subpart_values)
+                subpart.evaluate_substitute(values)
+            except Exception, e:
+                raise SubpartIngestError('Subpart %s: Dealing error: %s' % (i + 1, e))
+
+    ingested_subparts_data = []
+    for subpart_data, plan, templates in prepared_subparts:
+        subpart_data[SUBPART_ARTIFACT_KEY] = build_subpart_artifact(plan, templates)
+        ingested_subparts_data.append(subpart_data)
+    return ingested_subparts_data
@@ -0,0 +1,76 @@
+# This file provides the sampling structure for the processed ranges of range constraints
+#
+# The valid values of a range constraint are the points of a grid (integers, or multiples of 10^-decimal) that lie in
+# its processed ranges. The number of grid points in each range is counted once, when the constraint is compiled, and a
+# value is then drawn with a single random number and a bisect over the running totals - every valid value is equally
+# likely, and the cost of a draw does not grow with the number of include and exclude ranges
+import math
+from bisect import bisect_right
+
+from croupier.exceptions import RangeProcessingError
+
+# decimal places kept when a range limit is converted to grid steps, so that limits computed in floats (the exclude
+# ranges cut out with a float step) land on the grid point they stand for
+STEP_ROUNDING_DIGITS = 6
+
+
+def to_steps(value, scale, round_up):
+    """
+    The grid point (in steps of 1 / scale) closest to the value from inside the range - rounding up for a range min and
+    down for a range max
+    """
+    if isinstance(value, (int, long)):
+        return value * scale
+    steps = round(value * scale, STEP_ROUNDING_DIGITS)
+    return long(math.ceil(steps) if round_up else math.floor(steps))
+
+
+class IntervalSet(object):
+    """
+    The grid points of a list of non-overlapping intervals, weighted by the number of points in each interval
+    """
+    __slots__ = ('mins', 'offsets', 'total', 'scale')
+
+    def __init__(self, intervals, decimal=None):
+        """
+        @param intervals: (min, max) pairs, both inclusive, in ascending order
+        @param decimal: number of decimal places of the values, integer values if None or 0
+        @throws: RangeProcessingError if there is no grid point in any of the intervals
+        """
+        self.scale = (10 ** decimal) if decimal else 1
+
+        mins = []
+        offsets = []  # number of grid points in all the intervals before each interval
+        total = 0
+        for interval_min, interval_max in intervals:
+            min_steps = to_steps(interval_min, self.scale, True)
+            max_steps = to_steps(interval_max, self.scale, False)
+            if max_steps < min_steps:
+                continue  # no grid point in the interval
+            mins.append(min_steps)
+            offsets.append(total)
+            total += max_steps - min_steps + 1
+
+        if total == 0:
+            raise RangeProcessingError()
+
+        self.mins = tuple(mins)
+        self.offsets = tuple(offsets)
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def get_value(self, index):
+        """
+        The value of the grid point at the index (0 <= index < total), in ascending order of the values
+        """
+        i = bisect_right(self.offsets, index) - 1
+        steps = self.mins[i] + (index - self.offsets[i])
+        if self.scale == 1:
+            return int(steps)
+        # the division is correctly rounded, so this is the float closest to the decimal value
+        return float(steps) / self.scale
+
+    def sample(self, rng):
+        return self.get_value(rng.randrange(self.total))
@@ -9,4 +9,6 @@ COMPILED_NGINX_CONF=devops/nginx.compiled.conf
 echo 'compiling nginx conf'
 cp devops/nginx.conf $COMPILED_NGINX_CONF
 
-sed -i "s|__WORKDIR__|${WORKDIR}|g" $COMPILED_NGINX_CONF
\ No newline at end of file
+sed -i "s|__WORKDIR__|${WORKDIR}|g" $COMPILED_NGINX_CONF
+sed -i "s|__CABINET_HOST__|${OPENSHIKSHA_CABINET_HOST}|g" $COMPILED_NGINX_CONF
+sed -i "s|__CABINET_PORT__|${OPENSHIKSHA_CABINET_PORT}|g" $COMPILED_NGINX_CONF
\ No newline at end of file
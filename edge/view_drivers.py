@@ -48,12 +48,12 @@ class SubjectIdGet(GroupDriven):
 
     def teacher_endpoint(self):
         if self.user == self.subjectroom.teacher or self.user == self.subjectroom.classRoom.classTeacher:
-            return OpenShikshaJsonResponse(SubjectRoomEdgeData(self.user, self.subjectroom))
+            return OpenShikshaJsonResponse(SubjectRoomEdgeData(self.subjectroom))
         return Json404Response()
 
     def admin_endpoint(self):
         if self.user.userinfo.school == self.subjectroom.classRoom.school:
-            return OpenShikshaJsonResponse(SubjectRoomEdgeData(self.user, self.subjectroom))
+            return OpenShikshaJsonResponse(SubjectRoomEdgeData(self.subjectroom))
         return Json404Response()
 
 
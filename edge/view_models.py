@@ -7,6 +7,7 @@ from core.utils.json import JSONModel
 from core.utils.labels import get_user_label, get_subjectroom_label, get_percentage_label
 from core.utils.references import OpenShikshaGroup
 from core.view_models.base import AuthenticatedBody
+from croupier.croupier_api import build_rng
 from edge.models import StudentProficiency, SubjectRoomProficiency, SubjectRoomQuestionMistake
 
 UNSELECTED_OPTION = (0, "---------")
@@ -130,15 +131,15 @@ class StudentEdgeData(EdgeDataBase):
 
 
 class QuestionPreview(JSONModel):
-    def __init__(self, user, question_db):
-        undealt_question_dm = get_question_with_img_urls(user, question_db)
-        self.data_model = undealt_question_dm.deal()
+    def __init__(self, question_db):
+        undealt_question_dm = get_question_with_img_urls(question_db)
+        self.data_model = undealt_question_dm.deal(build_rng(None))  # any values do for a preview
 
 
 class SubjectRoomEdgeData(EdgeDataBase):
     NUM_PROBLEMATIC_QUESTIONS = 3
 
-    def __init__(self, user, subjectroom):
+    def __init__(self, subjectroom):
         positive = [ProficiencyVM.from_proficiency(proficiency) for proficiency in
                     SubjectRoomProficiency.get_positives(subjectroom)]
         negative = [ProficiencyVM.from_proficiency(proficiency) for proficiency in
@@ -151,6 +152,6 @@ class SubjectRoomEdgeData(EdgeDataBase):
 
         super(SubjectRoomEdgeData, self).__init__(positive, negative, application, conceptual, critical, tablerows)
 
-        self.questions = [QuestionPreview(user, subjectroom_question_mistake.question) for subjectroom_question_mistake
+        self.questions = [QuestionPreview(subjectroom_question_mistake.question) for subjectroom_question_mistake
                           in SubjectRoomQuestionMistake.objects.filter(subjectRoom=subjectroom).order_by('-regression')[
                              :SubjectRoomEdgeData.NUM_PROBLEMATIC_QUESTIONS]]
@@ -13,7 +13,7 @@ def grade(submission, register_ticks):
     submission.save()
 
     # update the submission in cabinet
-    cabinet_api.update_submission(submission, submission_dm)
+    cabinet_api.update_submission_answers(submission, submission_dm.answers)
 
 
 def perform_correction(submission, submission_dm, register_ticks):
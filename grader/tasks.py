@@ -1,5 +1,6 @@
-from celery import shared_task
+from celery import shared_task, chord
 import argparse
+import heapq
 import traceback
 from datetime import timedelta
 
@@ -12,10 +13,11 @@ from django.db.models import Avg, Q
 from core.models import Assignment, Submission, SubjectRoom
 from core.utils.assignment import is_corrected_open_assignment, check_homework_assignment
 from core.utils.references import OpenShikshaGroup
-from core.view_drivers.assignment_id import create_shell_submission
+from core.view_drivers.assignment_id import create_shell_submissions
 from edge.edge_api import reset_edge_data, calculate_edge_data
 from focus.models import Remedial
 from grader import grader_api
+from openshiksha import settings
 from pylon.scripts import notify_overnight, notify_due
 from scripts.email.openshiksha_users import runscript_args_workaround
 
@@ -25,9 +27,12 @@ def grade(reset = False, notify = False):
     """
     Grade pending assignments
 
+    The assignments are split into batches that are graded by parallel subtasks, after which finish_grading (the chord
+    callback) updates the assignments, calculates edge data and notifies
+
     :param reset: Grade all assignments in system, not just pending. Defaults to false
     :param notify: Use pylon API to notify. Defaults to false. Cannot be used with reset.
-    :returns: Grading report
+    :returns: Dispatch report (the grading report is the result of finish_grading)
     """
     # get current datetime
     now = django.utils.timezone.now()
@@ -37,34 +42,28 @@ def grade(reset = False, notify = False):
         # reset edge data if all the calculations are to be redone
         reset_edge_data()
 
-    success = False
     try:
-        report.append(handle_assignments(reset))
-        try:
-            report.append(calculate_edge_data())
-            success = True
-        except:
-            report.append('Error while calculating edge data: %s' % traceback.format_exc())
+        batches = build_grading_batches(reset)
     except:
-        report.append('Error while handling closed assignments: %s' % traceback.format_exc())
+        report.append('Error while finding assignments to grade: %s' % traceback.format_exc())
         report.append('Skipping calculating edge data')
+        return report
 
-    if success:
-        # only notify if grading is successful
-        if (not reset) and notify:
-            # notify if it is not a reset run and if the notify flag is set explicitly
-            report.append(notify_overnight.run())
-            report.append(notify_due.run())
+    if not batches:
+        # nothing to grade, but ticks of submissions corrected since the last run are still processed
+        return finish_grading([], reset, notify, report)
 
+    report.append('Grading %s assignments in %s batches' % (sum(len(batch) for batch in batches), len(batches)))
+    chord(grade_assignments.s(batch, reset) for batch in batches)(finish_grading.s(reset, notify, report))
     return report
 
 
-def handle_assignments(reset):
-    assignments_graded = 0
-    submissions_graded = 0
-    shell_submissions_created = 0
-    remedials_created = 0
-
+def build_grading_batches(reset):
+    """
+    Splits the assignments to be graded into at most GRADER_MAX_CONCURRENT_BATCHES batches with about the same number
+    of submissions each
+    :returns: list of lists of assignment pks
+    """
     # build filter for assignments that need to be graded
     now = django.utils.timezone.now()
     past_hw_filter = Q(due__lt=now) & (~Q(content_type=ContentType.objects.get_for_model(User)))
@@ -82,39 +81,142 @@ def handle_assignments(reset):
     else:
         assignments_filter = past_hw_filter & Q(average__isnull=True)
 
-    for assignment in Assignment.objects.filter(assignments_filter):
-
+    weighted_assignments = []
+    for assignment in Assignment.objects.filter(assignments_filter).prefetch_related('content_object'):
         if is_corrected_open_assignment(assignment):
-            # open assignments should only be graded by this script if reset is being done
-            assert reset
-            #  grade the submission
-            grader_api.grade(Submission.objects.get(assignment=assignment), True)
-            submissions_graded += 1
-
+            weighted_assignments.append((assignment.pk, 1))
         else:
-            check_homework_assignment(assignment)
-
-            students = assignment.content_object.students.all()
-            # check if submission exists for each student in the assignment's target student set
-            for student in students:
-                try:
-                    submission = Submission.objects.get(student=student, assignment=assignment)
-                except Submission.DoesNotExist:
-                    submission = create_shell_submission(assignment, student, assignment.due)
-                    shell_submissions_created += 1
-
-                # grade each submission individually using grader
-                grader_api.grade(submission, True)
-                submissions_graded += 1
-
-        # update the database object with marks & completion - assignment
-        assignment.average = Submission.objects.filter(assignment=assignment).aggregate(Avg('marks'))[
-            'marks__avg']
-        assignment.completion = \
-            Submission.objects.filter(assignment=assignment).aggregate(Avg('completion'))[
-            'completion__avg']
+            weighted_assignments.append((assignment.pk, assignment.content_object.students.count()))
+
+    return split_grading_batches(weighted_assignments, settings.GRADER_MAX_CONCURRENT_BATCHES)
+
+
+def split_grading_batches(weighted_assignments, max_batches):
+    """
+    Splits the assignments into at most max_batches batches, with the total weight (number of submissions) of the
+    batches as even as possible - the heaviest assignments are placed first, each into the lightest batch so far
+    :param weighted_assignments: list of (assignment pk, weight)
+    :returns: list of non empty lists of assignment pks
+    """
+    num_batches = min(max_batches, len(weighted_assignments))
+    batches = [[] for _ in xrange(num_batches)]
+    batch_weights = [(0, i) for i in xrange(num_batches)]  # heap of (total weight, batch index)
+    for pk, weight in sorted(weighted_assignments, key=lambda weighted_assignment: weighted_assignment[1],
+                             reverse=True):
+        batch_weight, i = heapq.heappop(batch_weights)
+        batches[i].append(pk)
+        heapq.heappush(batch_weights, (batch_weight + weight, i))
+    return batches
+
+
+@shared_task
+def grade_assignments(assignment_pks, reset):
+    """
+    Grades every submission of the given assignments (creating shell submissions for the students without one)
+
+    Errors are caught for each assignment, so that one bad assignment does not stop the grading of the others - it is
+    left out of the graded assignments and is graded again by the next run
+    :returns: dict with the graded assignment pks, the counts for the report and the errors
+    """
+    result = {
+        'graded': [],
+        'submissions_graded': 0,
+        'shell_submissions_created': 0,
+        'errors': []
+    }
+
+    for assignment in Assignment.objects.filter(pk__in=assignment_pks):
+        try:
+            submissions_graded, shell_submissions_created = grade_assignment(assignment, reset)
+        except:
+            result['errors'].append('Error while grading assignment %s: %s' % (assignment.pk, traceback.format_exc()))
+            continue
+
+        result['graded'].append(assignment.pk)
+        result['submissions_graded'] += submissions_graded
+        result['shell_submissions_created'] += shell_submissions_created
+
+    return result
+
+
+def grade_assignment(assignment, reset):
+    """
+    :returns: number of submissions graded, number of shell submissions created
+    """
+    if is_corrected_open_assignment(assignment):
+        # open assignments should only be graded by this script if reset is being done
+        assert reset
+        #  grade the submission
+        grader_api.grade(Submission.objects.get(assignment=assignment), True)
+        return 1, 0
+
+    check_homework_assignment(assignment)
+
+    students = assignment.content_object.students.all()
+    # check if submission exists for each student in the assignment's target student set
+    submissions = dict((submission.student_id, submission) for submission in
+                       Submission.objects.filter(assignment=assignment, student__in=students))
+    missing_students = [student for student in students if student.pk not in submissions]
+    if missing_students:
+        # the shells of all the students without a submission are dealt and written together
+        for submission in create_shell_submissions(assignment, missing_students, assignment.due):
+            submissions[submission.student_id] = submission
+
+    for student in students:
+        # grade each submission individually using grader
+        grader_api.grade(submissions[student.pk], True)
+
+    return len(students), len(missing_students)
+
+
+@shared_task
+def finish_grading(batch_results, reset, notify, report):
+    """
+    Chord callback of the grading subtasks - updates the graded assignments, creates remedials, calculates edge data
+    and notifies (only if everything was graded)
+
+    :param batch_results: results of grade_assignments
+    :param report: report of the run so far
+    :returns: Grading report
+    """
+    success = False
+    try:
+        report.append(handle_graded_assignments(batch_results, reset))
+        try:
+            report.append(calculate_edge_data())
+            success = not any(batch_result['errors'] for batch_result in batch_results)
+        except:
+            report.append('Error while calculating edge data: %s' % traceback.format_exc())
+    except:
+        report.append('Error while handling closed assignments: %s' % traceback.format_exc())
+        report.append('Skipping calculating edge data')
+
+    if success:
+        # only notify if grading is successful
+        if (not reset) and notify:
+            # notify if it is not a reset run and if the notify flag is set explicitly
+            report.append(notify_overnight.run())
+            report.append(notify_due.run())
+
+    return report
+
+
+def handle_graded_assignments(batch_results, reset):
+    assignment_pks = [pk for batch_result in batch_results for pk in batch_result['graded']]
+    remedials_created = 0
+
+    # the marks & completion of all the graded assignments are averaged in a single query
+    averages = dict((values['assignment'], values) for values in
+                    Submission.objects.filter(assignment__in=assignment_pks).values('assignment').annotate(
+                        Avg('marks'), Avg('completion')))
+
+    # remedials are created one at a time here, as the numbering of a new assignment depends on the earlier ones
+    for assignment in Assignment.objects.filter(pk__in=assignment_pks):
+        # update the database object with marks & completion - assignment (None if it has no submissions)
+        assignment_averages = averages.get(assignment.pk, {})
+        assignment.average = assignment_averages.get('marks__avg')
+        assignment.completion = assignment_averages.get('completion__avg')
         assignment.save()
-        assignments_graded += 1
 
         # only create remedials if:
         # assignment is for subjectroom
@@ -144,9 +246,13 @@ def handle_assignments(reset):
                                                                 due=assignment.due + timedelta(days=3))
                 remedials_created += 1
 
-    report = 'Assignments Graded: %s\n' % assignments_graded
-    report += 'Submissions Graded: %s\n' % submissions_graded
-    report += 'Shell Submissions Created: %s\n' % shell_submissions_created
+    report = 'Assignments Graded: %s\n' % len(assignment_pks)
+    report += 'Submissions Graded: %s\n' % sum(batch_result['submissions_graded'] for batch_result in batch_results)
+    report += 'Shell Submissions Created: %s\n' % sum(batch_result['shell_submissions_created'] for batch_result in
+                                                       batch_results)
     report += 'Remedials Created: %s\n' % remedials_created
+    for batch_result in batch_results:
+        for error in batch_result['errors']:
+            report += error + '\n'
 
     return report
\ No newline at end of file
@@ -208,6 +208,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cabinet.middleware.CabinetCallsMiddleware',
 )
 
 
@@ -318,3 +319,85 @@ else:
     raise InvalidOpenShikshaEnvError(ENVIRON)
 
 CELERY_RESULT_BACKEND = 'django-db'
+
+# Cabinet Settings
+# size of the per-process keep-alive connection pool used for all requests to the cabinet server
+CABINET_POOL_SIZE = int(os.getenv('OPENSHIKSHA_CABINET_POOL_SIZE', 10))
+# max number of cabinet files fetched concurrently when loading a full assignment (1 disables concurrent fetching)
+CABINET_FETCH_WORKERS = int(os.getenv('OPENSHIKSHA_CABINET_FETCH_WORKERS', 8))
+# byte bound of the in-process (first tier) cache for immutable cabinet question files
+CABINET_CACHE_MAX_BYTES = int(os.getenv('OPENSHIKSHA_CABINET_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# seconds after which a process checks the shared tier for cache invalidations
+CABINET_CACHE_GENERATION_TTL = 5
+# seconds after which entries expire from the shared (second tier) cache
+CABINET_SHARED_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# shared (second tier) cache - a local directory stands in for redis on LOCAL. Set to empty string to disable
+if ENVIRON == OpenShikshaEnv.LOCAL:
+    CABINET_SHARED_CACHE_URL = os.getenv('OPENSHIKSHA_CABINET_SHARED_CACHE_URL',
+                                         'file://' + os.path.join(os.path.expanduser('~'), 'openshiksha-cabinet-cache'))
+elif ENVIRON == OpenShikshaEnv.QA or ENVIRON == OpenShikshaEnv.PROD:
+    CABINET_SHARED_CACHE_URL = os.getenv('OPENSHIKSHA_CABINET_SHARED_CACHE_URL', CELERY_BROKER_URL + '/1')
+else:
+    raise InvalidOpenShikshaEnvError(ENVIRON)
+# storage backend used by the cabinet api - 'http' goes through the cabinet nginx server, 'filesystem' reads and writes
+# the cabinet directory directly (only when the cabinet lives on the same machine)
+CABINET_BACKEND = os.getenv('OPENSHIKSHA_CABINET_BACKEND', 'http')
+CABINET_ROOT = os.getenv('OPENSHIKSHA_CABINET_ROOT', os.path.join(os.path.expanduser('~'), 'openshiksha-cabinet'))
+# zlib compression level (1-9) for submission files written to the cabinet
+CABINET_SUBMISSION_COMPRESSION_LEVEL = 6
+# how the secure static view hands a cabinet file to the client once the signed url is validated - 'accel' returns an
+# X-Accel-Redirect to the internal nginx location below (see devops/nginx.conf), 'stream' streams the file through django
+SECURE_STATIC_DELIVERY = os.getenv('OPENSHIKSHA_SECURE_STATIC_DELIVERY',
+                                   'stream' if ENVIRON == OpenShikshaEnv.LOCAL else 'accel')
+SECURE_STATIC_ACCEL_LOCATION = '/cabinet-internal/'
+# bytes per chunk when streaming a cabinet file through django
+SECURE_STATIC_CHUNK_SIZE = 64 * 1024
+# secure static urls are signed for a time bucket of this many seconds (the url of a file is the same within a bucket, so
+# that browsers and proxies can cache it), and expire this many seconds after the start of their bucket
+SECURE_STATIC_TOKEN_BUCKET = 60 * 60
+SECURE_STATIC_TOKEN_MAX_AGE = 24 * 60 * 60
+# widths (in pixels) of the variants derived from cabinet images - wider images are scaled down to these for the variants
+CABINET_IMAGE_VARIANT_WIDTHS = {
+    'thumb': 160,
+    'mobile': 480,
+}
+# jpeg quality used when recompressing the image variants
+CABINET_IMAGE_VARIANT_JPEG_QUALITY = 80
+# the mobile variant is picked for clients whose viewport (Viewport-Width client hint) is at most this many pixels wide
+CABINET_IMAGE_MOBILE_VIEWPORT_WIDTH = 768
+# seconds to wait for a connection to the cabinet server, and for each read from it (a stalled cabinet must never hold
+# a gunicorn worker up to its timeout)
+CABINET_CONNECT_TIMEOUT = float(os.getenv('OPENSHIKSHA_CABINET_CONNECT_TIMEOUT', 2.0))
+CABINET_READ_TIMEOUT = float(os.getenv('OPENSHIKSHA_CABINET_READ_TIMEOUT', 5.0))
+# times a failed cabinet GET is retried, with a random backoff of up to base * 2^attempt (capped at max) seconds
+CABINET_GET_RETRIES = int(os.getenv('OPENSHIKSHA_CABINET_GET_RETRIES', 2))
+CABINET_RETRY_BACKOFF_BASE = 0.1
+CABINET_RETRY_BACKOFF_MAX = 1.0
+# consecutive failed cabinet calls after which cabinet calls fail straight away, for the given number of seconds
+CABINET_BREAKER_FAILURE_THRESHOLD = int(os.getenv('OPENSHIKSHA_CABINET_BREAKER_FAILURE_THRESHOLD', 5))
+CABINET_BREAKER_RESET_TIMEOUT = int(os.getenv('OPENSHIKSHA_CABINET_BREAKER_RESET_TIMEOUT', 10))
+# max number of cabinet files written concurrently for a batch of files (1 disables concurrent writing)
+CABINET_WRITE_WORKERS = int(os.getenv('OPENSHIKSHA_CABINET_WRITE_WORKERS', 8))
+# whether responses carry the X-Cabinet-Calls debug headers (cabinet round trips, bytes and cache hits of the request)
+CABINET_CALLS_HEADER = DEBUG
+# max number of compiled subpart variable constraints kept by croupier (per process)
+CROUPIER_PLAN_CACHE_MAX_ENTRIES = 10000
+# max number of compiled question texts (evaluation and substitution tags) kept for dealing (per process)
+TEXT_TEMPLATE_CACHE_MAX_ENTRIES = 50000
+# number of sample dealings every question subpart must survive before it is written to the cabinet
+CROUPIER_INGEST_SAMPLE_DEALS = 10
+# max number of dealings of a subpart in a single sphinx batch deal, and max number of distinct dealt subparts returned
+SPHINX_MAX_BATCH_DEALS = 5000
+SPHINX_MAX_BATCH_DEAL_OUTPUTS = 100
+# max number of grading subtasks of a grader run (each grades its submissions one at a time), which bounds the cabinet
+# requests made by grading however many celery workers there are
+GRADER_MAX_CONCURRENT_BATCHES = int(os.getenv('OPENSHIKSHA_GRADER_MAX_CONCURRENT_BATCHES', 8))
+# whether the cabinet server enforces the If-None-Match: * and If-Match: * preconditions of PUTs (refusing them with
+# 412), so that create-only and update-only cabinet writes are single PUTs - stock nginx dav ignores them, so by default
+# create-only writes go through a temporary file moved into place with Overwrite: F (see devops/cabinet-nginx.conf)
+CABINET_CONDITIONAL_WRITES = bool(os.getenv('OPENSHIKSHA_CABINET_CONDITIONAL_WRITES'))
+# seconds after which entries expire from the in-process (first tier) cabinet cache - bounds how long a process may
+# serve a cabinet file invalidated by another process
+CABINET_CACHE_LOCAL_TTL = 60
+# byte bound of the directory standing in for the shared (second tier) cabinet cache on LOCAL
+CABINET_FILE_SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
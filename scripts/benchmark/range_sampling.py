@@ -0,0 +1,52 @@
+# to use this script, run following command from the terminal
+# python manage.py runscript scripts.benchmark.range_sampling --script-args="#e 10 100 1000 #n 20000"
+#
+# Measures the cost of drawing a value for a range constraint with a growing number of exclude ranges - the compiled
+# interval set (a single random number and a bisect per draw) against drawing from every processed range and then
+# picking one of the draws, as range constraints are evaluated for dealing version 1. Both are timed on already
+# processed ranges, so only the cost of a draw is compared
+
+import argparse
+import time
+
+from croupier.constraints import RangeConstraint, compile_range_constraint
+from croupier.croupier_api import build_rng
+from croupier.dealing import PER_RANGE_DEALING_VERSION, DEALING_VERSION
+from scripts.email.openshiksha_users import runscript_args_workaround
+
+
+def build_range_data(num_excludes, decimal):
+    # one wide include range, with evenly spread exclude ranges cut out of it
+    return {
+        'include': [[0, num_excludes * 10 + 10]],
+        'exclude': [[i * 10 + 3, i * 10 + 5] for i in xrange(num_excludes)],
+        'decimal': decimal
+    }
+
+
+def time_draws(draw, num_draws):
+    start = time.time()
+    for _ in xrange(num_draws):
+        draw()
+    return (time.time() - start) * 1000000 / num_draws
+
+
+def run(*args):
+    parser = argparse.ArgumentParser(description="Benchmark the sampling of range constraints")
+    parser.add_argument('--excludes', '-e', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help="numbers of exclude ranges to benchmark")
+    parser.add_argument('--draws', '-n', type=int, default=20000, help="number of draws timed for each case")
+
+    processed_args = parser.parse_args(runscript_args_workaround(args) if args else [])
+    print 'Running with args:', processed_args
+
+    per_interval_rng = build_rng(0, PER_RANGE_DEALING_VERSION)
+    interval_set_rng = build_rng(0, DEALING_VERSION)
+    print '%10s %8s %12s %16s %16s' % ('excludes', 'decimal', 'intervals', 'per interval us', 'interval set us')
+    for num_excludes in processed_args.excludes:
+        for decimal in [None, 2]:
+            plan = compile_range_constraint(RangeConstraint(build_range_data(num_excludes, decimal)))
+            per_interval_us = time_draws(lambda: plan.evaluate(per_interval_rng, None), processed_args.draws)
+            interval_set_us = time_draws(lambda: plan.evaluate(interval_set_rng, None), processed_args.draws)
+            print '%10s %8s %12s %16.2f %16.2f' % (num_excludes, decimal or '-', len(plan.intervals), per_interval_us,
+                                                   interval_set_us)
@@ -0,0 +1,98 @@
+# to use this script, run following command from the terminal (with the cabinet reachable)
+# python manage.py runscript scripts.benchmark.secure_static --script-args="#s <submission-id> #n 40 #v 3 #i 600"
+#
+# Measures the bytes proxied through django by the secure static view when the students of a class view a typical
+# submission page (the images of the given submission) a number of times. The browser cache of every student is
+# simulated from the caching headers sent by the view (private, so nothing is shared between students through a proxy)
+# - compared against per user secure urls without caching headers, where every view of the page proxies every image
+# again
+
+import argparse
+import time
+
+from django.test import RequestFactory
+from mock import patch, NonCallableMagicMock
+
+from cabinet import cabinet_api
+from core.models import Submission
+from core.utils.constants import SecureStaticDelivery
+from core.utils.json import dump_json_string_compact
+from core.views import secure_static_get
+from openshiksha import settings
+from scripts.email.openshiksha_users import runscript_args_workaround
+
+
+def get_page_img_urls(submission):
+    submission_dm = cabinet_api.get_submission(submission)
+    questions_json = dump_json_string_compact(submission_dm.questions)
+    return sorted(set(match.group(0) for match in cabinet_api.SECURE_STATIC_URL_REGEX.finditer(questions_json)))
+
+
+def get_max_age(response):
+    return int(response['Cache-Control'].split('max-age=')[1])
+
+
+class CacheSimulation(object):
+    def __init__(self):
+        self.request_factory = RequestFactory()
+        self.user = NonCallableMagicMock()
+        self.proxied_bytes = 0
+        self.proxied_requests = 0
+
+    def request(self, url, now, browser_cache):
+        browser_entry = browser_cache.get(url)
+        if (browser_entry is not None) and (browser_entry[1] > now):
+            return  # fresh in the browser cache
+
+        request = self.request_factory.get(url)
+        if browser_entry is not None:
+            request.META['HTTP_IF_NONE_MATCH'] = browser_entry[0]
+        request.user = self.user
+        response = secure_static_get(request, cabinet_api.SECURE_STATIC_URL_REGEX.match(url).group(1))
+        assert response.status_code in [200, 304]
+
+        self.proxied_requests += 1
+        if response.status_code == 200:
+            self.proxied_bytes += sum(len(chunk) for chunk in response.streaming_content)
+
+        browser_cache[url] = (response['ETag'], now + get_max_age(response))
+
+
+def run(*args):
+    parser = argparse.ArgumentParser(description="Benchmark the bytes proxied by the secure static view")
+    parser.add_argument('--submission', '-s', type=long, required=True, help="id of the submission whose page is viewed")
+    parser.add_argument('--students', '-n', type=int, default=40, help="number of students viewing the page")
+    parser.add_argument('--views', '-v', type=int, default=3, help="number of times each student views the page")
+    parser.add_argument('--interval', '-i', type=int, default=600, help="seconds between the views of a student")
+
+    processed_args = parser.parse_args(runscript_args_workaround(args) if args else [])
+    print 'Running with args:', processed_args
+
+    settings.SECURE_STATIC_DELIVERY = SecureStaticDelivery.STREAM  # bytes are only seen by django when streaming
+    submission = Submission.objects.get(pk=processed_args.submission)
+
+    simulation = CacheSimulation()
+    browser_caches = [{} for _ in xrange(processed_args.students)]
+    img_bytes = {}  # unsecure url -> bytes of the image
+    start = time.time()
+    page_views = 0
+
+    for view in xrange(processed_args.views):
+        for student in xrange(processed_args.students):
+            now = start + (view * processed_args.interval) + student
+            with patch('time.time', return_value=now):
+                for url in get_page_img_urls(submission):
+                    resource_url = cabinet_api.unsign_img_url_secure(
+                        cabinet_api.SECURE_STATIC_URL_REGEX.match(url).group(1))[0]
+                    if resource_url not in img_bytes:
+                        img_bytes[resource_url] = len(cabinet_api.get_static_content(resource_url))
+                    simulation.request(url, now, browser_caches[student])
+            page_views += 1
+
+    uncached_bytes = page_views * sum(img_bytes.itervalues())
+    print 'Images on the page: %s (%s bytes)' % (len(img_bytes), sum(img_bytes.itervalues()))
+    print 'Page views: %s' % page_views
+    print 'Proxied without caching: %s bytes in %s requests' % (uncached_bytes, page_views * len(img_bytes))
+    print 'Proxied with caching: %s bytes in %s requests' % (simulation.proxied_bytes, simulation.proxied_requests)
+    if uncached_bytes > 0:
+        print 'Reduction: %.1f%%' % (100.0 * (uncached_bytes - simulation.proxied_bytes) / uncached_bytes)
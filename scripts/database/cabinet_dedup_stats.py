@@ -0,0 +1,66 @@
+# to use this script, run following command from the terminal (on the machine where the cabinet lives)
+# python manage.py runscript scripts.database.cabinet_dedup_stats
+#
+# Reports how well the dealt questions of the submissions in the cabinet deduplicate into question blobs - the bytes
+# taken by a full copy of the questions per submission against the bytes of the distinct blobs plus the per submission
+# references. Submissions already referring to blobs are counted with the blob they refer to
+
+import os
+
+from cabinet.cabinet_api import build_unsigned_question_blob
+from cabinet.question_blobs import is_question_blob_reference
+from cabinet.submission_format import decode_submission, encode_submission
+from openshiksha import settings
+
+CABINET_SUBMISSIONS_DIR = os.path.join(settings.CABINET_ROOT, 'submissions')
+CABINET_QUESTION_BLOBS_DIR = os.path.join(settings.CABINET_ROOT, 'question_blobs')
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def read_blob(blob_hash):
+    return decode_submission(read_file(os.path.join(CABINET_QUESTION_BLOBS_DIR, blob_hash[:2], blob_hash + '.json')))
+
+
+def run():
+    question_sets = 0
+    referring_question_sets = 0
+    full_bytes = 0
+    references_bytes = 0
+    blobs_bytes = {}  # blob hash -> bytes of the blob
+
+    for dirpath, dirnames, filenames in os.walk(CABINET_SUBMISSIONS_DIR):
+        if os.path.basename(dirpath) == 'answers':
+            continue
+
+        for filename in filenames:
+            # either a questions file or a legacy submission file (questions and answers)
+            data = decode_submission(read_file(os.path.join(dirpath, filename)))
+            if is_question_blob_reference(data):
+                referring_question_sets += 1
+                blob_hash = data['blob']
+                if blob_hash not in blobs_bytes:
+                    blobs_bytes[blob_hash] = len(encode_submission(read_blob(blob_hash)))
+                reference_data = data
+                full_bytes += blobs_bytes[blob_hash]
+            else:
+                blob_hash, blob_data, reference_data = build_unsigned_question_blob(data['questions'])
+                if blob_hash not in blobs_bytes:
+                    blobs_bytes[blob_hash] = len(encode_submission(blob_data))
+                full_bytes += len(encode_submission({'questions': data['questions']}))
+
+            question_sets += 1
+            references_bytes += len(encode_submission(reference_data))
+
+    print 'Question sets found: %s (%s already referring to blobs)' % (question_sets, referring_question_sets)
+    if question_sets == 0:
+        return
+
+    deduped_bytes = sum(blobs_bytes.itervalues()) + references_bytes
+    print 'Distinct question sets: %s' % len(blobs_bytes)
+    print 'Full copies: %s bytes (%s per submission)' % (full_bytes, full_bytes / question_sets)
+    print 'Blobs and references: %s bytes (%s per submission)' % (deduped_bytes, deduped_bytes / question_sets)
+    print 'Dedup ratio: %.2f' % (float(full_bytes) / deduped_bytes)
@@ -0,0 +1,67 @@
+# to use this script, run following command from the terminal (on the machine where the cabinet lives)
+# python manage.py runscript scripts.database.cabinet_gc --script-args="#d #v"
+#
+# Collects the files orphaned in the cabinet - submissions and question containers whose rows are gone from the db,
+# question subparts no live container of their chapter lists any more, images no live question of their chapter refers
+# to any more, and question blobs without references. Run with
+# #d (dry run) first to see what would go, and with #q <dir> to move the orphans into a quarantine directory (keeping
+# their paths relative to the cabinet root) instead of deleting them
+
+import argparse
+import time
+
+from cabinet.garbage_collector import CabinetGarbageCollector, CabinetGCKind
+from cabinet.models import QuestionBlob
+from core.models import Submission, Question
+from openshiksha import settings
+from scripts.email.openshiksha_users import runscript_args_workaround
+
+
+def load_pks(queryset, field='pk'):
+    # only the pks are streamed from the db, never the rows
+    return set(queryset.values_list(field, flat=True).iterator())
+
+
+def run(*args):
+    parser = argparse.ArgumentParser(description="Collect the files orphaned in the cabinet")
+    parser.add_argument('--dry-run', '-d', action='store_true', help="only report the orphans")
+    parser.add_argument('--quarantine', '-q', default=None, help="directory to move the orphans to instead of deleting")
+    parser.add_argument('--workers', '-w', type=int, default=8, help="number of school directories walked at once")
+    parser.add_argument('--min-age', '-a', type=int, default=3600,
+                        help="seconds since the last modification before an orphan is collected")
+    parser.add_argument('--verbose', '-v', action='store_true', help="print every orphan")
+
+    processed_args = parser.parse_args(runscript_args_workaround(args) if args else [])
+    print 'Running with args:', processed_args
+
+    start = time.time()
+    submission_pks = load_pks(Submission.objects.all())
+    question_pks = load_pks(Question.objects.all())
+    question_blob_hashes = load_pks(QuestionBlob.objects.filter(references__gt=0), 'hash')
+    print 'Loaded %s submissions, %s questions and %s question blobs from db in %.1fs' % (
+        len(submission_pks), len(question_pks), len(question_blob_hashes), time.time() - start)
+
+    start = time.time()
+    collector = CabinetGarbageCollector(settings.CABINET_ROOT, submission_pks, question_pks, question_blob_hashes,
+                                        processed_args.min_age, processed_args.dry_run, processed_args.quarantine,
+                                        processed_args.workers, processed_args.verbose)
+    stats = collector.run()
+    print 'Walked the cabinet in %.1fs' % (time.time() - start)
+
+    for kind in CabinetGCKind.ALL:
+        print '%s: %s scanned, %s orphaned (%s bytes), %s too recent, %s unknown' % (
+            kind, stats[kind + '.scanned'], stats[kind + '.orphaned'], stats[kind + '.bytes'],
+            stats[kind + '.recent'], stats[kind + '.unknown'])
+    if stats[CabinetGCKind.SUBPART + '.unreadable'] > 0:
+        print 'Subparts skipped (unreadable containers): %s' % stats[CabinetGCKind.SUBPART + '.unreadable']
+    if stats[CabinetGCKind.IMAGE + '.unreadable'] > 0:
+        print 'Image directories skipped (unreadable questions): %s' % stats[CabinetGCKind.IMAGE + '.unreadable']
+    print 'Question blob references given up by collected submissions: %s' % stats[
+        CabinetGCKind.QUESTION_BLOB + '.dereferenced']
+
+    if processed_args.dry_run:
+        print 'Dry run - nothing collected'
+    elif processed_args.quarantine is not None:
+        print 'Orphans moved to', processed_args.quarantine
+    else:
+        print 'Orphans deleted'
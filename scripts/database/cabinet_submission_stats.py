@@ -0,0 +1,69 @@
+# to use this script, run following command from the terminal (on the machine where the cabinet lives)
+# python manage.py runscript scripts.database.cabinet_submission_stats
+#
+# Reports the bytes per submission in the cabinet for the legacy (pretty-printed json) and the compact submission
+# formats, by re-encoding every submission found in the cabinet in both formats. A split submission (its questions and
+# answers files) counts as a single submission, just like one still in the legacy single file
+
+import os
+
+from cabinet.submission_format import decode_submission, encode_submission, is_legacy_submission
+from core.utils.json import dump_json_string
+from openshiksha import settings
+
+CABINET_SUBMISSIONS_DIR = os.path.join(settings.CABINET_ROOT, 'submissions')
+# directories of the files of split submissions, next to the legacy single files of their assignment
+SUBMISSION_QUESTIONS_DIR = 'questions'
+SUBMISSION_ANSWERS_DIR = 'answers'
+
+
+def iter_submission_files():
+    """
+    @return: iterator of the paths of the files of each submission in the cabinet - the questions and answers files of
+    a split submission, or the legacy single file
+    """
+    for dirpath, dirnames, filenames in os.walk(CABINET_SUBMISSIONS_DIR):
+        dirname = os.path.basename(dirpath)
+        if dirname == SUBMISSION_QUESTIONS_DIR:
+            continue  # read along with the answers file of the submission
+
+        for filename in filenames:
+            if dirname == SUBMISSION_ANSWERS_DIR:
+                questions_path = os.path.join(os.path.dirname(dirpath), SUBMISSION_QUESTIONS_DIR, filename)
+                yield [path for path in [questions_path, os.path.join(dirpath, filename)] if os.path.isfile(path)]
+            elif not os.path.isfile(os.path.join(dirpath, SUBMISSION_ANSWERS_DIR, filename)):
+                # a legacy file left next to the split files of the submission is not counted again
+                yield [os.path.join(dirpath, filename)]
+
+
+def run():
+    submissions = 0
+    legacy_submissions = 0
+    disk_bytes = 0
+    legacy_format_bytes = 0
+    compact_format_bytes = 0
+
+    for paths in iter_submission_files():
+        submission_data = {}
+        is_legacy = False
+        for path in paths:
+            with open(path, 'rb') as f:
+                raw = f.read()
+
+            submission_data.update(decode_submission(raw))
+            is_legacy = is_legacy or is_legacy_submission(raw)
+            disk_bytes += len(raw)
+
+        submissions += 1
+        legacy_submissions += is_legacy
+        legacy_format_bytes += len(dump_json_string(submission_data))
+        compact_format_bytes += len(encode_submission(submission_data))
+
+    print 'Submissions found: %s (%s still in legacy format)' % (submissions, legacy_submissions)
+    if submissions == 0:
+        return
+
+    print 'Bytes on disk: %s (%s per submission)' % (disk_bytes, disk_bytes / submissions)
+    print 'Legacy format: %s (%s per submission)' % (legacy_format_bytes, legacy_format_bytes / submissions)
+    print 'Compact format: %s (%s per submission)' % (compact_format_bytes, compact_format_bytes / submissions)
+    print 'Reduction: %.1f%%' % (100.0 * (legacy_format_bytes - compact_format_bytes) / legacy_format_bytes)
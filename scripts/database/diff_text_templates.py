@@ -0,0 +1,80 @@
+# to use this script, run following command from the terminal
+# python manage.py runscript scripts.database.diff_text_templates --script-args="#s 20"
+#
+# Checks that the compiled text templates render every text of every subpart in the question bank exactly as the
+# uncompiled evaluate_substitute does (or fail with the same error), for the variable values dealt with each of the
+# given number of seeds. Prints every difference found
+
+import argparse
+import time
+
+from cabinet.cabinet_api import build_question_data_url, get_resource_content
+from cabinet.garbage_collector import get_data_strings
+from core.models import Question
+from core.utils.constants import OpenShikshaQuestionDataType
+from core.utils.regex import evaluate_substitute_uncompiled
+from core.utils.text_template import TextTemplate
+from croupier.constraints import SubpartVariableConstraints
+from croupier.croupier_api import build_rng
+from scripts.email.openshiksha_users import runscript_args_workaround
+
+
+def render(render_func, *args):
+    try:
+        result = render_func(*args)
+        return result, type(result)
+    except Exception, e:
+        return type(e), str(e)
+
+
+def diff_subpart(subpart_data, seeds):
+    """
+    @return: (number of texts checked, number of renderings compared, list of (text, values, uncompiled, compiled))
+    """
+    texts = [text for text in get_data_strings(subpart_data) if ('_{' in text) or ('}_' in text)]
+    templates = [TextTemplate(text) for text in texts]
+    variable_constraints = SubpartVariableConstraints(subpart_data.get('variable_constraints'))
+
+    renderings = 0
+    differences = []
+    for seed in xrange(seeds):
+        variable_constraints.process(build_rng(seed))
+        for text, template in zip(texts, templates):
+            uncompiled = render(evaluate_substitute_uncompiled, text, variable_constraints.values)
+            compiled = render(template.render, variable_constraints.values)
+            renderings += 1
+            if compiled != uncompiled:
+                differences.append((text, dict(variable_constraints.values), uncompiled, compiled))
+    return len(texts), renderings, differences
+
+
+def run(*args):
+    parser = argparse.ArgumentParser(description="Compare the compiled and the uncompiled rendering of question texts")
+    parser.add_argument('--seeds', '-s', type=int, default=20, help="number of dealings per subpart")
+
+    processed_args = parser.parse_args(runscript_args_workaround(args) if args else [])
+    print 'Running with args:', processed_args
+
+    start = time.time()
+    subparts = 0
+    texts = 0
+    renderings = 0
+    differences = 0
+    for question in Question.objects.all().iterator():
+        container_data = get_resource_content(
+            build_question_data_url(question, OpenShikshaQuestionDataType.CONTAINER, question.pk))
+        for subpart in container_data['subparts']:
+            subpart_data = get_resource_content(
+                build_question_data_url(question, OpenShikshaQuestionDataType.SUBPART, subpart))
+            subpart_texts, subpart_renderings, subpart_differences = diff_subpart(subpart_data, processed_args.seeds)
+            subparts += 1
+            texts += subpart_texts
+            renderings += subpart_renderings
+            differences += len(subpart_differences)
+            for text, values, uncompiled, compiled in subpart_differences:
+                print 'Question %s subpart %s: %r with %r' % (question.pk, subpart, text, values)
+                print '    uncompiled: %r' % (uncompiled,)
+                print '    compiled:   %r' % (compiled,)
+
+    print 'Compared %s renderings of %s texts in %s subparts in %.1fs - %s differences' % (
+        renderings, texts, subparts, time.time() - start, differences)
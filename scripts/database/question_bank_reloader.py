@@ -3,6 +3,7 @@ import os
 
 from django.core.management import call_command
 
+from cabinet.cabinet_api import invalidate_question_cache
 from core.models import Chapter
 from core.utils.constants import OpenShikshaEnv
 from openshiksha import settings
@@ -202,4 +203,7 @@ def run():
     for j in xrange(i + 1, len(CONFIG['blocks'])):
         process_block(CONFIG['blocks'][j])
 
+    # question files in the cabinet have been rewritten, so none of the cached ones can be trusted anymore
+    invalidate_question_cache()
+
     enforcer_check()
@@ -0,0 +1,23 @@
+# to use this script, run following command from the terminal
+# python manage.py runscript scripts.database.split_cabinet_submissions
+#
+# Moves the submissions still in the legacy single file layout (submissions/.../<assignment>/<submission>.json) into
+# the separate questions and answers files (submissions/.../<assignment>/questions/<submission>.json and
+# submissions/.../<assignment>/answers/<submission>.json). Legacy submissions are also split on their first save, so
+# running this script is only needed to get rid of the legacy files (and the extra read on every legacy submission get)
+
+from cabinet import cabinet_api
+from core.models import Submission
+
+
+def run():
+    split = 0
+    submissions = 0
+
+    for submission in Submission.objects.select_related('assignment').iterator():
+        submissions += 1
+        if cabinet_api.split_legacy_submission(submission):
+            print 'Split submission:', submission.pk
+            split += 1
+
+    print 'Split %s of %s submissions' % (split, submissions)
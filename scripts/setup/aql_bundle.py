@@ -0,0 +1,35 @@
+# to use this script, run following command from the terminal
+# python manage.py runscript scripts.setup.aql_bundle --script-args="#a <aql-id> <aql-id> ..."
+# leave out the aql ids to (re)build the bundles of all the AQLs in the db
+#
+# This script builds the AQL bundle (single file with all the question data of an AQL) in the cabinet for AQLs that
+# were set up before bundles existed. New AQLs set up through scripts.setup.assignment get their bundles automatically
+# Rebuild the bundle of an AQL whose question files changed - the AQL is pointed to the new bundle (by content hash)
+
+import argparse
+
+from cabinet import cabinet_api
+from core.models import AssignmentQuestionsList
+from scripts.email.openshiksha_users import runscript_args_workaround
+
+
+def run(*args):
+    parser = argparse.ArgumentParser(description="Build the cabinet bundles for AQLs")
+    parser.add_argument('--aqls', '-a', type=long, nargs='*', help="ids of the aqls to build bundles for")
+
+    argv = runscript_args_workaround(args) if args else []
+    processed_args = parser.parse_args(argv)
+    print 'Running with args:', processed_args
+
+    if processed_args.aqls:
+        assignment_questions_lists = AssignmentQuestionsList.objects.filter(pk__in=processed_args.aqls)
+    else:
+        assignment_questions_lists = AssignmentQuestionsList.objects.all()
+
+    built = 0
+    for assignment_questions_list in assignment_questions_lists:
+        print 'Building bundle for AQL:', assignment_questions_list.pk
+        cabinet_api.build_aql_bundle(assignment_questions_list)
+        built += 1
+
+    print 'Built %s AQL bundles' % built
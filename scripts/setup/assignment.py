@@ -14,6 +14,7 @@
 # The output from this script ends up in the cabinet git repo it is pointed to. The additions (to the cabinet) are:
 #     - <repo-root>/
 #           -aql_meta/<board-id>/<school-id>/><standard-number>/<subject-id>/{aql-pk}.json  w/img
+#           -aql_bundle/<board-id>/<school-id>/><standard-number>/<subject-id>/<aql-pk>/{bundle-hash}.json
 #           -questions/
 #                   -containers/<board-id>/<school-id>/<standard-id>/<subject-id>/<chapter-id>/{question-pk.json} w/ img
 #                   -raw/<board-id>/<school-id>/<standard-id>/<subject-id>/<chapter-id>/{original-subpart-number.json} w/ img
@@ -26,10 +27,12 @@ import shutil
 
 from PIL import Image
 
+from cabinet.cabinet_api import build_aql_bundle_content, build_aql_bundle_question_data
 from core.models import AssignmentQuestionsList, Board, School, Standard, Subject, Question, Chapter, QuestionTag, \
     QuestionSubpart
 from core.utils.helpers import make_string_lean
 from core.utils.json import dump_json_string
+from croupier.ingest import ingest_question
 from scripts.database.enforcer import enforcer_check, check_duplicate_aql_identifiers
 from scripts.database.enforcer_exceptions import DuplicateAqlIdentifierError
 from scripts.email.openshiksha_users import runscript_args_workaround
@@ -124,8 +127,9 @@ def get_question_container_data_for_cabinet(question_container_data):
     }
 
 
-def get_question_subpart_data_for_cabinet(question_subpart_data):
-    return question_subpart_data
+def get_question_subparts_data_for_cabinet(question_subparts_data):
+    # validated and written along with the artifacts compiled from them (raises SubpartIngestError)
+    return ingest_question(question_subparts_data)
 
 
 def run(*args):
@@ -231,6 +235,7 @@ def setup_assignment(vault_content_path, output_cabinet_path, board_id, school_i
     # now lets grab the question data too
 
     questions = aql_data['questions']
+    bundle_questions_data = []  # collects the cabinet data of every question in the aql for the aql bundle
     question_data_file_path_stub = os.path.join(
         vault_content_path,
         common_path
@@ -303,11 +308,13 @@ def setup_assignment(vault_content_path, output_cabinet_path, board_id, school_i
                 print "Adding newly created question to new AQL's question list"
                 new_aql.questions.add(new_question)
 
+            question_container_data_for_cabinet = get_question_container_data_for_cabinet(question_container_data)
             with open(os.path.join(question_container_output_dir, str(new_question.pk) + DATA_FILE_EXT), 'w') as f:
-                f.write(dump_json_string(get_question_container_data_for_cabinet(question_container_data)))
+                f.write(dump_json_string(question_container_data_for_cabinet))
 
             # now lets handle the subparts for this question
             subparts = question_container_data['subparts']
+            question_subparts_data = []
             for subpart in subparts:
                 print 'Processing data for subpart:', subpart
                 question_subpart_data_file_path = os.path.join(question_subpart_data_file_path_stub,
@@ -318,10 +325,18 @@ def setup_assignment(vault_content_path, output_cabinet_path, board_id, school_i
 
                 question_subpart_data_raw = question_subpart_data_raw_process(question_subpart_data_raw)
                 question_subpart_data = json.loads(question_subpart_data_raw)
-                question_subpart_data = question_subpart_data_process(question_subpart_data)
+                question_subparts_data.append(question_subpart_data_process(question_subpart_data))
 
+            # the subparts of a question are ingested together, as they share their variables when dealt
+            question_subparts_data_for_cabinet = get_question_subparts_data_for_cabinet(question_subparts_data)
+            for subpart, question_subpart_data_for_cabinet in zip(subparts, question_subparts_data_for_cabinet):
                 with open(os.path.join(question_subpart_output_dir, str(subpart) + DATA_FILE_EXT), 'w') as f:
-                    f.write(dump_json_string(get_question_subpart_data_for_cabinet(question_subpart_data)))
+                    f.write(dump_json_string(question_subpart_data_for_cabinet))
+
+            if not is_removed:
+                bundle_questions_data.append(build_aql_bundle_question_data(new_question.pk,
+                                                                            question_container_data_for_cabinet,
+                                                                            question_subparts_data_for_cabinet))
 
         # finally, copy over the img folder too - and apply watermarks - do this at chapter level only to avoid repetition
         print 'Copying container images'
@@ -329,6 +344,24 @@ def setup_assignment(vault_content_path, output_cabinet_path, board_id, school_i
         print 'Copying subpart images'
         copy_img_folder(question_subpart_data_file_path_stub, question_subpart_output_dir)
 
+    print 'Putting AQL bundle into cabinet'
+    aql_bundle_output_dir = os.path.join(
+        output_cabinet_path,
+        'aql_bundle',
+        common_path,
+        str(new_aql.pk)
+    )
+
+    try:
+        os.makedirs(aql_bundle_output_dir)
+    except OSError:
+        # the output dir already exists, no need to do anything
+        pass
+    aql_bundle_raw, new_aql.bundle_hash = build_aql_bundle_content(bundle_questions_data)
+    with open(os.path.join(aql_bundle_output_dir, new_aql.bundle_hash + DATA_FILE_EXT), 'w') as f:
+        f.write(aql_bundle_raw)
+    new_aql.save()
+
     # now validate the number of the aql we just created in the db
     while True:
         try:
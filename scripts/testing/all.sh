@@ -4,4 +4,7 @@
 
 set -e
 
+# read the cabinet directly from ~/openshiksha-cabinet so that the tests do not need the cabinet nginx server
+export OPENSHIKSHA_CABINET_BACKEND=${OPENSHIKSHA_CABINET_BACKEND:-filesystem}
+
 python -Wall manage.py test --noinput
@@ -2,19 +2,27 @@ import os
 import json
 import base64
 import re
+import time
+from collections import Counter
 
+from django.db import transaction
 from django.shortcuts import render
 from django.utils.safestring import mark_safe
 from django.contrib.auth.decorators import login_required
 
 from cabinet import cabinet_api
+from cabinet.exceptions import CabinetError
 from core.models import Board, School, Standard, Subject, Question, Chapter, QuestionTag, \
     QuestionSubpart
 from core.data_models.question import build_question_subpart_from_data
 from core.utils.references import EdgeSpecialTags
-from core.utils.json import OpenShikshaJsonResponse
+from core.utils.json import OpenShikshaJsonResponse, dump_json_string_canonical
+from core.utils.regex import format_value_for_sub
 from croupier.constraints import SubpartVariableConstraints
-from croupier.croupier_api import deal_subpart
+from croupier.croupier_api import deal_subpart, build_rng, iter_deal_subpart_batch
+from croupier.exceptions import SubpartIngestError
+from croupier.ingest import ingest_question
+from openshiksha import settings
 from sphinx.urlnames import SphinxUrlNames
 
 BASE_FILENAME_NUMBER = 1000000
@@ -64,6 +72,9 @@ def deal_post(request):
     except Exception, e:
         return sphinx_failure_response('Malformed variable constraints data: %s' % e)
 
+    if 'deals' in request_data:
+        return deal_batch_response(subpart, variable_constraints, request_data)
+
     try:
         dealt_subpart = deal_subpart(subpart, variable_constraints)
     except Exception, e:
@@ -75,6 +86,53 @@ def deal_post(request):
 
     return sphinx_success_response(dealt_subpart)
 
+
+def deal_batch_response(subpart, variable_constraints, request_data):
+    """
+    Deals the subpart the requested number of times (with the requested seed, if any, so that a batch can be dealt
+    again) and returns how the values of each variable were spread, the distinct dealt subparts (most frequent first)
+    and the errors of the dealings that failed
+    """
+    num_deals = request_data['deals']
+    if (not isinstance(num_deals, (int, long))) or (num_deals < 1) or (num_deals > settings.SPHINX_MAX_BATCH_DEALS):
+        return sphinx_failure_response('Number of deals must be between 1 and %s' % settings.SPHINX_MAX_BATCH_DEALS)
+
+    seed = request_data.get('seed')
+    if seed is None:
+        seed = time.time()
+    elif not isinstance(seed, (int, long, basestring)):
+        return sphinx_failure_response('Seed must be a number or a string')
+
+    histograms = {}  # variable -> Counter of the values dealt (as substituted)
+    outputs = {}  # canonical json of a dealt subpart -> [dealt subpart, count]
+    failures = Counter()  # error message -> count
+    for values, dealt_subpart, error in iter_deal_subpart_batch(subpart, variable_constraints, num_deals,
+                                                                build_rng(seed)):
+        for variable, value in values.iteritems():
+            histograms.setdefault(variable, Counter())[format_value_for_sub(value)] += 1
+
+        if error is not None:
+            failures['%s: %s' % (type(error).__name__, error)] += 1
+            continue
+
+        output_key = dump_json_string_canonical(dealt_subpart)
+        if output_key in outputs:
+            outputs[output_key][1] += 1
+        else:
+            outputs[output_key] = [dealt_subpart, 1]
+
+    sorted_outputs = sorted(outputs.itervalues(), key=lambda output: output[1], reverse=True)
+    return sphinx_success_response({
+        'seed': seed,
+        'deals': num_deals,
+        'histograms': dict((variable, sorted(histogram.iteritems())) for variable, histogram in
+                           histograms.iteritems()),
+        'distinct_outputs': len(outputs),
+        'outputs': [{'subpart': dealt_subpart, 'count': count} for dealt_subpart, count in
+                    sorted_outputs[:settings.SPHINX_MAX_BATCH_DEAL_OUTPUTS]],
+        'failures': [{'error': message, 'count': count} for message, count in failures.most_common()]
+    })
+
 @login_required
 def sphinx_submit_question_post(request):
     request_data = json.loads(request.body)  # ajax post data has to be accessed here instead of request.POST
@@ -116,72 +174,67 @@ def sphinx_submit_question_post(request):
     )
 
 
-    subparts = question_data['subparts']
-    for subpart_data in subparts:
-        try:
-            subpart = build_question_subpart_from_data(subpart_data)
-        except Exception, e:
-            return sphinx_failure_response('Malformed subpart data: %s' % e)
-
-        variable_constraints_data = subpart_data.get('variable_constraints')
-
-        try:
-            variable_constraints = SubpartVariableConstraints(variable_constraints_data)
-        except Exception, e:
-            return sphinx_failure_response('Malformed variable constraints data: %s' % e)
-
-        try:
-            dealt_subpart = deal_subpart(subpart, variable_constraints)
-        except Exception, e:
-            return sphinx_failure_response('Dealing error: %s' % e)
-
-        # return in form useful for sphinx users
-        if variable_constraints_data is not None:
-            setattr(dealt_subpart, 'variable_constraints', variable_constraints_data)\
-
-    
-    created_question = Question.objects.create(school=school, standard=standard, subject=subject, chapter=chapter)
-    for tag in question_data['tags']:
-        tag_object = QuestionTag.objects.get(name=tag)
-        created_question.tags.add(tag_object.pk)
-    subparts_numbering = []
-    # this is being done to create a unique filename to save the subpart JSON
-    for subpart_data in subparts:        
-        subpart_index = int(subpart_data['subpart_index'])
-        subpart_object = QuestionSubpart.objects.create(question=created_question, index=subpart_index)
-        subpart_unique_name = str(subpart_object.pk)
-        subpart_json_name = subpart_unique_name + '.json'
-        for tag in subpart_data['tags']:
-            tag_object = QuestionTag.objects.get(name=tag)
-            subpart_object.tags.add(tag_object.pk)
-        cabinet_api.build_subpart_or_container(os.path.join(
-            question_subpart_path, subpart_json_name), subpart_data)
-        subparts_numbering.append(subpart_unique_name)
-
-    question_dump = {
-        'content': question_data['content'],
-        'hint': question_data['hint'],
-        'subparts': subparts_numbering,
-    }
-    # Save question JSON
-
-    container_unique_name = str(
-        created_question.pk) + '.json'
-    cabinet_api.build_subpart_or_container(os.path.join(
-        question_container_path, container_unique_name), question_dump)
-    
-
+    # the question is validated (and dealt a few times) before anything is written, and every subpart is written along
+    # with the artifact compiled from it
+    try:
+        subparts = ingest_question(question_data['subparts'])
+    except SubpartIngestError, e:
+        return sphinx_failure_response(unicode(e))
 
-    # Save images correctly
+    # the images are decoded up front, so that malformed image data fails before anything is written
     images_to_save = question_data['all_images']
-    for image_name, image_string in images_to_save.iteritems():
-        image_path = os.path.join(
-            question_subpart_path,
-            'img',
-        )
-        image_data = decode_base64(image_string.split(',')[1])
-        cabinet_api.build_image(os.path.join(
-            image_path, image_name), image_data, image_name)
+    image_path = os.path.join(
+        question_subpart_path,
+        'img',
+    )
+    cabinet_files = []
+    try:
+        for image_name, image_string in images_to_save.iteritems():
+            image_data = decode_base64(image_string.split(',')[1])
+            cabinet_files.extend(cabinet_api.build_image_files(os.path.join(
+                image_path, image_name), image_data, image_name))
+    except (IndexError, TypeError), e:
+        return sphinx_failure_response('Malformed image data: %s' % e)
+
+    # the rows are only committed once all the files are in the cabinet, and the files are rolled back by the cabinet
+    # api if any of them fails - so the db and the cabinet never disagree about the question
+    try:
+        with transaction.atomic():
+            created_question = Question.objects.create(school=school, standard=standard, subject=subject,
+                                                       chapter=chapter)
+            for tag in question_data['tags']:
+                tag_object = QuestionTag.objects.get(name=tag)
+                created_question.tags.add(tag_object.pk)
+            subparts_numbering = []
+            # this is being done to create a unique filename to save the subpart JSON
+            for subpart_data in subparts:
+                subpart_index = int(subpart_data['subpart_index'])
+                subpart_object = QuestionSubpart.objects.create(question=created_question, index=subpart_index)
+                subpart_unique_name = str(subpart_object.pk)
+                subpart_json_name = subpart_unique_name + '.json'
+                for tag in subpart_data['tags']:
+                    tag_object = QuestionTag.objects.get(name=tag)
+                    subpart_object.tags.add(tag_object.pk)
+                cabinet_files.append(cabinet_api.build_subpart_or_container_file(os.path.join(
+                    question_subpart_path, subpart_json_name), subpart_data))
+                subparts_numbering.append(subpart_unique_name)
+
+            question_dump = {
+                'content': question_data['content'],
+                'hint': question_data['hint'],
+                'subparts': subparts_numbering,
+            }
+            # Save question JSON
+
+            container_unique_name = str(
+                created_question.pk) + '.json'
+            cabinet_files.append(cabinet_api.build_subpart_or_container_file(os.path.join(
+                question_container_path, container_unique_name), question_dump))
+
+            # Save the subparts, the container and the images all at once
+            cabinet_api.build_files(cabinet_files)
+    except CabinetError, e:
+        return sphinx_failure_response('Cabinet error: %s' % e)
 
     question_response = {
         'response': 'successfully submitted question'